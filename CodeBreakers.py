@@ -1,11 +1,21 @@
 import math
+import random
+import time
+from functools import lru_cache
 from RSA import *
+import RSA_block
+import instrumentation
+from instrumentation import FACTOR_CANDIDATES, stage
+from prime_table import load_prime_table
+from primes import is_probable_prime
 
 
 def factor(n):
     for integer in range(2, n - 1):  # search all numbers from 2 to n-1
         if n % integer == 0:  # if the number evenly divides n, it's a factor
+            instrumentation.count(FACTOR_CANDIDATES, integer - 1)
             return integer, int(n / integer)  # return the factor pair.
+    instrumentation.count(FACTOR_CANDIDATES, max(n - 3, 0))
 
 
 def break_code(n, e, c):
@@ -20,10 +30,13 @@ def factor_1(n):
     if n % 2 != 0:  # if the number is odd:
         for integer in range(3, n - 1, 2):  # just check odd numbers
             if n % integer == 0:
+                instrumentation.count(FACTOR_CANDIDATES, (integer - 1) // 2)
                 return integer, int(n / integer)
+        instrumentation.count(FACTOR_CANDIDATES, len(range(3, n - 1, 2)))
     else:
         for integer in range(2, n - 1, 2):  # if the number is even, check even numbers
             if n % integer == 0:
+                instrumentation.count(FACTOR_CANDIDATES, integer // 2)
                 return integer, int(n / integer)
 
 
@@ -31,19 +44,58 @@ def factor_1(n):
 def factor_2(n):
     for integer in range(2, math.ceil(math.sqrt(n))):  # only iterate up to the sqrt of n.
         if n % integer == 0:
+            instrumentation.count(FACTOR_CANDIDATES, integer - 1)
             return integer, int(n / integer)
+    instrumentation.count(FACTOR_CANDIDATES, len(range(2, math.ceil(math.sqrt(n)))))
 
 
 # IMPROVEMENT: RHO FACTORIZATION
-# SOURCE: POLLARD RHO.  DOESN'T ALWAYS WORK, CAN GET STUCK IN AN ENDLESS LOOP
-def rho_factorize(n):
-    x = 2
-    found = False
-    while not found:
-        y = ((x ** 2) + random.randint(1, n)) % n  # Pseudo random number generator
-        p = euclidian_algorithm(abs(y - x), n)  # based on the birthday problem
-        if (p > 1):
-            return p, int(n / p)
+# SOURCE: POLLARD RHO WITH BRENT'S CYCLE DETECTION.  INSTEAD OF ONE GCD PER STEP, |x - y| VALUES ARE MULTIPLIED
+# TOGETHER MOD N AND CHECKED WITH ONE GCD PER BATCH.  GIVES UP (RETURNS None) ONCE THE BUDGET RUNS OUT.
+# PASS rng (E.G. random.Random(seed)) TO MAKE A RUN REPEATABLE.  n BELOW 4 HAS NO NON-TRIVIAL FACTORS: None.
+def rho_factorize(n, batch=128, max_iterations=None, timeout=None, rng=random):
+    if n < 4:
+        return None
+    if n % 2 == 0:
+        return 2, n // 2
+    if is_probable_prime(n):  # rho would never stop on a prime
+        return None
+    deadline = None if timeout is None else time.monotonic() + timeout
+    iterations = 0
+    while True:  # each pass uses a new polynomial x^2 + c
+        c = rng.randrange(1, n - 1)
+        y = rng.randrange(0, n)
+        r, product, g = 1, 1, 1
+        while g == 1:
+            x = y  # remember the tortoise, then let the hare run r steps (Brent)
+            for _ in range(r):
+                y = (y * y + c) % n
+            k = 0
+            while k < r and g == 1:
+                ys = y  # batch start, needed if the product collapses to n
+                for _ in range(min(batch, r - k)):
+                    y = (y * y + c) % n
+                    product = (product * abs(x - y)) % n
+                g = euclidian_algorithm(product, n)  # one gcd for the whole batch
+                k += batch
+            iterations += 2 * r
+            r *= 2
+            if g != 1:  # a factor (or n) turned up: handle it below even if the budget is used up
+                break
+            if max_iterations is not None and iterations >= max_iterations:
+                instrumentation.count(FACTOR_CANDIDATES, iterations)
+                return None
+            if deadline is not None and time.monotonic() >= deadline:
+                instrumentation.count(FACTOR_CANDIDATES, iterations)
+                return None
+        if g == n:  # the batch product hit a multiple of n: back off and replay it one step at a time
+            g = 1
+            while g == 1:
+                ys = (ys * ys + c) % n
+                g = euclidian_algorithm(abs(x - ys), n)
+        if g != n:  # otherwise x and y met on the cycle mod n, so retry with a new constant
+            instrumentation.count(FACTOR_CANDIDATES, iterations)  # one |x - y| difference per step
+            return g, n // g
 
 
 # ONLY CHECKS PRIMES (USEFUL FOR RSA).
@@ -51,14 +103,281 @@ def rho_factorize(n):
 def factor_3(n):
     for integer in range(2, n - 1):
         if (n % (6 * integer + 1)) == 0:  # generate a prime
+            instrumentation.count(FACTOR_CANDIDATES, 2 * integer - 3)
             return (6 * integer + 1), int(n / (6 * integer + 1))  # check it
         if (n % (6 * integer - 1)) == 0:  # generate another prime
+            instrumentation.count(FACTOR_CANDIDATES, 2 * integer - 2)
             return (6 * integer - 1), int(n / (6 * integer - 1))  # check it
+    instrumentation.count(FACTOR_CANDIDATES, 2 * len(range(2, n - 1)))
 
 
 # IMPLEMENT THE CODEBREAKING FUNCTION BY USING THE BEST PERFORMING FACTOR ALGORITHM.
-def break_code_improved(n, e, c):
-    p, q = factor_3(n)  # use factor_3 method
+def break_code_improved(n, e, c, factor_function=factor_3):
+    with stage("break.factor"):
+        p, q = factor_function(n)  # use factor_3 method unless told otherwise (e.g. rho_factorize, quadratic_sieve.factor_qs)
     d = find_private_key(p, q, e)
-    plain_text = [fme(char, d, n) for char in c]
-    return d, convert_num(plain_text)
+    with stage("break.decode"):
+        plain_text = [fme(char, d, n) for char in c]
+        return d, convert_num(plain_text)
+
+
+# IMPROVEMENT: ONLY TRY REAL PRIMES UP TO SQRT(N), READ FROM A SHARED ON-DISK PRIME TABLE.
+def factor_trial(n, table=None):
+    root = math.isqrt(n)
+    if table is None:
+        table = load_prime_table(root + 1)  # built once, then mmap'ed by every later call and process
+    primes = table.primes[:table.count_below(root)]
+    for tested, p in enumerate(primes, 1):  # walk only the primes up to sqrt(n)
+        if n % p == 0:
+            instrumentation.count(FACTOR_CANDIDATES, tested)
+            return p, n // p
+    start = table.limit - table.limit % 6  # past the end of the table, fall back to 6k +- 1 candidates
+    for integer in range(start, root + 1, 6):
+        for candidate in (integer + 1, integer + 5):
+            if candidate >= table.limit and n % candidate == 0:
+                instrumentation.count(FACTOR_CANDIDATES, len(primes) + 2 * (integer - start) // 6 + 2)
+                return candidate, n // candidate
+    instrumentation.count(FACTOR_CANDIDATES, len(primes) + 2 * len(range(start, root + 1, 6)))
+
+
+# BATCH GCD (BERNSTEIN): A PRODUCT TREE OF ALL MODULI, THEN A REMAINDER TREE DOWN TO EACH MODULUS.
+# FINDS EVERY MODULUS THAT SHARES A PRIME WITH ANY OTHER ONE IN QUASI-LINEAR TIME INSTEAD OF FACTORING EACH.
+def product_tree(values):
+    tree = [list(values)]
+    while len(tree[-1]) > 1:
+        level = tree[-1]
+        tree.append([level[i] * level[i + 1] if i + 1 < len(level) else level[i] for i in range(0, len(level), 2)])
+    return tree
+
+
+def batch_gcd(moduli):
+    moduli = list(moduli)
+    if not moduli:
+        return []
+    tree = product_tree(moduli)
+    remainders = tree.pop()  # start from the product of every modulus
+    while tree:
+        level = tree.pop()  # each level is dropped once its remainders are computed
+        remainders = [remainders[i // 2] % (value * value) for i, value in enumerate(level)]
+    # remainder = (product of all moduli) mod n^2, so remainder / n is (product of the others) mod n
+    return [euclidian_algorithm(remainder // n, n) for remainder, n in zip(remainders, moduli)]
+
+
+# RUN BATCH GCD OVER (n, e) PUBLIC KEYS AND STEAL THE PRIVATE KEY OF EVERY ONE THAT SHARES A PRIME.
+def break_shared_factors(keys):
+    keys = list(keys)
+    moduli = list(dict.fromkeys(n for n, e in keys))  # duplicates share everything and would only end up as g == n
+    shared = dict(zip(moduli, batch_gcd(moduli)))
+    for n, g in shared.items():
+        if g == n:  # both primes are shared with other moduli: look for one that shares only one of them
+            shared[n] = next((h for h in (euclidian_algorithm(n, m) for m in moduli) if 1 < h < n), 1)
+    broken = []
+    for n, e in keys:  # every copy of a modulus gets its result
+        g = shared[n]
+        if 1 < g < n:
+            p, q = g, n // g
+            broken.append((n, e, p, q, find_private_key(p, q, e)))
+    return broken
+
+
+# BOUND SCHEDULE SHARED BY POLLARD P-1 AND ECM: (B1, NUMBER OF ECM CURVES) PER STAGE, SMALL BOUNDS FIRST.
+# EACH STAGE TARGETS FACTORS ABOUT 5 DIGITS LARGER THAN THE PREVIOUS ONE (15, 20, 25, 30, 35 DIGITS).
+BOUND_SCHEDULE = ((2000, 25), (11000, 90), (50000, 300), (250000, 700), (1000000, 1800))
+
+# STAGE 2 OF POLLARD P-1 SEARCHES PRIMES UP TO B2 = B1 * STAGE_2_FACTOR.
+STAGE_2_FACTOR = 50
+
+
+def prime_powers(bound, table):
+    for p in table.primes[:table.count_below(bound)]:  # (p, largest power of p <= bound) for each prime <= bound
+        power = p
+        while power * p <= bound:
+            power *= p
+        yield p, power
+
+
+# WHEN A WHOLE STAGE 1 CATCHES EVERY PRIME FACTOR OF n AT ONCE (g == n, COMMON FOR SMALL n) IT IS REPLAYED ONE PRIME
+# AT A TIME FROM ITS STARTING POINT WITH A GCD AFTER EACH STEP, SO THE FACTOR WHOSE ORDER COMPLETES FIRST IS SPLIT OFF.
+# multiply(state, p) ADVANCES THE STATE BY p AND residue(state) GIVES THE VALUE TO TAKE THE GCD OF.  RETURNS None WHEN
+# BOTH FACTORS COMPLETE ON THE SAME STEP.
+def _back_off(state, powers, n, multiply, residue):
+    for p, power in powers:
+        while power > 1:
+            state = multiply(state, p)
+            power //= p
+            g = euclidian_algorithm(residue(state), n)
+            if g == n:
+                return None
+            if g > 1:
+                return g
+    return None
+
+
+# IMPROVEMENT: FERMAT'S METHOD.  FINDS n = a^2 - b^2 = (a - b)(a + b) QUICKLY WHEN p AND q ARE CLOSE TOGETHER.
+def fermat_factor(n, max_iterations=1 << 20):
+    if n % 2 == 0:
+        return 2, n // 2
+    a = math.isqrt(n)
+    if a * a < n:
+        a += 1
+    for tested in range(1, max_iterations + 1):
+        b2 = a * a - n
+        b = math.isqrt(b2)
+        if b * b == b2:  # a^2 - n is a perfect square
+            instrumentation.count(FACTOR_CANDIDATES, tested)
+            if a - b == 1:  # only the trivial factorization 1 * n
+                return None
+            return a - b, a + b
+        a += 1
+    instrumentation.count(FACTOR_CANDIDATES, max_iterations)
+
+
+def _pm1_stage_2(a, primes, start, end, n, each=False):
+    steps = {}
+    previous = primes[start - 1] if start else 1
+    x = fme(a, previous, n)
+    product = 1
+    for q in primes[start:end]:
+        gap = q - previous
+        if gap not in steps:
+            steps[gap] = fme(a, gap, n)
+        x = (x * steps[gap]) % n  # x = a^q
+        if each:
+            g = euclidian_algorithm(x - 1, n)
+            if g != 1:
+                return g
+        else:
+            product = (product * (x - 1)) % n
+        previous = q
+    return 1 if each else euclidian_algorithm(product, n)
+
+
+# IMPROVEMENT: POLLARD P-1.  FINDS p QUICKLY WHEN p - 1 ONLY HAS SMALL PRIME FACTORS (BELOW B1, PLUS ONE UP TO B2).
+def pollard_pm1(n, schedule=BOUND_SCHEDULE):
+    if n % 2 == 0:
+        return 2, n // 2
+    largest = schedule[-1][0]
+    table = load_prime_table(largest * STAGE_2_FACTOR + 1)
+    a = 2
+    done = 1  # primes up to done are already in the exponent
+    for b1, _ in schedule:
+        powers = [(p, power) for p, power in prime_powers(b1, table) if power > done]
+        base = a
+        for _, power in powers:  # stage 1: a = 2^(every prime power up to B1)
+            a = fme(a, power, n)
+        done = b1
+        g = euclidian_algorithm(a - 1, n)
+        if g == n:  # every prime factor was caught at once: back off
+            g = _back_off(base, powers, n, lambda b, p: fme(b, p, n), lambda b: b - 1)
+            return (g, n // g) if g else None
+        if g > 1:
+            return g, n // g
+        # stage 2: look for p - 1 = (B1-smooth part) * (one prime q <= B2), stepping between primes with a^gap
+        start = table.count_below(b1)
+        end = table.count_below(min(b1 * STAGE_2_FACTOR, table.limit - 1))
+        g = _pm1_stage_2(a, table.primes, start, end, n)
+        if g == n:  # two primes q caught both factors: redo stage 2 with a gcd per prime
+            g = _pm1_stage_2(a, table.primes, start, end, n, each=True)
+        if 1 < g < n:
+            return g, n // g
+    return None
+
+
+# ELLIPTIC CURVE ARITHMETIC FOR ECM: MONTGOMERY CURVES, X-ONLY PROJECTIVE COORDINATES (NO INVERSIONS).
+def _ecm_double(x, z, a24, n):
+    t1 = (x + z) * (x + z) % n
+    t2 = (x - z) * (x - z) % n
+    t3 = t1 - t2
+    return t1 * t2 % n, t3 * (t2 + a24 * t3) % n
+
+
+def _ecm_add(xp, zp, xq, zq, xd, zd, n):
+    u = (xp - zp) * (xq + zq) % n
+    v = (xp + zp) * (xq - zq) % n
+    return zd * (u + v) * (u + v) % n, xd * (u - v) * (u - v) % n
+
+
+def _ecm_multiply(k, x, z, a24, n):
+    x0, z0 = x, z  # Montgomery ladder: keeps R1 - R0 = P
+    x1, z1 = _ecm_double(x, z, a24, n)
+    for bit in bin(k)[3:]:
+        if bit == "1":
+            x0, z0 = _ecm_add(x1, z1, x0, z0, x, z, n)
+            x1, z1 = _ecm_double(x1, z1, a24, n)
+        else:
+            x1, z1 = _ecm_add(x0, z0, x1, z1, x, z, n)
+            x0, z0 = _ecm_double(x0, z0, a24, n)
+    return x0, z0
+
+
+# IMPROVEMENT: LENSTRA ELLIPTIC CURVE METHOD (STAGE 1).  LIKE P-1, BUT EVERY RANDOM CURVE GIVES A NEW GROUP ORDER
+# TO TRY, SO IT KEEPS WORKING WHEN p - 1 IS NOT SMOOTH.  CURVES COME FROM SUYAMA'S PARAMETRIZATION.
+def ecm_factor(n, schedule=BOUND_SCHEDULE):
+    if n % 2 == 0:
+        return 2, n // 2
+    table = load_prime_table(schedule[-1][0] + 1)
+    for b1, curves in schedule:
+        powers = list(prime_powers(b1, table))
+        for _ in range(curves):
+            sigma = random.randrange(6, n - 1)
+            u = (sigma * sigma - 5) % n
+            v = 4 * sigma % n
+            x, z = fme(u, 3, n), fme(v, 3, n)
+            denominator = 16 * fme(u, 3, n) * v % n
+            g = euclidian_algorithm(denominator, n)
+            if 1 < g < n:  # lucky: the curve setup already hit a factor
+                return g, n // g
+            if g == n:
+                continue
+            a24 = fme(v - u, 3, n) * (3 * u + v) * extended_euclid(denominator, n) % n  # (A + 2) / 4
+            start = x, z
+            for _, power in powers:
+                x, z = _ecm_multiply(power, x, z, a24, n)
+            g = euclidian_algorithm(z, n)
+            if g == n:  # the point has order 1 mod every factor: back off on this curve instead of drawing another
+                g = _back_off(start, powers, n, lambda point, p: _ecm_multiply(p, *point, a24, n),
+                              lambda point: point[1])
+            if g and 1 < g < n:
+                return g, n // g
+    return None
+
+
+# CODEBOOK ATTACK: RSA.encode IS DETERMINISTIC PER CHARACTER, SO ENCRYPTING ALL 256 BYTE VALUES UNDER THE PUBLIC KEY
+# GIVES A COMPLETE REVERSE LOOKUP TABLE.  NO FACTORING NEEDED.  TABLES ARE CACHED PER PUBLIC KEY.  WHEN n < 256 THE
+# CODES AT OR ABOVE n ENCRYPT LIKE THEIR REMAINDER MOD n, SO ONLY range(n) GOES IN THE TABLE (AS decode DOES).
+@lru_cache(maxsize=CODEBOOK_MAX_KEYS)
+def reverse_codebook(n, e):
+    ordinals = list(range(min(n, 256)))
+    return dict(zip(codebook_lookup(n, e, ordinals), ordinals))  # cipher text -> character code
+
+
+@lru_cache(maxsize=CODEBOOK_MAX_KEYS)
+def _fallback_key(n, e, factor_function):
+    p, q = factor_function(n)
+    return find_crt_private_key(p, q, e)
+
+
+# A BLOCK OUTSIDE THE TABLE (A CODE POINT ABOVE 255) FALLS BACK TO FACTORING (ONCE PER KEY) AND DECRYPTING THE BLOCKS.
+def codebook_blocks(n, e, blocks, factor_function=factor_3):
+    table = reverse_codebook(n, e)
+    try:
+        return [table[block] for block in blocks]
+    except KeyError:
+        return decrypt_blocks(n, _fallback_key(n, e, factor_function), blocks)
+
+
+# BLOCK-MODE CIPHER TEXT HAS NO PER-CHARACTER TABLE: PASS scheme="block" TO FACTOR AND USE RSA_block.decode.
+def codebook_break(n, e, c, factor_function=factor_3, scheme="ascii"):
+    if scheme not in ("ascii", "block"):
+        raise ValueError(f"Unknown scheme: {scheme}")
+    c = list(c)
+    if scheme == "ascii":
+        return "".join([chr(code) for code in codebook_blocks(n, e, c, factor_function)])
+    p, q = factor_function(n)
+    d = find_private_key(p, q, e)
+    return RSA_block.decode(n, d, c)
+
+
+def codebook_break_stream(n, e, c, chunk_size=STREAM_CHUNK_SIZE, factor_function=factor_3):
+    for batch in batched(read_blocks(c), chunk_size):  # works on lists, files of blocks or any iterable
+        yield "".join([chr(code) for code in codebook_blocks(n, e, batch, factor_function)])
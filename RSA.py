@@ -2,6 +2,27 @@
 
 
 import random
+from collections import OrderedDict, namedtuple
+
+import instrumentation
+from instrumentation import stage
+from modexp import modexp, power_all, use_vector
+from stream_io import STREAM_CHUNK_SIZE, batched, read_blocks, read_text, write_blocks, write_text
+
+
+CRTPrivateKey = namedtuple("CRTPrivateKey", ["n", "d", "p", "q", "dp", "dq", "q_inv"])
+CRTPrivateKey.__doc__ = """
+Private key that keeps the factors of n for Chinese Remainder Theorem decryption.
+
+Attributes:
+    n (int): Public key token n.
+    d (int): Private key token d.
+    p (int): First prime factor of n.
+    q (int): Second prime factor of n.
+    dp (int): d mod (p - 1).
+    dq (int): d mod (q - 1).
+    q_inv (int): Inverse of q mod p.
+"""
 
 
 # =====================================================================================================================|
@@ -65,14 +86,14 @@ def convert_binary_string(_int):
     bits = []
     while _int > 0:
         _int, r = divmod(_int, 2)  # retrieve quotient and modulus
-        bits.insert(0, str(r))  # push modulus to accumulator
-    return "".join(bits)
+        bits.append("1" if r else "0")  # push modulus to accumulator
+    return "".join(reversed(bits))  # bits were collected least significant first
 
 
 def fme(b, n, m):
     """
     Finds the modulus of a large number using fast modular exponentiation.
-    Source: Pseudocode from Discrete Mathematics and Its Applications, Rosen.
+    The work is done by the modexp engine, which picks a backend by operand size.
     Args:
          b (int): Base 10 integer.
          n (int): Power to raise b to.
@@ -82,14 +103,48 @@ def fme(b, n, m):
         int: resulting modulus from b^n mod m.
 
     """
-    n = convert_binary_string(n)  # convert n to binary
-    x = 1
-    power = b % m  # initial power
-    for i in range(len(n)):  # iterate over the range of the number of binary digits
-        if int(n[-(i + 1)]) == 1:  # want to go in reverse order and convert elements to int
-            x = (x * power) % m  # if the digit is 1, increment x
-        power = (power * power) % m  # adjust to next power
-    return x
+    return modexp(b, n, m)
+
+
+def crt_fme(c, key):
+    """
+    Raises c to the private exponent using the Chinese Remainder Theorem.
+    Two half-size exponentiations mod p and mod q replace one full-size exponentiation mod n.
+
+    Args:
+         c (int): Cipher text block.
+         key (CRTPrivateKey): Private key holding p, q, dp, dq and q_inv.
+
+    Returns:
+        int: resulting modulus from c^d mod n.
+
+    """
+    m1 = fme(c, key.dp, key.p)  # c^d mod p
+    m2 = fme(c, key.dq, key.q)  # c^d mod q
+    h = (key.q_inv * (m1 - m2)) % key.p  # Garner's recombination
+    return m2 + h * key.q
+
+
+def decrypt_blocks(n, d, cipher_text):
+    """
+    Raises every cipher text block to the private exponent.  Under a small modulus the whole list goes
+    through one vectorized pass (see modexp.power_all), which beats the CRT split per block.
+
+    Args:
+         n (int): Public key token n.
+         d (int or CRTPrivateKey): Private key token d.
+         cipher_text (iterable): Cipher text blocks (ints).
+
+    Returns:
+        list: Decrypted blocks.
+
+    """
+    if isinstance(d, int):
+        return power_all(cipher_text, d, n)
+    cipher_text = list(cipher_text)
+    if use_vector(d.d, n, len(cipher_text)):
+        return power_all(cipher_text, d.d, n)
+    return [crt_fme(char, d) for char in cipher_text]  # Use the CRT split when p & q are known
 
 
 def euclidian_algorithm(a, b):
@@ -104,6 +159,8 @@ def euclidian_algorithm(a, b):
         int: Greatest common divisor of a and b.
 
     """
+    if instrumentation.enabled:
+        return _counted_gcd(a, b)
     while b != 0:
         r = a % b  # take modulus of a and b
         a = b  # set a to old quotient
@@ -111,6 +168,18 @@ def euclidian_algorithm(a, b):
     return a
 
 
+def _counted_gcd(a, b):
+    """
+    euclidian_algorithm with its iterations recorded, used while instrumentation is on.
+    """
+    steps = 0
+    while b != 0:
+        a, b = b, a % b
+        steps += 1
+    instrumentation.count(instrumentation.GCD_ITERATIONS, steps)
+    return a
+
+
 def extended_euclid(b, m):
     """
     Algorithm for finding inverse of b mod m.
@@ -126,6 +195,8 @@ def extended_euclid(b, m):
     original_m = m
     s1, t1 = (1, 0)  # initialize s1, t1, s2, t2, part of loop invariant
     s2, t2 = (0, 1)
+    if instrumentation.enabled and m > 0:
+        _counted_gcd(b, m)  # the same iterations as the loop below
     while m > 0:
         # perform an iteration of euclid's algorithm:
         k = b % m
@@ -143,19 +214,41 @@ def extended_euclid(b, m):
     return s1
 
 
-def find_public_key(p, q):
+# Policies accepted by find_public_key for choosing e.
+EXPONENT_POLICIES = ("random", "65537", "fermat")
+
+# Fermat primes 2^(2^i) + 1: small, low-weight exponents that are cheap to encrypt with.
+FERMAT_PRIMES = (3, 5, 17, 257, 65537)
+
+
+def find_public_key(p, q, exponent="random"):
     """
     Generates a public key pair for RSA encryption.
 
     Arguments:
         p (int): A prime number.
         q (int): A different prime number.
+        exponent (string): Policy for choosing e, one of EXPONENT_POLICIES:
+            "random" draws e at random (slow, unpredictable encryption cost),
+            "65537" always uses e = 65537,
+            "fermat" uses the smallest Fermat prime (3, 5, 17, 257, 65537) that is coprime to phi.
 
     Returns:
         (int, int): Public key token n, public key token e.
+
+    Raises:
+        ValueError: if the policy is unknown or no exponent allowed by it is coprime to phi.
     """
     n = p * q  # calculate n
     pq_less = (p - 1) * (q - 1)  # calculate phi
+    if exponent != "random":
+        if exponent not in EXPONENT_POLICIES:
+            raise ValueError(f"Unknown exponent policy: {exponent}")
+        candidates = (65537,) if exponent == "65537" else FERMAT_PRIMES
+        for e in candidates:
+            if euclidian_algorithm(e, pq_less) == 1:  # gcd(e, phi) == 1
+                return n, e
+        raise ValueError(f"No exponent allowed by the {exponent} policy is coprime to phi={pq_less}")
     e_found = False  # loop conditional
     while not e_found:
         e = random.randrange(2, p - 1)  # generate a random e
@@ -184,23 +277,107 @@ def find_private_key(p, q, e):
     return d  # return inverse
 
 
-def find_key_pair(p, q):
+def find_crt_private_key(p, q, e):
+    """
+    Generates a Private Key that supports Chinese Remainder Theorem decryption.
+
+    Arguments:
+        p (int): A prime number.
+        q (int): A different prime number.
+        e (int): A public token e associated with p & q.
+
+    Returns:
+        CRTPrivateKey: Private key holding d along with the precomputed CRT values.
+    """
+    d = find_private_key(p, q, e)  # the usual private token
+    dp = d % (p - 1)  # reduced exponent for the p half
+    dq = d % (q - 1)  # reduced exponent for the q half
+    q_inv = extended_euclid(q, p)  # used to recombine the two halves
+    return CRTPrivateKey(p * q, d, p, q, dp, dq, q_inv)
+
+
+def find_key_pair(p, q, crt=False, exponent="random"):
     """
     Generates a Private/Public Key Pair for RSA encryption.
 
     Arguments:
         p (int): A prime number.
         q (int): A different prime number.
+        crt (bool): Return a CRTPrivateKey instead of a plain integer d.
+        exponent (string): Policy for choosing e, see find_public_key.
 
     Returns:
         (int, int, int): Public key token n, public key token e, private key token d.
+        When crt is True, d is a CRTPrivateKey.
 """
-    n, e = find_public_key(p, q)  # generate a public key
+    n, e = find_public_key(p, q, exponent)  # generate a public key
+    if crt:
+        return n, e, find_crt_private_key(p, q, e)  # keep p & q around for faster decryption
     d = find_private_key(p, q, e)  # generate a private key
     return n, e, d  # return the key pair
 
 
-def encode(n, e, message):
+# =====================================================================================================================|
+# ===============================================CODEBOOK FUNCTIONS====================================================|
+# =====================================================================================================================|
+
+# Maximum number of keys whose codebooks are kept in memory.
+CODEBOOK_MAX_KEYS = 16
+
+_codebooks = OrderedDict()  # (n, exponent) -> {value: value^exponent mod n}, least recently used first
+
+
+def get_codebook(n, exponent):
+    """
+    Returns the codebook for a key, creating an empty one on first use.
+    A codebook maps ordinals to cipher text under (n, e), or cipher text to ordinals under (n, d).
+    Once more than CODEBOOK_MAX_KEYS keys have codebooks, the least recently used one is dropped.
+
+    Arguments:
+        n (int): Public key token n.
+        exponent (int or CRTPrivateKey): Public key token e or private key token d.
+
+    Returns:
+        dict: Cached results of the key's exponentiation, filled in as values are seen.
+    """
+    key = (n, exponent)
+    book = _codebooks.get(key)
+    if book is None:
+        book = _codebooks[key] = {}
+        if len(_codebooks) > CODEBOOK_MAX_KEYS:
+            _codebooks.popitem(last=False)  # evict the least recently used key
+    else:
+        _codebooks.move_to_end(key)  # mark the key as recently used
+    return book
+
+
+def clear_codebooks():
+    """
+    Drops every cached codebook.
+    """
+    _codebooks.clear()
+
+
+def codebook_lookup(n, exponent, values):
+    """
+    Raises every value to the key's exponent through the key's codebook.
+    Only values that are not in the codebook yet cost an exponentiation.
+
+    Arguments:
+        n (int): Public key token n.
+        exponent (int or CRTPrivateKey): Public key token e or private key token d.
+        values (list): Ordinals to encrypt or cipher text to decrypt.
+
+    Returns:
+        list: The value of each element raised to the exponent mod n.
+    """
+    book = get_codebook(n, exponent)
+    for value in set(values).difference(book):  # warm the codebook with unseen values
+        book[value] = fme(value, exponent, n) if isinstance(exponent, int) else crt_fme(value, exponent)
+    return list(map(book.__getitem__, values))
+
+
+def encode(n, e, message, codebook=False):
     """
     Encrypts a message using a public key.
 
@@ -208,23 +385,106 @@ def encode(n, e, message):
         n (int): Public key token n.
         e (int): Public key token e.
         message (string): Plain-text message for encryption.
+        codebook (bool): Look characters up in the key's cached codebook instead of running fme on each one.
 
     Returns:
         list: Encrypted message.
     """
+    if codebook:
+        return codebook_lookup(n, e, convert_text(message))
+    with stage("ascii.encode.convert_text"):
+        chars = convert_text(message)
+    with stage("ascii.encode.fme"):
+        return power_all(chars, e, n)  # one engine choice per message, vectorized for small n
 
-    return [fme(char, e, n) for char in convert_text(message)]  # Use fme and convert_text to encode
 
-
-def decode(n, d, cipher_text):
+def decode(n, d, cipher_text, codebook=False):
     """
     Decrypts a message using a private key.
 
     Arguments:
         n (int): Public key token n.
-        d (int): Private key token d.
+        d (int or CRTPrivateKey): Private key token d.
+        codebook (bool): Look blocks up in the key's cached codebook instead of running fme on each one.
 
     Returns:
         string: Decrypted message.
     """
-    return convert_num([fme(char, d, n) for char in cipher_text])  # Use fme and convert_num to decode
+    if codebook:
+        return convert_num(codebook_lookup(n, d, list(cipher_text)))
+    with stage("ascii.decode.fme"):
+        plain_text = decrypt_blocks(n, d, cipher_text)  # Use fme (or the CRT split) and convert_num to decode
+    with stage("ascii.decode.convert_num"):
+        return convert_num(plain_text)
+
+
+
+# =====================================================================================================================|
+# ===============================================STREAMING FUNCTIONS===================================================|
+# =====================================================================================================================|
+
+def encode_stream(n, e, source, chunk_size=STREAM_CHUNK_SIZE, codebook=False):
+    """
+    Encrypts a file-like object chunk by chunk, so memory use does not grow with the input.
+    Binary input is read byte by byte (each byte is one character).
+
+    Arguments:
+        n (int): Public key token n.
+        e (int): Public key token e.
+        source (file): Binary or text file-like object holding the plain-text message.
+        chunk_size (int): Number of characters encrypted per step.
+        codebook (bool): Use the key's cached codebook, see encode.
+
+    Yields:
+        int: The next encrypted character.
+    """
+    for chunk in read_text(source, chunk_size):
+        yield from encode(n, e, chunk, codebook)
+
+
+def decode_stream(n, d, cipher_text, chunk_size=STREAM_CHUNK_SIZE, codebook=False):
+    """
+    Decrypts a stream of cipher text chunk by chunk.
+
+    Arguments:
+        n (int): Public key token n.
+        d (int or CRTPrivateKey): Private key token d.
+        cipher_text (iterable): Cipher text blocks, or a file written by encode_file (one block per line).
+        chunk_size (int): Number of blocks decrypted per step.
+        codebook (bool): Use the key's cached codebook, see decode.
+
+    Yields:
+        string: The next chunk of the decrypted message.
+    """
+    for batch in batched(read_blocks(cipher_text), chunk_size):
+        yield decode(n, d, batch, codebook)
+
+
+def encode_file(n, e, source, sink, chunk_size=STREAM_CHUNK_SIZE, codebook=False):
+    """
+    Encrypts source into sink, writing one cipher text block per line.
+
+    Arguments:
+        n (int): Public key token n.
+        e (int): Public key token e.
+        source (file): Binary or text file-like object holding the plain-text message.
+        sink (file): Binary or text file-like object receiving the cipher text.
+        chunk_size (int): Number of characters encrypted per step.
+        codebook (bool): Use the key's cached codebook, see encode.
+    """
+    write_blocks(encode_stream(n, e, source, chunk_size, codebook), sink)
+
+
+def decode_file(n, d, source, sink, chunk_size=STREAM_CHUNK_SIZE, codebook=False):
+    """
+    Decrypts a file written by encode_file into sink.
+
+    Arguments:
+        n (int): Public key token n.
+        d (int or CRTPrivateKey): Private key token d.
+        source (file): Binary or text file-like object holding one cipher text block per line.
+        sink (file): Binary or text file-like object receiving the decrypted message.
+        chunk_size (int): Number of blocks decrypted per step.
+        codebook (bool): Use the key's cached codebook, see decode.
+    """
+    write_text(decode_stream(n, d, source, chunk_size, codebook), sink)
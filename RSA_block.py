@@ -6,11 +6,21 @@
 
 import random
 
+import instrumentation
+from instrumentation import stage
+from modexp import modexp, power_all
+from stream_io import STREAM_CHUNK_SIZE, batched, read_blocks, read_text, write_blocks, write_text
+from RSA import decrypt_blocks, find_crt_private_key
+
 
 # =====================================================================================================================|
 # ===============================================PREP THE MESSAGE FUNCTIONS============================================|
 # =====================================================================================================================|
 
+ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+DIGIT_TABLE = {char: f"{idx:02d}" for idx, char in enumerate(ALPHABET)}  # "A" -> "00", ..., "Z" -> "25"
+
+
 def block_convert_text(_string):
     """
     Converts a string of letters to a numerical format.  Groups letters
@@ -102,18 +112,11 @@ def prep_message(_string, n):
 
     """
     _string = _string.upper()
-    alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
-    conversion_table = {char: str(idx) for idx, char in enumerate(alphabet)}
-    for char in conversion_table:
-        if len(conversion_table[char]) < 2:
-            conversion_table[char] = "0" + conversion_table[char]
-    encoded_message = ""
-    for char in _string:
-        encoded_message = encoded_message + conversion_table[char]
+    encoded_message = "".join([DIGIT_TABLE[char] for char in _string])  # join once instead of concatenating
     block_size = find_block_size(n)
     message = separate_string_to_blocks(encoded_message, block_size)
-    while len(message[-1]) < len(message[-2]):
-        message[-1] = message[-1] + "00"
+    if message and len(message[-1]) < block_size:
+        message[-1] = message[-1].ljust(block_size, "0")  # pad the last block with "00"s
     return message
 
 
@@ -144,14 +147,14 @@ def convert_binary_string(_int):
     bits = []
     while _int > 0:
         _int, r = divmod(_int, 2)  # retrieve quotient and modulus
-        bits.insert(0, str(r))  # push modulus to accumulator
-    return "".join(bits)
+        bits.append("1" if r else "0")  # push modulus to accumulator
+    return "".join(reversed(bits))  # bits were collected least significant first
 
 
 def fme(b, n, m):
     """
     Finds the modulus of a large number using fast modular exponentiation.
-    Source: Pseudocode from Discrete Mathematics and Its Applications, Rosen.
+    The work is done by the modexp engine, which picks a backend by operand size.
     Args:
          b (int): Base 10 integer.
          n (int): Power to raise b to.
@@ -161,14 +164,7 @@ def fme(b, n, m):
         int: resulting modulus from b^n mod m.
 
     """
-    n = convert_binary_string(n)  # convert n to binary
-    x = 1
-    power = b % m  # initial power
-    for i in range(len(n)):  # iterate over the range of the number of binary digits
-        if int(n[-(i + 1)]) == 1:  # want to go in reverse order and convert elements to int
-            x = (x * power) % m  # if the digit is 1, increment x
-        power = (power * power) % m  # adjust to next power
-    return x
+    return modexp(b, n, m)
 
 
 def euclidian_algorithm(a, b):
@@ -183,6 +179,8 @@ def euclidian_algorithm(a, b):
         int: Greatest common divisor of a and b.
 
     """
+    if instrumentation.enabled:
+        return _counted_gcd(a, b)
     while b != 0:
         r = a % b  # take modulus of a and b
         a = b  # set a to old quotient
@@ -190,6 +188,18 @@ def euclidian_algorithm(a, b):
     return a
 
 
+def _counted_gcd(a, b):
+    """
+    euclidian_algorithm with its iterations recorded, used while instrumentation is on.
+    """
+    steps = 0
+    while b != 0:
+        a, b = b, a % b
+        steps += 1
+    instrumentation.count(instrumentation.GCD_ITERATIONS, steps)
+    return a
+
+
 def extended_euclid(b, m):
     """
     Algorithm for finding inverse of b mod m.
@@ -205,6 +215,8 @@ def extended_euclid(b, m):
     original_m = m
     s1, t1 = (1, 0)  # initialize s1, t1, s2, t2, part of loop invariant
     s2, t2 = (0, 1)
+    if instrumentation.enabled and m > 0:
+        _counted_gcd(b, m)  # the same iterations as the loop below
     while m > 0:
         # perform an iteration of euclid's algorithm:
         k = b % m
@@ -222,19 +234,41 @@ def extended_euclid(b, m):
     return s1
 
 
-def find_public_key(p, q):
+# Policies accepted by find_public_key for choosing e.
+EXPONENT_POLICIES = ("random", "65537", "fermat")
+
+# Fermat primes 2^(2^i) + 1: small, low-weight exponents that are cheap to encrypt with.
+FERMAT_PRIMES = (3, 5, 17, 257, 65537)
+
+
+def find_public_key(p, q, exponent="random"):
     """
     Generates a public key pair for RSA encryption.
 
     Arguments:
         p (int): A prime number.
         q (int): A different prime number.
+        exponent (string): Policy for choosing e, one of EXPONENT_POLICIES:
+            "random" draws e at random (slow, unpredictable encryption cost),
+            "65537" always uses e = 65537,
+            "fermat" uses the smallest Fermat prime (3, 5, 17, 257, 65537) that is coprime to phi.
 
     Returns:
         (int, int): Public key token n, public key token e.
+
+    Raises:
+        ValueError: if the policy is unknown or no exponent allowed by it is coprime to phi.
     """
     n = p * q  # calculate n
     pq_less = (p - 1) * (q - 1)  # calculate phi
+    if exponent != "random":
+        if exponent not in EXPONENT_POLICIES:
+            raise ValueError(f"Unknown exponent policy: {exponent}")
+        candidates = (65537,) if exponent == "65537" else FERMAT_PRIMES
+        for e in candidates:
+            if euclidian_algorithm(e, pq_less) == 1:  # gcd(e, phi) == 1
+                return n, e
+        raise ValueError(f"No exponent allowed by the {exponent} policy is coprime to phi={pq_less}")
     e_found = False  # loop conditional
     while not e_found:
         e = random.randrange(2, p - 1)  # generate a random e
@@ -263,18 +297,23 @@ def find_private_key(p, q, e):
     return d  # return inverse
 
 
-def find_key_pair(p, q):
+def find_key_pair(p, q, crt=False, exponent="random"):
     """
     Generates a Private/Public Key Pair for RSA encryption.
 
     Arguments:
         p (int): A prime number.
         q (int): A different prime number.
+        crt (bool): Return a CRTPrivateKey instead of a plain integer d.
+        exponent (string): Policy for choosing e, see find_public_key.
 
     Returns:
         (int, int, int): Public key token n, public key token e, private key token d.
+        When crt is True, d is a CRTPrivateKey.
 """
-    n, e = find_public_key(p, q)  # generate a public key
+    n, e = find_public_key(p, q, exponent)  # generate a public key
+    if crt:
+        return n, e, find_crt_private_key(p, q, e)  # keep p & q around for faster decryption
     d = find_private_key(p, q, e)  # generate a private key
     return n, e, d  # return the key pair
 
@@ -291,9 +330,10 @@ def encode(n, e, message):
     Returns:
         list: Encrypted message.
     """
-    prepped_message = prep_message(message, n)
-    print(prepped_message)
-    return [fme(int(block), e, n) for block in prepped_message]
+    with stage("block.encode.prep_message"):
+        prepped_message = prep_message(message, n)
+    with stage("block.encode.fme"):
+        return power_all([int(block) for block in prepped_message], e, n)
 
 
 def convert_prepped_to_plaintext(_list):
@@ -310,22 +350,330 @@ def convert_prepped_to_plaintext(_list):
     return [int(char) for char in separate_string_to_blocks(message_concat, 2)]
 
 
+def convert_decrypted_blocks(_list, n):
+    """
+    Turns decrypted blocks back into letters by restoring their leading zeros.
+
+    Arguments:
+        _list (list): Decrypted blocks (ints).
+        n (int): Public key token n.
+
+    Returns:
+        string: Decrypted message.
+    """
+    block_size = find_block_size(n)
+    formatted_decrypted_message = [str(block).zfill(block_size) for block in _list]  # add leading zeros
+    return block_convert_num(convert_prepped_to_plaintext(formatted_decrypted_message))
+
+
 def decode(n, d, cipher_text):
     """
     Decrypts a message using a private key.
 
     Arguments:
         n (int): Public key token n.
-        d (int): Private key token d.
+        d (int or CRTPrivateKey): Private key token d.
         cipher_text (list): List of block cipher blocks (ints)
     Returns:
         string: Decrypted message.
     """
+    with stage("block.decode.fme"):
+        decrypted_blocks = decrypt_blocks(n, d, cipher_text)
+    with stage("block.decode.format"):  # zero padding and conversion back to letters
+        return convert_decrypted_blocks(decrypted_blocks, n)
+
+
+# =====================================================================================================================|
+# ===============================================DENSE PACKING FUNCTIONS===============================================|
+# =====================================================================================================================|
+
+def symbols_per_block(n, radix):
+    """
+    Finds how many base-radix symbols fit in one block, i.e. the largest k with radix^k <= n,
+    so every packed block is smaller than n.
+
+    Args:
+         n (int): Public key token n.
+         radix (int): Number of distinct symbols (26 for letters, 256 for bytes).
+
+    Returns:
+        int: Symbols per full block.
+
+    Raises:
+        ValueError: if n is too small to hold even one symbol.
+
+    """
+    if radix > n:
+        raise ValueError(f"Public key token n={n} is too small for radix {radix} packing")
+    k = 0
+    power = radix
+    while power <= n:
+        k += 1
+        power *= radix
+    return k
+
+
+def pack_blocks(symbols, n, radix):
+    """
+    Packs a sequence of symbols into integer blocks of symbols_per_block(n, radix) symbols each.
+    The final block holds the remaining (fewer than k) symbols behind a leading 1 digit,
+    so the exact message length survives decryption without padding.
+
+    Args:
+         symbols (sequence): Symbols (ints below radix); bytes are accepted for radix 256.
+         n (int): Public key token n.
+         radix (int): Number of distinct symbols.
+
+    Returns:
+        list: Integer blocks, each smaller than n.
+
+    """
+    k = symbols_per_block(n, radix)
+    full = len(symbols) - len(symbols) % k
+    blocks = []
+    for start in range(0, full + 1, k):
+        chunk = symbols[start:start + k]
+        if radix == 256:
+            value = int.from_bytes(bytes(chunk), "big")
+        else:
+            value = 0
+            for symbol in chunk:
+                value = value * radix + symbol  # Horner's rule
+        if start == full:
+            value += radix ** len(chunk)  # sentinel digit marks the final block's length
+        blocks.append(value)
+    return blocks
+
+
+def unpack_blocks(blocks, n, radix):
+    """
+    Reverses pack_blocks with integer divmod chains.
+
+    Args:
+         blocks (list): Integer blocks produced by pack_blocks.
+         n (int): Public key token n.
+         radix (int): Number of distinct symbols.
+
+    Returns:
+        list: The original symbols.
+
+    Raises:
+        ValueError: if the final block does not carry a sentinel digit.
+
+    """
+    k = symbols_per_block(n, radix)
+    symbols = []
+    last = len(blocks) - 1
+    for i, value in enumerate(blocks):
+        if i == last:
+            if value < 1:
+                raise ValueError("Final block is missing its length marker")
+            count = 0
+            power = 1
+            while power * radix <= value:  # the sentinel is the leading digit
+                count += 1
+                power *= radix
+            value -= power
+        else:
+            count = k
+        if radix == 256:
+            symbols.extend(value.to_bytes(count, "big"))
+            continue
+        digits = [0] * count
+        for j in range(count - 1, -1, -1):
+            value, digits[j] = divmod(value, radix)
+        symbols.extend(digits)
+    return symbols
+
+
+def prep_message_dense(message, n, radix=26):
+    """
+    Packs a message into dense blocks.  Radix 26 takes letters, radix 256 takes bytes
+    (strings are encoded as UTF-8).
+
+    Args:
+         message (string or bytes): Plaintext message to be blocked.
+         n (int): Public key token n.
+         radix (int): 26 or 256.
+
+    Returns:
+        list: Blocked plaintext message to be passed on to encryption algorithm.
+
+    Raises:
+        ValueError: if the radix is not supported.
+
+    """
+    if radix == 26:
+        return pack_blocks(block_convert_text(message), n, radix)
+    if radix == 256:
+        if isinstance(message, str):
+            message = message.encode("utf-8")
+        return pack_blocks(bytes(message), n, radix)
+    raise ValueError(f"Unsupported radix {radix}, use 26 or 256")
+
+
+def encode_dense(n, e, message, radix=26):
+    """
+    Encrypts a message using a public key, packing as many symbols as possible into each block.
+
+    Arguments:
+        n (int): Public key token n.
+        e (int): Public key token e.
+        message (string or bytes): Plain-text message for encryption.
+        radix (int): 26 for letters, 256 for arbitrary bytes.
+
+    Returns:
+        list: Encrypted message.
+    """
+    with stage("dense.encode.pack"):
+        blocks = prep_message_dense(message, n, radix)
+    with stage("dense.encode.fme"):
+        return power_all(blocks, e, n)
+
+
+def decode_dense(n, d, cipher_text, radix=26):
+    """
+    Decrypts a message produced by encode_dense.
+
+    Arguments:
+        n (int): Public key token n.
+        d (int or CRTPrivateKey): Private key token d.
+        cipher_text (list): List of block cipher blocks (ints)
+        radix (int): The radix used by encode_dense.
+
+    Returns:
+        string or bytes: Decrypted message; bytes for radix 256.
+    """
+    with stage("dense.decode.fme"):
+        blocks = decrypt_blocks(n, d, cipher_text)
+    with stage("dense.decode.unpack"):
+        symbols = unpack_blocks(blocks, n, radix)
+    if radix == 256:
+        return bytes(symbols)
+    return block_convert_num(symbols)
+
+
+# =====================================================================================================================|
+# ===============================================STREAMING FUNCTIONS===================================================|
+# =====================================================================================================================|
+
+def letter_digits(letters):
+    """
+    Turns upper-case letters into their digit pairs ("A" -> "00").
+
+    Raises:
+        ValueError: naming the first character outside A-Z.
+
+    """
+    try:
+        return "".join([DIGIT_TABLE[char] for char in letters])
+    except KeyError as error:
+        raise ValueError(f"Block mode only encodes the letters A-Z, not {error.args[0]!r}") from None
+
+
+def encode_stream(n, e, source, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Encrypts a file-like object block by block, so memory use does not grow with the input.
+    Blocks match those of encode: the message is only padded at the very end.  Whitespace
+    (line breaks included) is dropped, as block mode cannot encode it.
+
+    Arguments:
+        n (int): Public key token n.
+        e (int): Public key token e.
+        source (file): Binary or text file-like object holding the plain-text message.
+        chunk_size (int): Number of characters read per step.
+
+    Yields:
+        int: The next encrypted block.
+
+    Raises:
+        ValueError: if the message holds a character other than a letter or whitespace.
+    """
     block_size = find_block_size(n)
-    unformatted_decrypted_message = [str(fme(char, d, n)) for char in cipher_text]
-    formatted_decrypted_message = []
-    for word in unformatted_decrypted_message:
-        leading_zeros_to_add = block_size - len(word)
-        word = ("0" * leading_zeros_to_add) + word
-        formatted_decrypted_message.append(word)
-    return block_convert_num(convert_prepped_to_plaintext(formatted_decrypted_message))
+    letters_per_block = block_size // 2
+    carry = ""  # letters left over from the previous chunk
+    for chunk in read_text(source, chunk_size):
+        letters = carry + "".join(chunk.split()).upper()
+        full = len(letters) - len(letters) % letters_per_block
+        blocks = [int(letter_digits(letters[i:i + letters_per_block])) for i in range(0, full, letters_per_block)]
+        yield from power_all(blocks, e, n)  # one engine choice per chunk, vectorized for small n
+        carry = letters[full:]
+    if carry:
+        yield from power_all([int(letter_digits(carry).ljust(block_size, "0"))], e, n)
+
+
+def decode_stream(n, d, cipher_text, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Decrypts a stream of block cipher text chunk by chunk.
+
+    Arguments:
+        n (int): Public key token n.
+        d (int or CRTPrivateKey): Private key token d.
+        cipher_text (iterable): Cipher text blocks, or a file written by encode_file (one block per line).
+        chunk_size (int): Number of blocks decrypted per step.
+
+    Yields:
+        string: The next chunk of the decrypted message.
+    """
+    for batch in batched(read_blocks(cipher_text), chunk_size):
+        yield decode(n, d, batch)
+
+
+def encode_file(n, e, source, sink, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Encrypts source into sink, writing one cipher text block per line.
+
+    Arguments:
+        n (int): Public key token n.
+        e (int): Public key token e.
+        source (file): Binary or text file-like object holding the plain-text message.
+        sink (file): Binary or text file-like object receiving the cipher text.
+        chunk_size (int): Number of characters read per step.
+    """
+    write_blocks(encode_stream(n, e, source, chunk_size), sink)
+
+
+def decode_file(n, d, source, sink, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Decrypts a file written by encode_file into sink.
+
+    Arguments:
+        n (int): Public key token n.
+        d (int or CRTPrivateKey): Private key token d.
+        source (file): Binary or text file-like object holding one cipher text block per line.
+        sink (file): Binary or text file-like object receiving the decrypted message.
+        chunk_size (int): Number of blocks decrypted per step.
+    """
+    write_text(decode_stream(n, d, source, chunk_size), sink)
+
+
+def check_stream_round_trip(bits=64, seed=0):
+    """
+    Encrypts a multi-line text file that ends with a newline through encode_file and decode_file,
+    at several chunk sizes, and checks that its letters come back.
+
+    Returns:
+        list: Chunk sizes whose round trip failed.  Empty when all passed.
+
+    """
+    import io
+
+    from primes import generate_key_pair
+
+    n, e, d = generate_key_pair(bits, rng=random.Random(seed))
+    text = "the quick brown fox\njumps over\nthe lazy dog\n"
+    letters = "".join(text.split()).upper()
+    failures = []
+    for chunk_size in (1, 5, 7, len(text), STREAM_CHUNK_SIZE):
+        cipher_text, plain_text = io.StringIO(), io.StringIO()
+        encode_file(n, e, io.StringIO(text), cipher_text, chunk_size)
+        cipher_text.seek(0)
+        decode_file(n, d, cipher_text, plain_text, chunk_size)
+        if not plain_text.getvalue().startswith(letters):  # the last block may carry "A" padding
+            failures.append(chunk_size)
+    return failures
+
+
+if __name__ == '__main__':
+    failed = check_stream_round_trip()
+    print("Stream round trip passed" if not failed else f"Stream round trip failed for chunk sizes {failed}")
@@ -0,0 +1,51 @@
+# Throughput of hybrid envelope encryption next to pure RSA (dense radix 256 packing), in MB/s.
+# Usage: python benchmarks/envelope.py [bits] [envelope MiB] [pure RSA KiB]
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import envelope  # noqa: E402
+import RSA_block  # noqa: E402
+from primes import generate_key_pair  # noqa: E402
+
+
+def megabytes_per_second(function, size, repeats=3):
+    """
+    Runs function() several times and returns the best rate for size bytes, in MB/s.
+    """
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return size / best / 1e6
+
+
+def main(argv):
+    bits = int(argv[0]) if argv else 2048
+    envelope_size = (int(argv[1]) if len(argv) > 1 else 16) << 20
+    rsa_size = (int(argv[2]) if len(argv) > 2 else 64) << 10
+    n, e, d = generate_key_pair(bits, crt=True, rng=random.Random(0), exponent="65537")
+    rng = random.Random(1)
+
+    payload = rng.randbytes(envelope_size)
+    sealed = envelope.encode(n, e, payload)
+    encode_rate = megabytes_per_second(lambda: envelope.encode(n, e, payload), envelope_size)
+    decode_rate = megabytes_per_second(lambda: envelope.decode(n, d, sealed), envelope_size)
+    print(f"envelope  ({envelope_size >> 20:5d} MiB, {bits}-bit key): "
+          f"encrypt {encode_rate:10.3f} MB/s, decrypt {decode_rate:10.3f} MB/s")
+
+    payload = rng.randbytes(rsa_size)
+    cipher_text = RSA_block.encode_dense(n, e, payload, 256)
+    encode_rate = megabytes_per_second(lambda: RSA_block.encode_dense(n, e, payload, 256), rsa_size, repeats=1)
+    decode_rate = megabytes_per_second(lambda: RSA_block.decode_dense(n, d, cipher_text, 256), rsa_size, repeats=1)
+    print(f"pure RSA  ({rsa_size >> 10:5d} KiB, {bits}-bit key): "
+          f"encrypt {encode_rate:10.3f} MB/s, decrypt {decode_rate:10.3f} MB/s")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,43 @@
+# Encryption throughput for each public exponent policy.
+# Usage: python benchmarks/exponent_policy.py [bits] [message length]
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import RSA  # noqa: E402
+import RSA_block  # noqa: E402
+from primes import generate_key_pair  # noqa: E402
+
+
+def time_encode(encode, n, e, message, repeats=3):
+    """
+    Returns the best of several timings of encode(n, e, message), in seconds.
+    """
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        encode(n, e, message)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv):
+    bits = int(argv[0]) if argv else 2048
+    length = int(argv[1]) if len(argv) > 1 else 200
+    rng = random.Random(0)
+    message = "".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(length))
+    for policy in RSA.EXPONENT_POLICIES:
+        random.seed(0)  # find_public_key draws random exponents from the random module
+        n, e, d = generate_key_pair(bits, rng=random.Random(1), exponent=policy)
+        ascii_seconds = time_encode(RSA.encode, n, e, message)
+        block_seconds = time_encode(RSA_block.encode, n, e, message)
+        print(f"{policy:>7}: e has {e.bit_length():4d} bits, "
+              f"ascii {length / ascii_seconds:10.0f} chars/s, block {length / block_seconds:10.0f} chars/s")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,48 @@
+# Key generation latency benchmark.
+# Usage: python benchmarks/keygen.py [bits ...]
+
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from primes import generate_key_pair  # noqa: E402
+
+
+def time_keygen(bits, runs, seed=0):
+    """
+    Times generate_key_pair with fixed seeds.
+
+    Args:
+         bits (int): Bit length of n.
+         runs (int): Number of key pairs to generate.
+         seed (int): Seed for the prime search and for the choice of e.
+
+    Returns:
+        list: Seconds taken by each run.
+
+    """
+    rng = random.Random(seed)
+    random.seed(seed)  # find_public_key draws e from the random module
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        generate_key_pair(bits, rng=rng)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main(argv):
+    sizes = [int(arg) for arg in argv] or [1024, 2048, 3072, 4096]
+    for bits in sizes:
+        runs = max(3, 40960 // bits)
+        timings = time_keygen(bits, runs)
+        print(f"{bits:5d} bits: median {statistics.median(timings) * 1000:8.1f} ms, "
+              f"mean {statistics.mean(timings) * 1000:8.1f} ms, max {max(timings) * 1000:8.1f} ms ({runs} runs)")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,50 @@
+# Quadratic sieve time-to-factor against modulus size.
+# Usage: python benchmarks/quadratic_sieve.py [bits ...]
+
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from primes import generate_prime  # noqa: E402
+from quadratic_sieve import factor_qs  # noqa: E402
+
+
+def time_factor_qs(bits, runs, seed=0):
+    """
+    Times factor_qs on balanced moduli built from seeded primes.
+
+    Args:
+         bits (int): Bit length of the moduli.
+         runs (int): Number of moduli to factor.
+         seed (int): Seed for the primes and the sieve.
+
+    Returns:
+        list: Seconds taken by each run.
+
+    """
+    rng = random.Random(seed)
+    timings = []
+    for run in range(runs):
+        p = generate_prime(bits // 2, rng=rng)
+        q = generate_prime(bits - bits // 2, rng=rng)
+        start = time.perf_counter()
+        factors = factor_qs(p * q, seed=run)
+        timings.append(time.perf_counter() - start)
+        if factors is None or factors[0] * factors[1] != p * q:
+            raise RuntimeError(f"factor_qs failed on {p} * {q}")
+    return timings
+
+
+def main(argv):
+    sizes = [int(arg) for arg in argv] or [60, 70, 80, 90, 100]
+    for bits in sizes:
+        timings = time_factor_qs(bits, runs=5)
+        print(f"{bits:4d} bits: median {statistics.median(timings) * 1000:9.1f} ms, max {max(timings) * 1000:9.1f} ms")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,142 @@
+# Load generator for service.py: concurrent clients sending encrypt/decrypt requests on a few hot keys.
+# Reports p50/p99 latency and requests per second.
+# Usage: python benchmarks/service_load.py [--spawn] [--clients 32] [--requests 50] [--keys 4] [--bits 1024]
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from service import DEFAULT_HOST, DEFAULT_PORT  # noqa: E402
+
+
+class Client:
+    """
+    One connection to the service.  Requests are pipelined and matched to responses by id.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self._ids = itertools.count()
+        self._waiting = {}
+        self._listener = asyncio.ensure_future(self._listen())
+
+    @classmethod
+    async def connect(cls, host, port):
+        reader, writer = await asyncio.open_connection(host, port, limit=1 << 26)
+        return cls(reader, writer)
+
+    async def _listen(self):
+        while line := await self.reader.readline():
+            response = json.loads(line)
+            self._waiting.pop(response["id"]).set_result(response)
+
+    async def call(self, request):
+        request = dict(request, id=next(self._ids))
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[request["id"]] = future
+        self.writer.write(json.dumps(request).encode("ascii") + b"\n")
+        await self.writer.drain()
+        response = await future
+        if not response["ok"]:
+            raise RuntimeError(response["error"])
+        return response["result"]
+
+    async def close(self):
+        self.writer.close()
+        self._listener.cancel()
+
+
+async def wait_for_service(host, port, timeout=30.0):
+    """
+    Retries connecting until the service accepts connections.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return await Client.connect(host, port)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def run_client(client, keys, requests, message_length, rng, latencies):
+    """
+    Sends requests alternating encrypt and decrypt on randomly chosen hot keys, recording each latency.
+    """
+    for _ in range(requests):
+        key = rng.choice(keys)
+        message = "".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(message_length))
+        start = time.perf_counter()
+        cipher_text = await client.call({"op": "encrypt", "key": {"n": key["n"], "e": key["e"]}, "message": message})
+        latencies.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        plain_text = await client.call({"op": "decrypt", "key": key, "cipher_text": cipher_text})
+        latencies.append(time.perf_counter() - start)
+        if plain_text != message:
+            raise RuntimeError("Service returned the wrong plain text")
+
+
+async def run_load(args):
+    control = await wait_for_service(args.host, args.port)
+    keys = await asyncio.gather(*[control.call({"op": "keygen", "bits": args.bits}) for _ in range(args.keys)])
+    clients = [await Client.connect(args.host, args.port) for _ in range(args.clients)]
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[run_client(client, keys, args.requests, args.length, random.Random(seed), latencies)
+                           for seed, client in enumerate(clients)])
+    seconds = time.perf_counter() - start
+    stats = await control.call({"op": "stats"})
+    for client in [control, *clients]:
+        await client.close()
+
+    latencies.sort()
+    p50 = statistics.median(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{len(latencies)} requests from {args.clients} clients on {args.keys} {args.bits}-bit keys "
+          f"in {seconds:.2f} s: {len(latencies) / seconds:,.0f} requests/s")
+    print(f"latency p50 {p50 * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms, max {latencies[-1] * 1000:.2f} ms")
+    print(f"service: {stats['batches']} batches, {stats['mean_batch_size']:.1f} requests per batch, "
+          f"key cache {stats['key_cache']['hits']} hits / {stats['key_cache']['misses']} misses")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Load generator for service.py.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--spawn", action="store_true", help="start service.py for the run and stop it afterwards")
+    parser.add_argument("--processes", type=int, help="pool size for the spawned service")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent connections")
+    parser.add_argument("--requests", type=int, default=50, help="encrypt/decrypt pairs per client")
+    parser.add_argument("--keys", type=int, default=4, help="number of hot keys")
+    parser.add_argument("--bits", type=int, default=1024, help="key size")
+    parser.add_argument("--length", type=int, default=32, help="message length in characters")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.spawn:
+        command = [sys.executable, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                                "service.py"), "--host", args.host, "--port", str(args.port)]
+        if args.processes:
+            command += ["--processes", str(args.processes)]
+        server = subprocess.Popen(command, stderr=subprocess.DEVNULL)
+    try:
+        asyncio.run(run_load(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,318 @@
+# Benchmark suite for the RSA, block cipher and code breaking functions.
+# Usage: python benchmarks/suite.py run [--quick] [--filter NAME] [--output results.json]
+#        python benchmarks/suite.py compare baseline.json results.json [--tolerance 0.25]
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import CodeBreakers  # noqa: E402
+import envelope  # noqa: E402
+import modexp  # noqa: E402
+import quadratic_sieve  # noqa: E402
+import RSA  # noqa: E402
+import RSA_block  # noqa: E402
+from keygen import time_keygen  # noqa: E402
+from primes import generate_key_pair, generate_prime  # noqa: E402
+
+
+SEED = 0
+
+# Sweeps used by a full run and by --quick.
+KEY_SIZES = (256, 512, 1024, 2048)
+MESSAGE_SIZES = (16, 256, 1024)
+QUICK_KEY_SIZES = (256, 512)
+QUICK_MESSAGE_SIZES = (16, 256)
+
+# Modulus sizes for each factoring function.  The trial division variants walk every candidate
+# up to p (or n), so they only get small moduli.
+FACTOR_SIZES = {
+    "factor": (24, 32),
+    "factor_1": (24, 32),
+    "factor_2": (24, 32, 40),
+    "factor_3": (24, 32, 40),
+    "factor_trial": (32, 40, 48),
+    "rho_factorize": (32, 48, 64),
+    "fermat_factor": (32, 48, 64),
+    "pollard_pm1": (32, 48, 64),
+    "ecm_factor": (32, 48, 64),
+    "factor_qs": (48, 64, 80),
+}
+QUICK_FACTOR_SIZES = {name: sizes[:2] for name, sizes in FACTOR_SIZES.items()}
+FACTOR_RUNS = 3  # moduli factored per size; the median is reported
+
+FACTOR_FUNCTIONS = {
+    "factor": CodeBreakers.factor,
+    "factor_1": CodeBreakers.factor_1,
+    "factor_2": CodeBreakers.factor_2,
+    "factor_3": CodeBreakers.factor_3,
+    "factor_trial": CodeBreakers.factor_trial,
+    "rho_factorize": CodeBreakers.rho_factorize,
+    "fermat_factor": CodeBreakers.fermat_factor,
+    "pollard_pm1": CodeBreakers.pollard_pm1,
+    "ecm_factor": CodeBreakers.ecm_factor,
+}
+if quadratic_sieve.np is not None:  # the quadratic sieve needs NumPy
+    FACTOR_FUNCTIONS["factor_qs"] = quadratic_sieve.factor_qs
+
+# Results slower than baseline * (1 + DEFAULT_TOLERANCE) are reported as regressions.
+DEFAULT_TOLERANCE = 0.25
+
+
+# =====================================================================================================================|
+# ===============================================TIMING FUNCTIONS======================================================|
+# =====================================================================================================================|
+
+def best_time(function, repeats=5):
+    """
+    Times a call the way timeit does: calls per sample are picked so a sample takes at least
+    0.2 seconds, and the best sample is kept.
+
+    Args:
+         function (callable): Called with no arguments.
+         repeats (int): Number of samples.
+
+    Returns:
+        float: Best time for one call, in seconds.
+
+    """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeats, number)) / number
+
+
+def message_of(length, rng, alphabet=RSA_block.ALPHABET):
+    """
+    Returns a reproducible random message of the given length.
+    """
+    return "".join(rng.choice(alphabet) for _ in range(length))
+
+
+def key_of(bits, seed=SEED):
+    """
+    Returns a reproducible (n, e, d) key pair with e = 65537.
+    """
+    return generate_key_pair(bits, rng=random.Random(seed), exponent="65537")
+
+
+# =====================================================================================================================|
+# ===============================================BENCHMARK CASES=======================================================|
+# =====================================================================================================================|
+
+def bench_math(key_sizes):
+    """
+    fme, convert_binary_string and extended_euclid at each key size, and power_all over block lists
+    under a modulus small enough for the vectorized engine.
+    """
+    results = {}
+    rng = random.Random(SEED)
+    for bits in key_sizes:
+        m = rng.getrandbits(bits) | 1 << (bits - 1) | 1
+        b, n = rng.randrange(m), rng.getrandbits(bits)
+        results[f"fme/{bits}"] = best_time(lambda: RSA.fme(b, n, m))
+        results[f"convert_binary_string/{bits}"] = best_time(lambda: RSA.convert_binary_string(n))
+        e = generate_prime(min(bits, 64), rng=rng)
+        results[f"extended_euclid/{bits}"] = best_time(lambda: RSA.extended_euclid(e, m))
+    m = rng.randrange(modexp.VECTOR_MAX_MODULUS // 2, modexp.VECTOR_MAX_MODULUS) | 1
+    n = rng.getrandbits(30)
+    for count in (64, 1024):
+        bases = [rng.randrange(m) for _ in range(count)]
+        results[f"power_all/31/{count}"] = best_time(lambda: modexp.power_all(bases, n, m))
+    return results
+
+
+def bench_keys(key_sizes):
+    """
+    find_key_pair from fixed primes, and generate_key_pair (prime search included) at each key size.
+    """
+    results = {}
+    rng = random.Random(SEED)
+    for bits in key_sizes:
+        p, q = generate_prime(bits // 2, rng=rng), generate_prime(bits - bits // 2, rng=rng)
+
+        def find_key_pair():
+            random.seed(SEED)  # find_public_key draws e from the random module
+            RSA.find_key_pair(p, q)
+
+        results[f"find_key_pair/{bits}"] = best_time(find_key_pair, repeats=3)
+        results[f"generate_key_pair/{bits}"] = statistics.median(time_keygen(bits, runs=3, seed=SEED))
+    return results
+
+
+def bench_ciphers(key_sizes, message_sizes):
+    """
+    ASCII, block and envelope encode/decode, and block prep_message, for every key size and message length.
+    """
+    results = {}
+    for bits in key_sizes:
+        n, e, d = key_of(bits)
+        for length in message_sizes:
+            message = message_of(length, random.Random(SEED))
+            ascii_cipher = RSA.encode(n, e, message)
+            block_cipher = RSA_block.encode(n, e, message)
+            results[f"encode_ascii/{bits}/{length}"] = best_time(lambda: RSA.encode(n, e, message), repeats=3)
+            results[f"decode_ascii/{bits}/{length}"] = best_time(lambda: RSA.decode(n, d, ascii_cipher), repeats=3)
+            results[f"encode_block/{bits}/{length}"] = best_time(lambda: RSA_block.encode(n, e, message), repeats=3)
+            results[f"decode_block/{bits}/{length}"] = best_time(lambda: RSA_block.decode(n, d, block_cipher),
+                                                                 repeats=3)
+            results[f"prep_message/{bits}/{length}"] = best_time(lambda: RSA_block.prep_message(message, n))
+            payload = message.encode("ascii")
+            sealed = envelope.encode(n, e, payload)
+            results[f"encode_envelope/{bits}/{length}"] = best_time(lambda: envelope.encode(n, e, payload), repeats=3)
+            results[f"decode_envelope/{bits}/{length}"] = best_time(lambda: envelope.decode(n, d, sealed), repeats=3)
+    return results
+
+
+def bench_factoring(factor_sizes):
+    """
+    Every factoring function on FACTOR_RUNS balanced moduli per size.  Moduli are the same for
+    every function, so times at one size are directly comparable.
+    """
+    results = {}
+    for name, sizes in factor_sizes.items():
+        function = FACTOR_FUNCTIONS.get(name)
+        if function is None:  # factor_qs without NumPy
+            continue
+        for bits in sizes:
+            rng = random.Random(SEED + bits)
+            timings = []
+            for _ in range(FACTOR_RUNS):
+                p = generate_prime(bits // 2, rng=rng)
+                q = generate_prime(bits - bits // 2, rng=rng)
+                random.seed(SEED)  # rho and ECM draw from the random module
+                start = time.perf_counter()
+                function(p * q)
+                timings.append(time.perf_counter() - start)
+            results[f"{name}/{bits}"] = statistics.median(timings)
+    return results
+
+
+def run(quick=False, pattern=None):
+    """
+    Runs the suite.
+
+    Args:
+         quick (bool): Use the smaller sweeps.
+         pattern (string): Only keep groups whose name contains pattern ("math", "keys", "ciphers", "factoring"),
+            or factoring functions whose name contains it.
+
+    Returns:
+        dict: Case name ("function/key bits[/message length]") -> seconds per call.
+
+    """
+    key_sizes = QUICK_KEY_SIZES if quick else KEY_SIZES
+    message_sizes = QUICK_MESSAGE_SIZES if quick else MESSAGE_SIZES
+    factor_sizes = QUICK_FACTOR_SIZES if quick else FACTOR_SIZES
+    groups = {
+        "math": lambda: bench_math(key_sizes),
+        "keys": lambda: bench_keys(key_sizes),
+        "ciphers": lambda: bench_ciphers(key_sizes, message_sizes),
+        "factoring": lambda: bench_factoring(factor_sizes),
+    }
+    if pattern:
+        selected = {group: bench for group, bench in groups.items() if pattern in group}
+        if not selected:  # not a group name, so pick factoring functions by name
+            factor_sizes = {name: sizes for name, sizes in factor_sizes.items() if pattern in name}
+            selected = {"factoring": lambda: bench_factoring(factor_sizes)}
+        groups = selected
+    results = {}
+    for bench in groups.values():
+        results.update(bench())
+    return results
+
+
+# =====================================================================================================================|
+# ===============================================RESULT FILES==========================================================|
+# =====================================================================================================================|
+
+def save_results(results, path, quick):
+    """
+    Writes results to a JSON file, with enough context to tell runs apart.
+    """
+    document = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": SEED,
+        "quick": quick,
+        "results": results,
+    }
+    with open(path, "w") as output:
+        json.dump(document, output, indent=2, sort_keys=True)
+
+
+def load_results(path):
+    """
+    Reads the results of a saved run.
+    """
+    with open(path) as source:
+        return json.load(source)["results"]
+
+
+def compare(baseline, current, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compares two runs case by case.
+
+    Args:
+         baseline (dict): Case name -> seconds, from the reference run.
+         current (dict): Case name -> seconds, from the run being checked.
+         tolerance (float): Allowed slowdown, as a fraction of the baseline time.
+
+    Returns:
+        list: (case, baseline seconds, current seconds, ratio, status) for every case in both runs,
+        where status is "regression", "improvement" or "ok".
+
+    """
+    rows = []
+    for case in sorted(baseline.keys() & current.keys()):
+        ratio = current[case] / baseline[case] if baseline[case] else float("inf")
+        if ratio > 1 + tolerance:
+            status = "regression"
+        elif ratio < 1 / (1 + tolerance):
+            status = "improvement"
+        else:
+            status = "ok"
+        rows.append((case, baseline[case], current[case], ratio, status))
+    return rows
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="RSA CryptoSystem benchmark suite.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run the benchmarks and write the results as JSON")
+    run_parser.add_argument("--quick", action="store_true", help="smaller key, message and modulus sweeps")
+    run_parser.add_argument("--filter", help="only run groups or factoring functions containing this name")
+    run_parser.add_argument("--output", default="benchmark_results.json", help="JSON file to write")
+    compare_parser = commands.add_parser("compare", help="flag regressions against a saved baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                                help="allowed slowdown as a fraction of the baseline (default 0.25)")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        results = run(args.quick, args.filter)
+        for case, seconds in sorted(results.items()):
+            print(f"{case:32s} {seconds * 1000:12.3f} ms")
+        save_results(results, args.output, args.quick)
+        print(f"Wrote {len(results)} results to {args.output}")
+        return 0
+
+    rows = compare(load_results(args.baseline), load_results(args.current), args.tolerance)
+    for case, before, after, ratio, status in rows:
+        print(f"{case:32s} {before * 1000:12.3f} ms -> {after * 1000:12.3f} ms  x{ratio:6.2f}  {status}")
+    regressions = [row for row in rows if row[4] == "regression"]
+    print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%} in {len(rows)} cases")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
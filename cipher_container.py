@@ -0,0 +1,208 @@
+# Binary container for cipher text: a small header followed by fixed-width big-endian blocks.
+# Replaces printing the list of blocks and parsing it back, and is read with mmap without building a list.
+
+import mmap
+import os
+import struct
+
+import RSA
+import RSA_block
+from stream_io import STREAM_CHUNK_SIZE, batched
+
+
+# File layout: header, then every block as an unsigned big-endian integer of modulus_bytes bytes.
+CONTAINER_MAGIC = b"RSAC"
+CONTAINER_HEADER = struct.Struct(">4sBBHII")  # magic, version, scheme, reserved, block size, modulus bytes
+CONTAINER_VERSION = 1
+
+# Scheme name -> (code stored in the header, encode, decode).  The dense schemes are RSA_block's
+# encode_dense/decode_dense with radix 26 and 256.
+SCHEMES = {
+    "ascii": (1, RSA.encode, RSA.decode),
+    "block": (2, RSA_block.encode, RSA_block.decode),
+    "dense": (3, lambda n, e, message: RSA_block.encode_dense(n, e, message, 26),
+              lambda n, d, blocks: RSA_block.decode_dense(n, d, blocks, 26)),
+    "dense256": (4, lambda n, e, message: RSA_block.encode_dense(n, e, message, 256),
+                 lambda n, d, blocks: RSA_block.decode_dense(n, d, blocks, 256)),
+}
+_SCHEME_NAMES = {code: name for name, (code, _, _) in SCHEMES.items()}
+
+
+def modulus_bytes(n):
+    """
+    Width of one block in bytes: every block is below n, so it fits in as many bytes as n.
+    """
+    return (n.bit_length() + 7) // 8
+
+
+def scheme_block_size(n, scheme):
+    """
+    Plain-text size of one block for a scheme: 1 character for ascii, find_block_size digits for block,
+    and symbols_per_block symbols for the dense schemes.
+
+    Raises:
+        ValueError: if the scheme is unknown.
+
+    """
+    if scheme == "ascii":
+        return 1
+    if scheme == "block":
+        return RSA_block.find_block_size(n)
+    if scheme == "dense":
+        return RSA_block.symbols_per_block(n, 26)
+    if scheme == "dense256":
+        return RSA_block.symbols_per_block(n, 256)
+    raise ValueError(f"Unknown cipher text scheme: {scheme}")
+
+
+# =====================================================================================================================|
+# ===============================================WRITING FUNCTIONS=====================================================|
+# =====================================================================================================================|
+
+def write_container(blocks, sink, n, scheme="ascii", chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Writes cipher text blocks to a binary file-like object as a container.
+    Blocks are consumed lazily, so the output of encode_stream can be written in constant memory.
+
+    Args:
+         blocks (iterable): Cipher text blocks (ints below n).
+         sink (file): Binary file-like object opened for writing.
+         n (int): Public key token n.
+         scheme (string): Name from SCHEMES that produced the blocks.
+         chunk_size (int): Number of blocks written per call to sink.write.
+
+    Returns:
+        int: Number of blocks written.
+
+    """
+    width = modulus_bytes(n)
+    code = SCHEMES[scheme][0]
+    sink.write(CONTAINER_HEADER.pack(CONTAINER_MAGIC, CONTAINER_VERSION, code, 0, scheme_block_size(n, scheme), width))
+    count = 0
+    for batch in batched(blocks, chunk_size):
+        sink.write(b"".join([block.to_bytes(width, "big") for block in batch]))
+        count += len(batch)
+    return count
+
+
+def encode_to_container(n, e, message, sink, scheme="ascii"):
+    """
+    Encrypts a message with the scheme's encode function and writes the result as a container.
+
+    Args:
+         n (int): Public key token n.
+         e (int): Public key token e.
+         message (string or bytes): Plain-text message; bytes for dense256.
+         sink (file or string): Binary file-like object, or a path to create.
+         scheme (string): Name from SCHEMES.
+
+    Returns:
+        int: Number of blocks written.
+
+    """
+    blocks = SCHEMES[scheme][1](n, e, message)
+    if isinstance(sink, (str, os.PathLike)):
+        with open(sink, "wb") as sink_file:
+            return write_container(blocks, sink_file, n, scheme)
+    return write_container(blocks, sink, n, scheme)
+
+
+# =====================================================================================================================|
+# ===============================================READING FUNCTIONS=====================================================|
+# =====================================================================================================================|
+
+class CipherContainer:
+    """
+    Read-only view of a container file.  The file is mapped with mmap and blocks are
+    converted straight from memoryview slices of the mapping.
+
+    Attributes:
+        scheme (string): Name from SCHEMES.
+        block_size (int): Plain-text size of one block, see scheme_block_size.
+        width (int): Bytes per cipher text block (the modulus byte length).
+    """
+
+    def __init__(self, source):
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, "rb") as container_file:
+                self._map = mmap.mmap(container_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._map = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < CONTAINER_HEADER.size:
+            self._map.close()
+            raise ValueError("Cipher text container is truncated")
+        magic, version, code, _, self.block_size, self.width = CONTAINER_HEADER.unpack_from(self._map)
+        if magic != CONTAINER_MAGIC or version != CONTAINER_VERSION or code not in _SCHEME_NAMES or not self.width:
+            self._map.close()
+            raise ValueError(f"Not a version {CONTAINER_VERSION} cipher text container")
+        body_length = len(self._map) - CONTAINER_HEADER.size
+        if body_length % self.width:
+            self._map.close()
+            raise ValueError("Cipher text container ends in a partial block")
+        self.scheme = _SCHEME_NAMES[code]
+        self._view = memoryview(self._map)[CONTAINER_HEADER.size:]
+
+    def __len__(self):
+        return len(self._view) // self.width
+
+    def __iter__(self):
+        view, width = self._view, self.width
+        from_bytes = int.from_bytes
+        for start in range(0, len(view), width):
+            yield from_bytes(view[start:start + width], "big")
+
+    def __getitem__(self, index):
+        if not -len(self) <= index < len(self):
+            raise IndexError("Cipher text block index out of range")
+        start = (index % len(self)) * self.width
+        return int.from_bytes(self._view[start:start + self.width], "big")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def decode(self, n, d):
+        """
+        Decrypts the container with the decode function of its scheme, feeding it blocks
+        straight from the mapping.
+
+        Args:
+             n (int): Public key token n.
+             d (int or CRTPrivateKey): Private key token d.
+
+        Returns:
+            string or bytes: Decrypted message; bytes for dense256.
+
+        Raises:
+            ValueError: if n does not match the block width of the container.
+
+        """
+        if modulus_bytes(n) != self.width:
+            raise ValueError(f"Container blocks are {self.width} bytes wide, but n takes {modulus_bytes(n)}")
+        return SCHEMES[self.scheme][2](n, d, iter(self))
+
+    def close(self):
+        """
+        Unmaps the file.
+        """
+        self._view.release()
+        self._map.close()
+
+
+def decode_container(source, n, d):
+    """
+    Opens a container and decrypts it.
+
+    Args:
+         source (file or string): Binary file object or path of the container.
+         n (int): Public key token n.
+         d (int or CRTPrivateKey): Private key token d.
+
+    Returns:
+        string or bytes: Decrypted message.
+
+    """
+    with CipherContainer(source) as container:
+        return container.decode(n, d)
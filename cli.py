@@ -0,0 +1,417 @@
+# Non-interactive command line: keygen, encrypt, decrypt and break subcommands for shell pipelines.
+# Usage: python main.py keygen --bits 2048 --public alice.pub --private alice.key
+#        python main.py encrypt --key alice.pub < message.txt > message.rsa
+#        python main.py decrypt --key alice.key < message.rsa
+#        python main.py break --key alice.pub --method rho < message.rsa
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import CodeBreakers
+import RSA
+import RSA_block
+from cipher_container import SCHEMES, CipherContainer, write_container
+from factor_race import STRATEGIES, factor_race
+from modexp import backend_for
+from parallel import ParallelCipher
+from primes import generate_key_pair
+from stream_io import STREAM_CHUNK_SIZE, batched, read_blocks, read_text, write_blocks
+
+
+# Radix of the dense schemes.
+DENSE_RADIX = {"dense": 26, "dense256": 256}
+
+# Blocks decrypted per step when streaming.
+DECRYPT_CHUNK_SIZE = 1 << 12
+
+
+# =====================================================================================================================|
+# ===============================================KEY FILES=============================================================|
+# =====================================================================================================================|
+
+def write_key(path, key):
+    """
+    Writes a key file: a JSON object with the key tokens ("n", "e", and for private keys "d", "p", "q").
+    """
+    with open(path, "w") as key_file:
+        json.dump(key, key_file, indent=2)
+        key_file.write("\n")
+
+
+def read_key(path):
+    """
+    Reads a key file written by keygen.
+
+    Returns:
+        dict: The key tokens as ints.
+
+    Raises:
+        ValueError: if n or e is missing.
+
+    """
+    with open(path) as key_file:
+        key = {name: int(value) for name, value in json.load(key_file).items()}
+    if "n" not in key or "e" not in key:
+        raise ValueError(f"{path} is not a key file (needs n and e)")
+    return key
+
+
+def private_exponent(key):
+    """
+    Returns the private token to decrypt with: a CRTPrivateKey when the key file has p and q, else d.
+
+    Raises:
+        ValueError: if the key file has neither.
+
+    """
+    if "p" in key and "q" in key:
+        return RSA.find_crt_private_key(key["p"], key["q"], key["e"])
+    if "d" in key:
+        return key["d"]
+    raise ValueError("Decrypting needs a private key file (with d, or p and q)")
+
+
+# =====================================================================================================================|
+# ===============================================MESSAGE FUNCTIONS=====================================================|
+# =====================================================================================================================|
+
+def message_blocks(message, n, scheme):
+    """
+    Turns a complete message into plain-text blocks, as the scheme's encode function does.
+    The letter schemes drop whitespace, which they cannot encode.
+    """
+    if scheme == "ascii":
+        return RSA.convert_text(message)
+    if scheme in ("block", "dense"):
+        message = "".join(message.split())
+    if scheme == "block":
+        return [int(block) for block in RSA_block.prep_message(message, n)]
+    if scheme == "dense256" and isinstance(message, str):
+        message = message.encode("latin-1")
+    return RSA_block.prep_message_dense(message, n, DENSE_RADIX[scheme])
+
+
+def message_text(blocks, n, scheme):
+    """
+    Turns decrypted blocks back into text (bytes for dense256), as the scheme's decode function does.
+    """
+    if scheme == "ascii":
+        return RSA.convert_num(blocks)
+    if scheme == "block":
+        return RSA_block.convert_decrypted_blocks(blocks, n)
+    symbols = RSA_block.unpack_blocks(blocks, n, DENSE_RADIX[scheme])
+    return bytes(symbols) if scheme == "dense256" else RSA_block.block_convert_num(symbols)
+
+
+def exponentiator(n, exponent, which, jobs):
+    """
+    Builds the function raising a list of blocks to e or d: a ParallelCipher pool when jobs > 1,
+    otherwise a loop in this process.
+
+    Returns:
+        (callable, ParallelCipher): The function, and the pool to close (None without one).
+
+    """
+    if jobs > 1:
+        cipher = ParallelCipher(n, processes=jobs, **{which: exponent})
+        return (lambda blocks: cipher.map(blocks, which)), cipher
+    if isinstance(exponent, int):
+        power = backend_for(exponent, n)  # pick the backend once for the whole run
+        return (lambda blocks: [power(block, exponent, n) for block in blocks]), None
+    return (lambda blocks: [RSA.crt_fme(block, exponent) for block in blocks]), None
+
+
+def encrypt_stream(source, n, apply, scheme, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Encrypts a whole input as one message, chunk by chunk where the scheme allows it.
+    The ascii and block schemes stream; the dense schemes pad their last block with a
+    sentinel, so they read the message first.
+
+    Yields:
+        (int, list): Plain-text symbols consumed and the encrypted blocks, per step.
+
+    """
+    if scheme == "ascii":
+        for chunk in read_text(source, chunk_size):
+            yield len(chunk), apply(RSA.convert_text(chunk))
+        return
+    if scheme == "block":
+        letters_per_block = RSA_block.find_block_size(n) // 2
+        carry = ""  # letters left over from the previous chunk
+        for chunk in read_text(source, chunk_size):
+            letters = carry + "".join(chunk.split())  # drop whitespace here too, so blocks stay full
+            full = len(letters) - len(letters) % letters_per_block
+            if full:
+                yield full, apply(message_blocks(letters[:full], n, scheme))
+            carry = letters[full:]
+        if carry:
+            yield len(carry), apply(message_blocks(carry, n, scheme))
+        return
+    message = "".join(read_text(source, chunk_size))
+    yield len(message), apply(message_blocks(message, n, scheme))
+
+
+def decrypt_stream(blocks, n, apply, scheme, chunk_size=DECRYPT_CHUNK_SIZE):
+    """
+    Decrypts cipher text blocks chunk by chunk where the scheme allows it (not for the dense schemes).
+
+    Yields:
+        (int, string or bytes): Cipher text blocks consumed and the decrypted text, per step.
+
+    """
+    if scheme in DENSE_RADIX:
+        blocks = list(blocks)
+        yield len(blocks), message_text(apply(blocks), n, scheme)
+        return
+    for batch in batched(blocks, chunk_size):
+        yield len(batch), message_text(apply(batch), n, scheme)
+
+
+# =====================================================================================================================|
+# ===============================================INPUT AND OUTPUT======================================================|
+# =====================================================================================================================|
+
+def open_input(path, opened):
+    """
+    Opens an input file in binary mode ("-" is stdin), adding it to opened so the caller closes it.
+    """
+    if path in (None, "-"):
+        return sys.stdin.buffer
+    opened.append(open(path, "rb"))
+    return opened[-1]
+
+
+def open_output(path, opened):
+    """
+    Opens an output file in binary mode ("-" is stdout), adding it to opened so the caller closes it.
+    """
+    if path in (None, "-"):
+        return sys.stdout.buffer
+    opened.append(open(path, "wb"))
+    return opened[-1]
+
+
+def write_plain(text, sink):
+    sink.write(text if isinstance(text, bytes) else text.encode("latin-1"))
+
+
+def cipher_blocks(source, cipher_format, scheme, stack):
+    """
+    Opens cipher text for reading.  Binary containers are mmap'ed, so piped input is
+    spooled to a temporary file first.
+
+    Args:
+         source (file): Binary file-like object.
+         cipher_format (string): "text" (one block per line) or "binary" (cipher_container).
+         scheme (string): Scheme given on the command line; containers record their own.
+         stack (list): Collects objects to close once the command is done.
+
+    Returns:
+        (iterable, string): The blocks and the scheme they were encrypted with.
+
+    """
+    if cipher_format == "text":
+        return read_blocks(source), scheme
+    try:
+        source.fileno()
+        seekable = source.seekable()
+    except (AttributeError, OSError, ValueError):
+        seekable = False
+    if not seekable:  # pipes cannot be mapped
+        spool = tempfile.TemporaryFile()
+        shutil.copyfileobj(source, spool)
+        spool.flush()
+        stack.append(spool)
+        source = spool
+    container = CipherContainer(source)
+    stack.append(container)
+    return iter(container), container.scheme
+
+
+def report(args, command, symbols, blocks, seconds, n):
+    """
+    Prints the throughput summary to stderr.
+    """
+    if args.quiet:
+        return
+    seconds = max(seconds, 1e-9)
+    print(f"{command}: {symbols} symbols, {blocks} blocks in {seconds:.3f} s "
+          f"({symbols / seconds:,.0f} symbols/s, {blocks / seconds:,.0f} blocks/s), "
+          f"n = {n.bit_length()} bits, {args.jobs} job(s)", file=sys.stderr)
+
+
+# =====================================================================================================================|
+# ===============================================SUBCOMMANDS===========================================================|
+# =====================================================================================================================|
+
+def run_keygen(args):
+    start = time.perf_counter()
+    n, e, key = generate_key_pair(args.bits, crt=True, exponent=args.exponent, processes=args.jobs)
+    write_key(args.public, {"n": n, "e": e})
+    write_key(args.private, {"n": n, "e": e, "d": key.d, "p": key.p, "q": key.q})
+    if not args.quiet:
+        print(f"keygen: {args.bits}-bit key pair in {time.perf_counter() - start:.3f} s, e = {e}", file=sys.stderr)
+    return 0
+
+
+def run_encrypt(args):
+    key = read_key(args.key)
+    n, e = key["n"], key["e"]
+    if args.format == "binary" and args.lines:
+        raise ValueError("--lines writes one text line per message, so it needs --format text")
+    apply, pool = exponentiator(n, e, "e", args.jobs)
+    opened = []
+    source, sink = open_input(args.input, opened), open_output(args.output, opened)
+    symbols = count = 0
+    start = time.perf_counter()
+    try:
+        if args.lines:  # every input line is a message of its own
+            for line in source:
+                message = line.rstrip(b"\r\n").decode("latin-1")
+                blocks = apply(message_blocks(message, n, args.scheme))
+                sink.write(" ".join(map(str, blocks)).encode("ascii") + b"\n")
+                symbols, count = symbols + len(message), count + len(blocks)
+        else:
+            totals = [0, 0]  # symbols read, blocks written
+
+            def blocks():
+                for consumed, chunk in encrypt_stream(source, n, apply, args.scheme):
+                    totals[0] += consumed
+                    totals[1] += len(chunk)
+                    yield from chunk
+
+            if args.format == "binary":
+                write_container(blocks(), sink, n, args.scheme)
+            else:
+                write_blocks(blocks(), sink)
+            symbols, count = totals
+        sink.flush()
+    finally:
+        for resource in reversed(opened):
+            resource.close()
+        if pool is not None:
+            pool.close()
+    report(args, "encrypt", symbols, count, time.perf_counter() - start, n)
+    return 0
+
+
+def run_decrypt(args):
+    key = read_key(args.key)
+    n = key["n"]
+    apply, pool = exponentiator(n, private_exponent(key), "d", args.jobs)
+    return decrypt_with(args, "decrypt", n, apply, pool)
+
+
+def decrypt_with(args, command, n, apply, pool=None):
+    """
+    Shared body of decrypt and break: reads cipher text, maps every block through apply and
+    writes the plain text.
+    """
+    opened = []
+    source, sink = open_input(args.input, opened), open_output(args.output, opened)
+    symbols = count = 0
+    start = time.perf_counter()
+    try:
+        if args.lines:
+            for line in source:
+                blocks = apply([int(block) for block in line.split()])
+                text = message_text(blocks, n, args.scheme)
+                write_plain(text, sink)
+                sink.write(b"\n")
+                symbols, count = symbols + len(text), count + len(blocks)
+        else:
+            blocks, scheme = cipher_blocks(source, args.format, args.scheme, opened)
+            for consumed, text in decrypt_stream(blocks, n, apply, scheme):
+                write_plain(text, sink)
+                symbols, count = symbols + len(text), count + consumed
+        sink.flush()
+    finally:
+        for resource in reversed(opened):  # containers before the files they map
+            resource.close()
+        if pool is not None:
+            pool.close()
+    report(args, command, symbols, count, time.perf_counter() - start, n)
+    return 0
+
+
+def run_break(args):
+    key = read_key(args.key)
+    n, e = key["n"], key["e"]
+    start = time.perf_counter()
+    if args.method == "codebook":  # ascii cipher text only: look every block up, no factoring unless a block is missing
+        return decrypt_with(args, "break", n, lambda blocks: CodeBreakers.codebook_blocks(n, e, blocks))
+    if args.method == "race":
+        factors = factor_race(n, timeout=args.timeout)
+    else:
+        factors = STRATEGIES[args.method](n)
+    if not factors:
+        raise ValueError(f"{args.method} could not factor n")
+    p, q = factors
+    if not args.quiet:
+        print(f"break: factored n = {p} * {q} with {args.method} in {time.perf_counter() - start:.3f} s",
+              file=sys.stderr)
+    apply, pool = exponentiator(n, RSA.find_crt_private_key(p, q, e), "d", args.jobs)
+    return decrypt_with(args, "break", n, apply, pool)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="main.py", description="RSA CryptoSystem command line.")
+    parser.add_argument("--quiet", action="store_true", help="do not print the summary to stderr")
+    parser.add_argument("--jobs", type=int, default=1, help="worker processes (default 1)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    keygen = commands.add_parser("keygen", help="generate a key pair")
+    keygen.add_argument("--bits", type=int, default=2048, help="bit length of n (default 2048)")
+    keygen.add_argument("--exponent", choices=RSA.EXPONENT_POLICIES, default="65537", help="how to pick e")
+    keygen.add_argument("--public", required=True, help="public key file to write")
+    keygen.add_argument("--private", required=True, help="private key file to write")
+    keygen.set_defaults(run=run_keygen)
+
+    for name, run, help_text in (("encrypt", run_encrypt, "encrypt stdin or a file with a public key"),
+                                 ("decrypt", run_decrypt, "decrypt stdin or a file with a private key"),
+                                 ("break", run_break, "decrypt with only the public key by factoring n")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("--key", required=True, help="key file written by keygen")
+        command.add_argument("--scheme", choices=list(SCHEMES), default="ascii",
+                             help="ascii (RSA), block or dense (RSA_block, letters only) or dense256 (bytes)")
+        command.add_argument("--format", choices=("text", "binary"), default="text",
+                             help="cipher text as one block per line, or as a binary container")
+        command.add_argument("--lines", action="store_true",
+                             help="treat every input line as a separate message (text format only)")
+        command.add_argument("input", nargs="?", default="-", help="input file (default stdin)")
+        command.add_argument("-o", "--output", default="-", help="output file (default stdout)")
+        command.set_defaults(run=run)
+        if name == "break":
+            command.add_argument("--method", choices=["codebook", "race", *STRATEGIES], default="rho",
+                                 help="codebook (ascii only), race (all strategies) or a single factoring method")
+            command.add_argument("--timeout", type=float, help="seconds to give --method race")
+    return parser
+
+
+def main(argv):
+    """
+    Runs one subcommand.
+
+    Args:
+         argv (list): Command line arguments, without the program name.
+
+    Returns:
+        int: Exit status.
+
+    """
+    args = build_parser().parse_args(argv)
+    if args.jobs < 1:
+        args.jobs = os.cpu_count() or 1
+    try:
+        return args.run(args)
+    except BrokenPipeError:  # e.g. piped into head; an OSError, so it has to be caught first
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())  # keep the exit flush from failing again
+        return 1
+    except (ValueError, KeyError, OSError) as error:
+        print(f"{args.command}: {error}", file=sys.stderr)
+        return 1
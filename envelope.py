@@ -0,0 +1,261 @@
+# Hybrid envelope encryption: RSA wraps a random session key once, and the payload is encrypted with a
+# SHAKE-256 keystream in counter mode, so large payloads run at hash speed instead of one modexp per block.
+#
+# Envelope layout:
+#   header | nonce | wrapped secret | payload XOR keystream | tag
+# header = magic, version, number of wrapped blocks (always 1), modulus bytes.  The wrapped secret is a random
+# x in [0, n) raised to e, modulus bytes wide, big-endian, and the session key is a hash of x (RSA-KEM).  A
+# short session key wrapped on its own would be far below n, and with a small e (3 under the "fermat" policy)
+# its e-th root over the integers would give it away.  The tag is a keyed BLAKE2b over everything before it.
+
+import hmac
+import io
+import secrets
+import struct
+from hashlib import blake2b, shake_256
+
+from RSA import decrypt_blocks, fme
+from cipher_container import modulus_bytes
+
+
+ENVELOPE_MAGIC = b"RSAE"
+ENVELOPE_HEADER = struct.Struct(">4sBxHI")  # magic, version, wrapped blocks, modulus bytes
+ENVELOPE_VERSION = 2
+
+SESSION_KEY_SIZE = 32
+NONCE_SIZE = 16
+TAG_SIZE = 32
+
+# Keystream block i is SHAKE-256(stream key | nonce | i) squeezed to KEYSTREAM_BLOCK bytes.
+KEYSTREAM_BLOCK = 1 << 16
+
+# Payload bytes processed per step; a multiple of KEYSTREAM_BLOCK.
+ENVELOPE_CHUNK_SIZE = 1 << 20
+
+
+def wrap_secret(n, e):
+    """
+    Draws the random secret x and wraps it.  x is redrawn until x^e clearly exceeds n, so the wrapped
+    value is always reduced mod n and x cannot be recovered by an e-th root over the integers.
+
+    Returns:
+        (bytes, int): Session key derived from x, and x^e mod n.
+
+    """
+    while True:
+        x = secrets.randbelow(n)
+        if (x.bit_length() - 1) * e >= n.bit_length():  # x >= 2^(bits - 1), so x^e >= 2^((bits - 1) e) >= n
+            return session_key(n, x), fme(x, e, n)
+
+
+def session_key(n, x):
+    """
+    Session key for the wrapped secret x: BLAKE2b over x at the full width of n.
+    """
+    return blake2b(x.to_bytes(modulus_bytes(n), "big"), digest_size=SESSION_KEY_SIZE, person=b"rsa-env-kem").digest()
+
+
+def derive_keys(session_key):
+    """
+    Splits a session key into independent keystream and MAC keys.
+
+    Returns:
+        (bytes, bytes): Stream key, MAC key.
+
+    """
+    stream_key = blake2b(session_key, digest_size=32, person=b"rsa-env-stream").digest()
+    mac_key = blake2b(session_key, digest_size=32, person=b"rsa-env-mac").digest()
+    return stream_key, mac_key
+
+
+def keystream(stream_key, nonce, start, length):
+    """
+    Keystream bytes [start, start + length).  start must be a multiple of KEYSTREAM_BLOCK.
+    """
+    first = start // KEYSTREAM_BLOCK
+    blocks = -(-length // KEYSTREAM_BLOCK)
+    stream = b"".join([shake_256(stream_key + nonce + counter.to_bytes(8, "big")).digest(KEYSTREAM_BLOCK)
+                       for counter in range(first, first + blocks)])
+    return stream[:length]
+
+
+def xor_keystream(view, out, stream_key, nonce, position):
+    """
+    XORs a chunk with the keystream at position, writing into the preallocated out buffer.
+    The XOR runs on two big integers, which is far faster than a byte loop.
+
+    Returns:
+        memoryview: The result, a slice of out.
+
+    """
+    length = len(view)
+    stream = keystream(stream_key, nonce, position, length)
+    out[:length] = (int.from_bytes(view, "little") ^ int.from_bytes(stream, "little")).to_bytes(length, "little")
+    return memoryview(out)[:length]
+
+
+def _read_exactly(source, size):
+    data = source.read(size)
+    if len(data) != size:
+        raise ValueError("Envelope is truncated")
+    return data
+
+
+def _fill(source, view):
+    """
+    Reads into view until it is full or the source ends.
+
+    Returns:
+        int: Bytes read.
+
+    """
+    filled = 0
+    while filled < len(view):
+        read = source.readinto(view[filled:])
+        if not read:
+            break
+        filled += read
+    return filled
+
+
+# =====================================================================================================================|
+# ===============================================ENVELOPE FUNCTIONS====================================================|
+# =====================================================================================================================|
+
+def encode_file(n, e, source, sink, chunk_size=ENVELOPE_CHUNK_SIZE):
+    """
+    Encrypts a binary file-like object into an envelope, in constant memory.
+
+    Arguments:
+        n (int): Public key token n.
+        e (int): Public key token e.
+        source (file): Binary file-like object holding the payload.
+        sink (file): Binary file-like object the envelope is written to.
+        chunk_size (int): Payload bytes per step, rounded up to a multiple of KEYSTREAM_BLOCK.
+
+    Returns:
+        int: Payload bytes encrypted.
+    """
+    chunk_size = -(-chunk_size // KEYSTREAM_BLOCK) * KEYSTREAM_BLOCK
+    key, wrapped = wrap_secret(n, e)  # the only RSA operation in the envelope
+    nonce = secrets.token_bytes(NONCE_SIZE)
+    stream_key, mac_key = derive_keys(key)
+    width = modulus_bytes(n)
+    head = b"".join([ENVELOPE_HEADER.pack(ENVELOPE_MAGIC, ENVELOPE_VERSION, 1, width), nonce,
+                     wrapped.to_bytes(width, "big")])
+    mac = blake2b(key=mac_key, digest_size=TAG_SIZE)
+    mac.update(head)
+    sink.write(head)
+
+    buffer, out = bytearray(chunk_size), bytearray(chunk_size)
+    view = memoryview(buffer)
+    position = 0
+    while True:
+        read = _fill(source, view)
+        if not read:
+            break
+        chunk = xor_keystream(view[:read], out, stream_key, nonce, position)
+        mac.update(chunk)
+        sink.write(chunk)
+        position += read
+    sink.write(mac.digest())
+    return position
+
+
+def decode_file(n, d, source, sink, chunk_size=ENVELOPE_CHUNK_SIZE):
+    """
+    Decrypts an envelope written by encode_file, in constant memory.  Plain text is written as it
+    is decrypted, and the tag can only be checked at the end, so on ValueError the output must be
+    discarded.
+
+    Arguments:
+        n (int): Public key token n.
+        d (int or CRTPrivateKey): Private key token d.
+        source (file): Binary file-like object holding the envelope.
+        sink (file): Binary file-like object the payload is written to.
+        chunk_size (int): Payload bytes per step, rounded up to a multiple of KEYSTREAM_BLOCK.
+
+    Returns:
+        int: Payload bytes decrypted.
+
+    Raises:
+        ValueError: if the envelope is malformed, truncated, for another key or has been modified.
+    """
+    chunk_size = -(-chunk_size // KEYSTREAM_BLOCK) * KEYSTREAM_BLOCK
+    header = _read_exactly(source, ENVELOPE_HEADER.size)
+    magic, version, count, width = ENVELOPE_HEADER.unpack(header)
+    if magic != ENVELOPE_MAGIC or version != ENVELOPE_VERSION:
+        raise ValueError(f"Not a version {ENVELOPE_VERSION} envelope")
+    if width != modulus_bytes(n):
+        raise ValueError(f"Envelope was made for a {8 * width}-bit key, not this {n.bit_length()}-bit one")
+    nonce = _read_exactly(source, NONCE_SIZE)
+    if count != 1:
+        raise ValueError(f"Envelope holds {count} wrapped blocks, not 1")
+    wrapped_bytes = _read_exactly(source, width)
+    wrapped = int.from_bytes(wrapped_bytes, "big")
+    if wrapped >= n:
+        raise ValueError("Envelope session key does not decrypt with this key")
+    stream_key, mac_key = derive_keys(session_key(n, decrypt_blocks(n, d, [wrapped])[0]))  # wrong key: tag mismatch
+    mac = blake2b(key=mac_key, digest_size=TAG_SIZE)
+    mac.update(header + nonce + wrapped_bytes)
+
+    # The last TAG_SIZE bytes are the tag, so up to KEYSTREAM_BLOCK + TAG_SIZE bytes are held back
+    # until the next read shows whether the input has ended.
+    buffer, out = bytearray(chunk_size + KEYSTREAM_BLOCK + TAG_SIZE), bytearray(chunk_size + KEYSTREAM_BLOCK)
+    view = memoryview(buffer)
+    held = position = 0
+    while True:
+        read = _fill(source, view[held:])
+        total = held + read
+        ended = held + read < len(buffer)
+        ready = total - TAG_SIZE if ended else (total - TAG_SIZE) // KEYSTREAM_BLOCK * KEYSTREAM_BLOCK
+        if ready < 0:
+            raise ValueError("Envelope is truncated")
+        if ready:
+            mac.update(view[:ready])
+            sink.write(xor_keystream(view[:ready], out, stream_key, nonce, position))
+            position += ready
+        buffer[:total - ready] = buffer[ready:total]  # carry the held-back bytes to the front
+        held = total - ready
+        if ended:
+            break
+    if not hmac.compare_digest(mac.digest(), bytes(buffer[:TAG_SIZE])):
+        raise ValueError("Envelope tag does not match: wrong key or modified data")
+    return position
+
+
+def encode(n, e, data):
+    """
+    Encrypts bytes into an envelope.
+
+    Arguments:
+        n (int): Public key token n.
+        e (int): Public key token e.
+        data (bytes): Payload.
+
+    Returns:
+        bytes: The envelope.
+    """
+    sink = io.BytesIO()
+    encode_file(n, e, io.BytesIO(data), sink)
+    return sink.getvalue()
+
+
+def decode(n, d, envelope):
+    """
+    Decrypts an envelope made by encode.
+
+    Arguments:
+        n (int): Public key token n.
+        d (int or CRTPrivateKey): Private key token d.
+        envelope (bytes): The envelope.
+
+    Returns:
+        bytes: The payload.
+
+    Raises:
+        ValueError: if the envelope is malformed, for another key or has been modified.
+    """
+    sink = io.BytesIO()
+    decode_file(n, d, io.BytesIO(envelope), sink)
+    return sink.getvalue()
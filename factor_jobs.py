@@ -0,0 +1,314 @@
+# Resumable sharded factoring jobs: the trial division range (or the rho seed space) is split into shards that
+# local worker processes pull from a shared queue.  Idle workers steal the second half of the largest shard still
+# running, progress is checkpointed to a small JSON state file, and a restarted job resumes from the checkpoint.
+# Usage: python factor_jobs.py N [--method trial|rho] [--state job.json] [--workers 4] [--timeout SECONDS]
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+from math import isqrt
+from multiprocessing import get_context
+from queue import Empty
+
+from CodeBreakers import rho_factorize
+
+
+logger = logging.getLogger(__name__)
+
+METHODS = ("trial", "rho")
+STATE_VERSION = 1
+
+# Shards created per worker, so faster workers pick up more of them.
+SHARDS_PER_WORKER = 8
+
+# Trial division candidates tested between progress reports (and checks for a stolen range).
+TRIAL_STEP = 1 << 16
+
+# A running shard is only split when more than this many candidates (or seeds) are left.
+MIN_STEAL = 2 * TRIAL_STEP
+
+# Rho seeds in a new job, and iterations each seed is given before moving on to the next one.
+RHO_SEEDS = 1 << 12
+RHO_SEED_ITERATIONS = 1 << 16
+
+# Seconds between checkpoints.
+CHECKPOINT_INTERVAL = 5.0
+
+
+# =====================================================================================================================|
+# ===============================================SHARD WORK============================================================|
+# =====================================================================================================================|
+
+def trial_division_range(n, start, stop):
+    """
+    Tests the candidates 2, 3 and 6k +- 1 in [start, stop) as divisors of n.
+
+    Returns:
+        int: A factor found in the range, or None.
+
+    """
+    stop = min(stop, isqrt(n) + 1)  # nothing above sqrt(n) needs testing, and n itself is no factor
+    for small in (2, 3):
+        if start <= small < stop and n % small == 0:
+            return small
+    for first in (max(5, start + (5 - start) % 6), max(7, start + (1 - start) % 6)):  # 6k + 5, then 6k + 1
+        for candidate in range(first, stop, 6):
+            if n % candidate == 0:
+                return candidate
+    return None
+
+
+def rho_seed(n, seed):
+    """
+    One repeatable Pollard-Brent rho attempt with the polynomial chosen by seed.
+
+    Returns:
+        int: A non-trivial factor, or None.
+
+    """
+    factors = rho_factorize(n, max_iterations=RHO_SEED_ITERATIONS, rng=random.Random(seed))
+    return factors[0] if factors else None
+
+
+def _job_worker(index, n, method, tasks, events, stops, owners, lock):
+    """
+    Pulls shards until it gets None.  Progress is reported after every step; before each step the
+    worker re-reads its stop bound, which the coordinator lowers when it steals the rest of the shard.
+    """
+    step = TRIAL_STEP if method == "trial" else 1
+    while True:
+        events.put(("idle", index))
+        task = tasks.get()
+        if task is None:
+            return
+        shard_id, position, stop = task
+        with lock:
+            owners[index], stops[index] = shard_id, stop
+        events.put(("start", index, shard_id))
+        while True:
+            with lock:
+                stop = stops[index]
+            if position >= stop:
+                break
+            end = min(position + step, stop)
+            factor = trial_division_range(n, position, end) if method == "trial" else rho_seed(n, position)
+            if factor:
+                events.put(("found", index, shard_id, factor))
+                return
+            position = end
+            events.put(("progress", index, shard_id, position))
+        with lock:
+            owners[index] = -1
+        events.put(("done", index, shard_id, position))
+
+
+# =====================================================================================================================|
+# ===============================================JOB RUNNER============================================================|
+# =====================================================================================================================|
+
+class FactorJob:
+    """
+    A sharded factoring job for n that can be stopped and resumed.
+
+    Arguments:
+        n (int): Composite integer to factor.
+        method (string): "trial" (shards of the divisor range up to sqrt(n)) or "rho" (shards of rho seeds).
+        state_path (string): JSON state file.  When it exists for the same n and method the job resumes from it.
+            None runs without checkpoints.
+        workers (int): Worker processes.  Defaults to the number of CPUs.
+        checkpoint_interval (float): Seconds between checkpoints.
+    """
+
+    def __init__(self, n, method="trial", state_path=None, workers=None, checkpoint_interval=CHECKPOINT_INTERVAL):
+        if method not in METHODS:
+            raise ValueError(f"Unknown factoring method: {method}")
+        if method == "trial" and isqrt(n) >= 1 << 63:
+            raise ValueError("Trial division shards need sqrt(n) < 2^63")
+        self.n = n
+        self.method = method
+        self.state_path = state_path
+        self.workers = workers or os.cpu_count() or 1
+        self.checkpoint_interval = checkpoint_interval
+        self.state = self._load_state() or self._new_state()
+
+    def _new_state(self):
+        stop = isqrt(self.n) + 1 if self.method == "trial" else RHO_SEEDS
+        start = 2 if self.method == "trial" else 0
+        count = self.workers * SHARDS_PER_WORKER
+        size = max(1, -(-(stop - start) // count))
+        shards = [{"start": low, "stop": min(low + size, stop), "position": low} for low in range(start, stop, size)]
+        return {"version": STATE_VERSION, "n": self.n, "method": self.method, "factor": None, "shards": shards}
+
+    def _load_state(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return None
+        with open(self.state_path) as state_file:
+            state = json.load(state_file)
+        if state.get("version") != STATE_VERSION or state.get("n") != self.n or state.get("method") != self.method:
+            logger.warning("Ignoring %s: it belongs to another job", self.state_path)
+            return None
+        logger.info("Resuming from %s", self.state_path)
+        return state
+
+    def checkpoint(self):
+        """
+        Writes the state file atomically: to a temporary name, then moved into place.
+        """
+        if not self.state_path:
+            return
+        temp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as state_file:
+            json.dump(self.state, state_file)
+        os.replace(temp_path, self.state_path)
+
+    def progress(self):
+        """
+        Returns the fraction of the candidate range (or seed space) already searched.
+        """
+        shards = self.state["shards"]
+        total = sum(shard["stop"] - shard["start"] for shard in shards)
+        searched = sum(min(shard["position"], shard["stop"]) - shard["start"] for shard in shards)
+        return searched / total if total else 1.0
+
+    def _steal(self, running, stops, owners, lock, tasks):
+        """
+        Splits the running shard with the most work left and queues its second half.
+
+        Returns:
+            bool: Whether a shard was split.
+
+        """
+        shards = self.state["shards"]
+        candidates = [(shards[shard_id]["stop"] - shards[shard_id]["position"], worker, shard_id)
+                      for worker, shard_id in running.items()]
+        if not candidates:
+            return False
+        remaining, worker, shard_id = max(candidates)
+        if remaining <= (MIN_STEAL if self.method == "trial" else 1):
+            return False
+        shard = shards[shard_id]
+        middle = shard["position"] + remaining // 2
+        with lock:
+            if owners[worker] != shard_id:  # the worker has just finished it
+                return False
+            stops[worker] = middle
+        shards.append({"start": middle, "stop": shard["stop"], "position": middle})
+        shard["stop"] = middle
+        tasks.put((len(shards) - 1, middle, shards[-1]["stop"]))
+        logger.debug("Split shard %d at %d", shard_id, middle)
+        return True
+
+    def run(self, timeout=None):
+        """
+        Runs (or resumes) the job until a factor is found, the search space is exhausted or the timeout passes.
+        All workers are stopped as soon as any shard finds a factor, and the state is checkpointed on the way out,
+        including on KeyboardInterrupt.
+
+        Args:
+             timeout (float): Seconds to run before checkpointing and returning None.
+
+        Returns:
+            (int, int): The factors of n, or None.
+
+        """
+        if self.state["factor"]:
+            return self.state["factor"], self.n // self.state["factor"]
+        shards = self.state["shards"]
+        pending = [shard_id for shard_id, shard in enumerate(shards) if shard["position"] < shard["stop"]]
+        if not pending:
+            return None
+        context = get_context()
+        tasks, events, lock = context.Queue(), context.Queue(), context.Lock()
+        stops = context.Array("q", self.workers, lock=False)
+        owners = context.Array("q", [-1] * self.workers, lock=False)
+        for shard_id in pending:
+            tasks.put((shard_id, shards[shard_id]["position"], shards[shard_id]["stop"]))
+        queued = len(pending)
+        running = {}  # worker -> shard ID
+        idle = set()
+        processes = [context.Process(target=_job_worker, daemon=True,
+                                     args=(index, self.n, self.method, tasks, events, stops, owners, lock))
+                     for index in range(self.workers)]
+        for process in processes:
+            process.start()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        next_checkpoint = time.monotonic() + self.checkpoint_interval
+        try:
+            while queued or running:
+                now = time.monotonic()
+                if deadline is not None and now >= deadline:
+                    logger.info("Stopping after %.1fs at %.1f%% searched", timeout, 100 * self.progress())
+                    return None
+                if now >= next_checkpoint:
+                    self.checkpoint()
+                    next_checkpoint = now + self.checkpoint_interval
+                wait = next_checkpoint - now if deadline is None else min(next_checkpoint, deadline) - now
+                try:
+                    event = events.get(timeout=max(0.0, wait))
+                except Empty:
+                    continue
+                if event[0] == "idle":
+                    idle.add(event[1])
+                elif event[0] == "start":
+                    idle.discard(event[1])
+                    running[event[1]] = event[2]
+                    queued -= 1
+                elif event[0] == "progress":
+                    shard = shards[event[2]]
+                    shard["position"] = max(shard["position"], event[3])
+                elif event[0] == "done":
+                    running.pop(event[1], None)
+                    shard = shards[event[2]]
+                    shard["position"] = max(shard["position"], event[3])
+                elif event[0] == "found":
+                    self.state["factor"] = event[3]
+                    logger.info("Shard %d found %d", event[2], event[3])
+                    return event[3], self.n // event[3]
+                while len(idle) > queued and self._steal(running, stops, owners, lock, tasks):
+                    queued += 1
+            return None  # every shard searched without a factor
+        finally:
+            for process in processes:  # cancel every worker still searching
+                if process.is_alive():
+                    process.terminate()
+            for process in processes:
+                process.join()
+            self.checkpoint()
+
+
+def factor_sharded(n, method="trial", state_path=None, workers=None, timeout=None):
+    """
+    Factors n with a FactorJob, in the (p, q) form the other factoring functions use, so it can be passed to
+    CodeBreakers.break_code_improved as factor_function.
+
+    Returns:
+        (int, int): The factors of n, or None.
+
+    """
+    return FactorJob(n, method, state_path, workers).run(timeout)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Resumable sharded factoring job.")
+    parser.add_argument("n", type=int)
+    parser.add_argument("--method", choices=METHODS, default="trial")
+    parser.add_argument("--state", help="checkpoint file; rerun with the same file to resume")
+    parser.add_argument("--workers", type=int, help="worker processes (default: number of CPUs)")
+    parser.add_argument("--timeout", type=float, help="seconds to run before checkpointing and stopping")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    job = FactorJob(args.n, args.method, args.state, args.workers)
+    factors = job.run(args.timeout)
+    if factors is None:
+        print(f"No factor found ({100 * job.progress():.1f}% searched)")
+        return 1
+    print(f"{args.n} = {factors[0]} * {factors[1]}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
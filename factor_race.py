@@ -0,0 +1,104 @@
+# Factoring portfolio: races several factoring strategies in parallel processes and keeps the first answer.
+
+import logging
+import time
+from multiprocessing import get_context
+from queue import Empty
+
+import quadratic_sieve
+from CodeBreakers import ecm_factor, factor_trial, fermat_factor, pollard_pm1, rho_factorize
+from primes import is_probable_prime
+
+
+logger = logging.getLogger(__name__)
+
+# Strategy name -> function taking n and returning (p, q) or None.
+# Trial division wins on small factors, Fermat on close primes, p-1 on smooth p - 1,
+# rho on mid-size factors, ECM on larger ones and the quadratic sieve on balanced 60-100 bit moduli.
+STRATEGIES = {
+    "trial": factor_trial,
+    "fermat": fermat_factor,
+    "pminus1": pollard_pm1,
+    "rho": rho_factorize,
+    "ecm": ecm_factor,
+}
+if quadratic_sieve.np is not None:  # the quadratic sieve needs NumPy
+    STRATEGIES["qs"] = quadratic_sieve.factor_qs
+
+
+def _race_worker(name, n, results):
+    """
+    Runs one strategy in a worker process and reports (name, factors, seconds) on the results queue.
+    """
+    start = time.perf_counter()
+    try:
+        factors = STRATEGIES[name](n)
+    except Exception:  # a failing strategy must not stall the race
+        logger.exception("Strategy %s failed on %d", name, n)
+        factors = None
+    results.put((name, factors, time.perf_counter() - start))
+
+
+def race_factors(n, strategies=None, timeout=None):
+    """
+    Starts every strategy in its own process and returns the first non-trivial factorization.
+    The remaining workers are terminated as soon as one succeeds.
+
+    Args:
+         n (int): Composite integer to factor.
+         strategies (list): Names from STRATEGIES.  Defaults to all of them.
+         timeout (float): Longest time to wait, in seconds.  None waits until every strategy has finished.
+
+    Returns:
+        (int, int, string, float): p, q, the winning strategy and its time in seconds,
+        or None if no strategy succeeded (or n is prime).
+
+    """
+    if n < 4 or is_probable_prime(n):
+        return None
+    names = list(strategies or STRATEGIES)
+    context = get_context()
+    results = context.Queue()
+    workers = [context.Process(target=_race_worker, args=(name, n, results), daemon=True) for name in names]
+    for worker in workers:
+        worker.start()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    winner = None
+    try:
+        for _ in names:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                name, factors, seconds = results.get(timeout=remaining)
+            except Empty:
+                logger.info("No strategy factored %d within %.3fs", n, timeout)
+                break
+            if factors and 1 < factors[0] < n:
+                winner = factors[0], factors[1], name, seconds
+                logger.info("%s factored %d in %.3fs", name, n, seconds)
+                break
+            logger.debug("%s gave up on %d after %.3fs", name, n, seconds)
+    finally:
+        for worker in workers:  # cancel everyone still running
+            if worker.is_alive():
+                worker.terminate()
+        for worker in workers:
+            worker.join()
+    return winner
+
+
+def factor_race(n, strategies=None, timeout=None):
+    """
+    Factors n with race_factors, in the (p, q) form the other factoring functions use, so it can be
+    passed to CodeBreakers.break_code_improved as factor_function.
+
+    Args:
+         n (int): Composite integer to factor.
+         strategies (list): Names from STRATEGIES.  Defaults to all of them.
+         timeout (float): Longest time to wait, in seconds.
+
+    Returns:
+        (int, int): The factors of n, or None if no strategy succeeded.
+
+    """
+    result = race_factors(n, strategies, timeout)
+    return None if result is None else result[:2]
@@ -0,0 +1,230 @@
+# Opt-in instrumentation: wall time per pipeline stage and operation counters, exported as JSON or Prometheus text.
+# Off by default.  Hot paths only test the module-level flag `enabled`, so the cost when off is one attribute lookup.
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+
+enabled = False
+
+# Counters recorded by the instrumented code.
+MODEXP_CALLS = "modexp_calls"
+MODULAR_SQUARINGS = "modular_squarings"
+MODULAR_MULTIPLICATIONS = "modular_multiplications"
+GCD_ITERATIONS = "gcd_iterations"
+FACTOR_CANDIDATES = "factor_candidates"
+
+PROMETHEUS_PREFIX = "rsa_"
+
+
+class Metrics:
+    """
+    Counters and stage timers collected while instrumentation is on.  Safe to update from several threads.
+
+    Attributes:
+        counters (dict): Counter name -> count.
+        stages (dict): Stage name -> [calls, total seconds].
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            totals = self.stages.setdefault(name, [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.stages.clear()
+
+    def snapshot(self):
+        """
+        Copies the current values.
+
+        Returns:
+            dict: {"counters": {name: count}, "stages": {name: {"calls": int, "seconds": float}}}.
+
+        """
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "stages": {name: {"calls": calls, "seconds": seconds} for name, (calls, seconds) in self.stages.items()},
+            }
+
+    def to_json(self, **kwargs):
+        """
+        Returns the snapshot as a JSON document.  Keyword arguments go to json.dumps.
+        """
+        return json.dumps(self.snapshot(), sort_keys=True, **kwargs)
+
+    def to_prometheus(self, prefix=PROMETHEUS_PREFIX):
+        """
+        Returns the snapshot in the Prometheus text exposition format.
+
+        Args:
+             prefix (string): Prefix for every metric name.
+
+        Returns:
+            string: One sample per line, ending with a newline.
+
+        """
+        values = self.snapshot()
+        lines = [
+            f"# HELP {prefix}operations_total Operations counted while instrumentation was on.",
+            f"# TYPE {prefix}operations_total counter",
+        ]
+        lines += [f'{prefix}operations_total{{operation="{name}"}} {count}'
+                  for name, count in sorted(values["counters"].items())]
+        lines += [
+            f"# HELP {prefix}stage_seconds_total Wall time spent in each pipeline stage.",
+            f"# TYPE {prefix}stage_seconds_total counter",
+        ]
+        lines += [f'{prefix}stage_seconds_total{{stage="{name}"}} {totals["seconds"]!r}'
+                  for name, totals in sorted(values["stages"].items())]
+        lines += [
+            f"# HELP {prefix}stage_calls_total Number of times each pipeline stage ran.",
+            f"# TYPE {prefix}stage_calls_total counter",
+        ]
+        lines += [f'{prefix}stage_calls_total{{stage="{name}"}} {totals["calls"]}'
+                  for name, totals in sorted(values["stages"].items())]
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()  # the process-wide collector
+
+
+# =====================================================================================================================|
+# ===============================================RECORDING FUNCTIONS===================================================|
+# =====================================================================================================================|
+
+class _Stage:
+    """
+    Times one run of a stage and adds it to the collector.
+    """
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        metrics.add_time(self.name, time.perf_counter() - self.start)
+
+
+class _NullStage:
+    """
+    Stand-in returned by stage while instrumentation is off.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name):
+    """
+    Context manager timing a pipeline stage, e.g. `with stage("block.decode.fme"): ...`.
+    Does nothing while instrumentation is off.
+    """
+    return _Stage(name) if enabled else _NULL_STAGE
+
+
+def count(name, amount=1):
+    """
+    Adds amount to a counter while instrumentation is on.
+    """
+    if enabled:
+        metrics.count(name, amount)
+
+
+def count_modexp(exponent, calls=1):
+    """
+    Records calls exponentiations to the given exponent, counting squarings and multiplications
+    as the square-and-multiply method does them (one squaring per bit after the first, one
+    multiplication per further set bit).  The backends in modexp trade some of these for
+    precomputation, but the counts stay comparable between exponents and keys.
+    """
+    if enabled and exponent > 0:
+        metrics.count(MODEXP_CALLS, calls)
+        metrics.count(MODULAR_SQUARINGS, (exponent.bit_length() - 1) * calls)
+        metrics.count(MODULAR_MULTIPLICATIONS, (exponent.bit_count() - 1) * calls)
+
+
+# =====================================================================================================================|
+# ===============================================CONTROL FUNCTIONS=====================================================|
+# =====================================================================================================================|
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    metrics.reset()
+
+
+def snapshot():
+    """
+    Copies the values collected so far.  See Metrics.snapshot.
+    """
+    return metrics.snapshot()
+
+
+def to_json(**kwargs):
+    return metrics.to_json(**kwargs)
+
+
+def to_prometheus(prefix=PROMETHEUS_PREFIX):
+    return metrics.to_prometheus(prefix)
+
+
+@contextmanager
+def instrumented(reset_metrics=True):
+    """
+    Turns instrumentation on for the body of a with statement, then restores the previous state.
+
+        with instrumented() as collected:
+            RSA_block.decode(n, d, cipher_text)
+        print(collected.to_prometheus())
+
+    Args:
+         reset_metrics (bool): Clear values left by earlier runs first.
+
+    Yields:
+        Metrics: The process-wide collector.
+
+    """
+    global enabled
+    previous = enabled
+    if reset_metrics:
+        metrics.reset()
+    enabled = True
+    try:
+        yield metrics
+    finally:
+        enabled = previous
@@ -0,0 +1,171 @@
+# Background pool of pre-generated key pairs for low-latency key issuance.
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from queue import Empty
+
+from primes import generate_key_pair
+
+
+class KeyPool:
+    """
+    Keeps a stock of key pairs generated ahead of time by background workers.
+
+    Workers start refilling once the pool drops below low_water and keep going until it
+    reaches high_water.  get() hands out a pooled key pair without generating one.
+
+    Arguments:
+        bits (int): Bit length of n for the default factory.
+        high_water (int): Pool size at which refilling stops.
+        low_water (int): Pool size below which refilling starts.
+        workers (int): Number of background workers.
+        processes (bool): Generate keys in worker processes instead of threads, so workers run on separate cores.
+        factory (callable): Returns one (n, e, d) key pair.  Defaults to generate_key_pair(bits, crt=True).
+            Must be picklable when processes is True.
+    """
+
+    def __init__(self, bits=2048, high_water=16, low_water=4, workers=1, processes=False, factory=None):
+        if not 0 <= low_water <= high_water or high_water < 1:
+            raise ValueError("KeyPool needs 0 <= low_water <= high_water and high_water >= 1")
+        self.high_water = high_water
+        self.low_water = low_water
+        self.factory = factory or partial(generate_key_pair, bits, True)
+        self._keys = deque()
+        self._lock = threading.Condition()
+        self._refilling = True  # fill up to high_water on start
+        self._closed = False
+        self._executor = ProcessPoolExecutor(workers) if processes else None
+        self._requests = 0
+        self._hits = 0
+        self._starvations = 0
+        self._generated = 0
+        self._failures = 0
+        self._error = None  # last factory exception, raised by the next get() that finds the pool empty
+        self._generation_seconds = 0.0
+        self._started = time.monotonic()
+        self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._keys)
+
+    def _work(self):
+        """
+        Worker loop: sleeps until a refill is needed, then generates key pairs.  A factory error is
+        recorded for get() to raise and refilling pauses until the next request, so a failing factory
+        neither kills the worker nor spins.
+        """
+        while True:
+            with self._lock:
+                while not self._closed and not self._refilling:
+                    self._lock.wait()
+                if self._closed:
+                    return
+            start = time.monotonic()
+            try:
+                if self._executor is None:
+                    key_pair = self.factory()
+                else:
+                    key_pair = self._executor.submit(self.factory).result()
+            except Exception as error:
+                with self._lock:
+                    if self._closed:  # the executor was shut down under us
+                        return
+                    self._failures += 1
+                    self._error = error
+                    self._refilling = False
+                    self._lock.notify_all()  # wake any get() waiting on an empty pool
+                continue
+            elapsed = time.monotonic() - start
+            with self._lock:
+                self._generated += 1
+                self._generation_seconds += elapsed
+                if len(self._keys) < self.high_water:
+                    self._keys.append(key_pair)
+                if len(self._keys) >= self.high_water:
+                    self._refilling = False
+                self._lock.notify_all()  # wake any get() waiting on an empty pool
+
+    def get(self, block=True, timeout=None):
+        """
+        Takes a key pair from the pool.
+
+        Arguments:
+            block (bool): Wait for a worker when the pool is empty.
+            timeout (float): Longest time to wait, in seconds.  None waits forever.
+
+        Returns:
+            (int, int, int): Public key token n, public key token e, private key token d.
+
+        Raises:
+            queue.Empty: if no key pair became available in time.
+            Exception: whatever the factory raised, when the pool is empty because generation failed.
+                The next call tries again.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self._requests += 1
+            if self._keys:
+                self._hits += 1
+            else:
+                self._starvations += 1
+                self._refilling = True
+                self._lock.notify_all()
+            while not self._keys:
+                if self._error is not None:
+                    error, self._error = self._error, None
+                    raise error
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if not block or self._closed or (remaining is not None and remaining <= 0):
+                    raise Empty("KeyPool is empty")
+                self._lock.wait(remaining)
+            key_pair = self._keys.popleft()
+            if len(self._keys) < self.low_water and not self._refilling:
+                self._refilling = True
+                self._lock.notify_all()
+            return key_pair
+
+    def metrics(self):
+        """
+        Reports how well the pool keeps up with demand.
+
+        Returns:
+            dict: size, requests, hits, hit_rate, starvations, generated, failures (factory errors),
+            refill_rate (key pairs per second of generation work), generation_seconds and uptime_seconds.
+        """
+        with self._lock:
+            return {
+                "size": len(self._keys),
+                "requests": self._requests,
+                "hits": self._hits,
+                "hit_rate": self._hits / self._requests if self._requests else 1.0,
+                "starvations": self._starvations,
+                "generated": self._generated,
+                "failures": self._failures,
+                "refill_rate": self._generated / self._generation_seconds if self._generation_seconds else 0.0,
+                "generation_seconds": self._generation_seconds,
+                "uptime_seconds": time.monotonic() - self._started,
+            }
+
+    def close(self):
+        """
+        Stops the workers.  Key pairs still in the pool stay available to get().
+        """
+        with self._lock:
+            self._closed = True
+            self._lock.notify_all()
+        for worker in self._workers:
+            worker.join()
+        if self._executor is not None:
+            self._executor.shutdown()
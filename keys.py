@@ -0,0 +1,143 @@
+# Key objects: compact replacements for loose (n, e, d) tuples, with the values decryption needs precomputed.
+
+from hashlib import sha256
+
+from RSA import extended_euclid, find_private_key
+from cipher_container import modulus_bytes
+
+
+def key_id(n, e):
+    """
+    64-bit identifier of a public key: the first 8 bytes of SHA-256 over n and e.
+
+    Args:
+         n (int): Public key token n.
+         e (int): Public key token e.
+
+    Returns:
+        int: The key ID.
+
+    """
+    size = modulus_bytes(n)
+    digest = sha256(n.to_bytes(size, "big") + e.to_bytes(max(1, modulus_bytes(e)), "big")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+class PublicKey:
+    """
+    An RSA public key.  Unpacks like the (n, e) pair: `n, e = key`.
+
+    Attributes:
+        n (int): Public key token n.
+        e (int): Public key token e.
+        size (int): Bytes per block, i.e. the byte length of n.
+        key_id (int): 64-bit identifier, see key_id.
+    """
+    __slots__ = ("n", "e", "size", "key_id")
+
+    def __init__(self, n, e):
+        self.n = n
+        self.e = e
+        self.size = modulus_bytes(n)
+        self.key_id = key_id(n, e)
+
+    def __iter__(self):
+        return iter((self.n, self.e))
+
+    def __eq__(self, other):
+        return isinstance(other, PublicKey) and (self.n, self.e) == (other.n, other.e)
+
+    def __hash__(self):
+        return self.key_id
+
+    def __repr__(self):
+        return f"PublicKey(key_id={self.key_id:016x}, bits={self.n.bit_length()}, e={self.e})"
+
+    def __getstate__(self):
+        return self.n, self.e
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def to_dict(self):
+        """
+        Key tokens for a JSON key file (the format cli.py reads).
+        """
+        return {"n": self.n, "e": self.e}
+
+
+class PrivateKey:
+    """
+    An RSA private key with its CRT values precomputed.  It has the fields of RSA.CRTPrivateKey,
+    so it can be passed as d to RSA.decode, RSA_block.decode and ParallelCipher.
+    Unpacks like the (n, e, d) triple: `n, e, d = key`.
+
+    Attributes:
+        n, e, d (int): The key tokens.
+        p, q (int): The primes, with p * q = n.
+        dp, dq (int): d reduced mod p - 1 and q - 1.
+        q_inv (int): Inverse of q mod p.
+        key_id (int): ID of the matching public key.
+    """
+    __slots__ = ("n", "e", "d", "p", "q", "dp", "dq", "q_inv", "key_id")
+
+    def __init__(self, p, q, e, d=None):
+        self.p = p
+        self.q = q
+        self.n = p * q
+        self.e = e
+        self.d = find_private_key(p, q, e) if d is None else d
+        self.dp = self.d % (p - 1)  # reduced exponent for the p half
+        self.dq = self.d % (q - 1)  # reduced exponent for the q half
+        self.q_inv = extended_euclid(q, p)  # used to recombine the two halves
+        self.key_id = key_id(self.n, e)
+
+    @classmethod
+    def from_crt_key(cls, key, e):
+        """
+        Wraps an RSA.CRTPrivateKey (as returned by generate_key_pair(..., crt=True)).
+        """
+        return cls(key.p, key.q, e, key.d)
+
+    def public_key(self):
+        return PublicKey(self.n, self.e)
+
+    def __iter__(self):
+        return iter((self.n, self.e, self.d))
+
+    def __eq__(self, other):
+        return isinstance(other, PrivateKey) and (self.p, self.q, self.e) == (other.p, other.q, other.e)
+
+    def __hash__(self):
+        return self.key_id
+
+    def __repr__(self):  # never print the private tokens
+        return f"PrivateKey(key_id={self.key_id:016x}, bits={self.n.bit_length()}, e={self.e})"
+
+    def __getstate__(self):
+        return self.p, self.q, self.e, self.d
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def to_dict(self):
+        """
+        Key tokens for a JSON key file (the format cli.py reads).
+        """
+        return {"n": self.n, "e": self.e, "d": self.d, "p": self.p, "q": self.q}
+
+
+def key_from_dict(tokens):
+    """
+    Builds a key from JSON key file tokens: a PrivateKey when p and q are present, else a PublicKey.
+
+    Raises:
+        ValueError: if n or e is missing.
+
+    """
+    tokens = {name: int(value) for name, value in tokens.items()}
+    if "p" in tokens and "q" in tokens:
+        return PrivateKey(tokens["p"], tokens["q"], tokens["e"], tokens.get("d"))
+    if "n" not in tokens or "e" not in tokens:
+        raise ValueError("A key needs n and e")
+    return PublicKey(tokens["n"], tokens["e"])
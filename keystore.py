@@ -0,0 +1,335 @@
+# Append-only keystore: fixed-width binary key records plus a sorted key-ID index that is mmap'ed,
+# so a lookup binary-searches the index (O(log N) pages) and decodes a single record.
+
+import heapq
+import json
+import mmap
+import os
+import struct
+
+from keys import PrivateKey, PublicKey, key_from_dict, modulus_bytes
+from stream_io import batched
+
+
+# Data file: header, then one record per key, in the order they were added.
+#   record = key ID (8 bytes) | kind (1 byte) | n | e (modulus bytes each) | p | q (prime bytes each)
+# All integers are unsigned big-endian.  Public key records leave p and q zero.
+STORE_MAGIC = b"RSAK"
+STORE_HEADER = struct.Struct(">4sBxxxI")  # magic, version, modulus bytes
+STORE_VERSION = 1
+RECORD_PREFIX = struct.Struct(">QB")  # key ID, kind
+PUBLIC_RECORD, PRIVATE_RECORD = 0, 1
+
+# Index file: header, then (key ID, record number) pairs sorted by key ID.
+INDEX_MAGIC = b"RSAI"
+INDEX_HEADER = struct.Struct(">4sBxxxQ")  # magic, version, number of records covered
+INDEX_ENTRY = struct.Struct(">QQ")
+
+
+def prime_bytes(size):
+    """
+    Width of p and q in a record for a modulus of size bytes.  Both primes are at most one
+    bit longer than half of n.
+    """
+    return size // 2 + 1
+
+
+class KeyStore:
+    """
+    Key records in path, indexed by path + ".idx".  Keys are appended to the data file at once;
+    the sorted index is rewritten by flush (and close), and keys added since then are found
+    through a small in-memory table.
+
+    Arguments:
+        path (string): Data file.  Created if missing.
+        key_bits (int): Largest modulus the store holds; only used when the store is created.
+    """
+
+    def __init__(self, path, key_bits=2048):
+        self.path = path
+        self.index_path = path + ".idx"
+        if not os.path.exists(path):
+            with open(path, "wb") as data_file:
+                data_file.write(STORE_HEADER.pack(STORE_MAGIC, STORE_VERSION, (key_bits + 7) // 8))
+        self._data = open(path, "r+b")
+        magic, version, self.size = STORE_HEADER.unpack(self._data.read(STORE_HEADER.size))
+        if magic != STORE_MAGIC or version != STORE_VERSION:
+            self._data.close()
+            raise ValueError(f"{path} is not a version {STORE_VERSION} keystore")
+        self.prime_size = prime_bytes(self.size)
+        self.record_size = RECORD_PREFIX.size + 2 * self.size + 2 * self.prime_size
+        body_length = os.fstat(self._data.fileno()).st_size - STORE_HEADER.size
+        self._count = body_length // self.record_size  # a torn final record is ignored and overwritten
+        self._index = None
+        self._indexed = 0
+        self._pending = {}  # key ID -> record number for records not in the index yet
+        self._open_index()
+        for number in range(self._indexed, self._count):  # records appended after the last flush
+            self._pending[self._read_key_id(number)] = number
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, key_id):
+        return self._find(key_id) is not None
+
+    def __iter__(self):
+        return self.export_keys()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # ----- records -----
+
+    def _check_fits(self, key):
+        """
+        Raises ValueError, naming the key, if any of its tokens is too wide for a record.
+        """
+        if modulus_bytes(key.n) > self.size or modulus_bytes(key.e) > self.size:
+            raise ValueError(f"Key {key.key_id:016x} is {key.n.bit_length()} bits, "
+                             f"the store holds at most {8 * self.size}")
+        if isinstance(key, PrivateKey) and max(modulus_bytes(key.p), modulus_bytes(key.q)) > self.prime_size:
+            raise ValueError(f"Key {key.key_id:016x} has unbalanced primes: "
+                             f"{max(key.p, key.q).bit_length()} bits, records hold at most {8 * self.prime_size}")
+
+    def _encode(self, key):
+        self._check_fits(key)
+        private = isinstance(key, PrivateKey)
+        return b"".join((
+            RECORD_PREFIX.pack(key.key_id, PRIVATE_RECORD if private else PUBLIC_RECORD),
+            key.n.to_bytes(self.size, "big"),
+            key.e.to_bytes(self.size, "big"),
+            (key.p if private else 0).to_bytes(self.prime_size, "big"),
+            (key.q if private else 0).to_bytes(self.prime_size, "big"),
+        ))
+
+    def _decode(self, record):
+        _, kind = RECORD_PREFIX.unpack_from(record)
+        offset = RECORD_PREFIX.size
+        n = int.from_bytes(record[offset:offset + self.size], "big")
+        e = int.from_bytes(record[offset + self.size:offset + 2 * self.size], "big")
+        if kind == PUBLIC_RECORD:
+            return PublicKey(n, e)
+        offset += 2 * self.size
+        p = int.from_bytes(record[offset:offset + self.prime_size], "big")
+        q = int.from_bytes(record[offset + self.prime_size:offset + 2 * self.prime_size], "big")
+        return PrivateKey(p, q, e)
+
+    def _offset(self, number):
+        return STORE_HEADER.size + number * self.record_size
+
+    def _read_record(self, number):
+        return os.pread(self._data.fileno(), self.record_size, self._offset(number))
+
+    def _read_key_id(self, number):
+        return RECORD_PREFIX.unpack(os.pread(self._data.fileno(), RECORD_PREFIX.size, self._offset(number)))[0]
+
+    # ----- index -----
+
+    def _open_index(self):
+        """
+        Maps the index file, if there is a usable one.
+        """
+        if self._index is not None:
+            self._index.close()
+            self._index, self._indexed = None, 0
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "rb") as index_file:
+            if os.fstat(index_file.fileno()).st_size <= INDEX_HEADER.size:
+                return
+            index = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, covered = INDEX_HEADER.unpack_from(index)
+        if magic != INDEX_MAGIC or version != STORE_VERSION or covered > self._count:
+            index.close()  # a stale or foreign index is rebuilt from the records by the next flush
+            return
+        self._index, self._indexed = index, covered
+
+    def _search(self, key_id):
+        """
+        Binary search of the mmap'ed index.
+
+        Returns:
+            int: Record number, or None.
+
+        """
+        low, high = 0, self._indexed
+        while low < high:
+            middle = (low + high) // 2
+            middle_id, number = INDEX_ENTRY.unpack_from(self._index, INDEX_HEADER.size + middle * INDEX_ENTRY.size)
+            if middle_id < key_id:
+                low = middle + 1
+            elif middle_id > key_id:
+                high = middle
+            else:
+                return number
+        return None
+
+    def _find(self, key_id):
+        number = self._pending.get(key_id)
+        if number is None and self._index is not None:
+            number = self._search(key_id)
+        return number
+
+    def _index_entries(self):
+        """
+        Yields the (key ID, record number) pairs of the current index in order.
+        """
+        for start in range(0, self._indexed, 1 << 16):  # unpack in slices to keep memory flat
+            end = min(self._indexed, start + (1 << 16))
+            view = self._index[INDEX_HEADER.size + start * INDEX_ENTRY.size:INDEX_HEADER.size + end * INDEX_ENTRY.size]
+            yield from INDEX_ENTRY.iter_unpack(view)
+
+    def flush(self):
+        """
+        Merges the keys added since the last flush into the sorted index.  The new index is
+        written under a temporary name and moved into place.
+        """
+        self._data.flush()
+        if not self._pending and self._index is not None:
+            return
+        if self._index is None:  # no usable index: rebuild it from every record
+            self._pending = {self._read_key_id(number): number for number in range(self._count)}
+        temp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as index_file:
+            index_file.write(INDEX_HEADER.pack(INDEX_MAGIC, STORE_VERSION, self._count))
+            entries = heapq.merge(self._index_entries() if self._index is not None else (),
+                                  sorted(self._pending.items()))
+            for chunk in batched(entries, 1 << 16):
+                index_file.write(b"".join([INDEX_ENTRY.pack(*entry) for entry in chunk]))
+        os.replace(temp_path, self.index_path)
+        self._pending.clear()
+        self._open_index()
+
+    def close(self):
+        """
+        Flushes the index and closes the files.
+        """
+        self.flush()
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+        self._data.close()
+
+    # ----- keys -----
+
+    def add(self, key):
+        """
+        Appends a key.
+
+        Args:
+             key (PublicKey or PrivateKey): The key to store.
+
+        Returns:
+            int: The key ID to look it up by.
+
+        Raises:
+            ValueError: if a key with the same ID is already stored, or the key is too large.
+
+        """
+        if self._find(key.key_id) is not None:
+            raise ValueError(f"Key {key.key_id:016x} is already in the store")
+        self._append([key])
+        return key.key_id
+
+    def _append(self, keys):
+        records = b"".join([self._encode(key) for key in keys])
+        os.pwrite(self._data.fileno(), records, self._offset(self._count))
+        for key in keys:
+            self._pending[key.key_id] = self._count
+            self._count += 1
+
+    def get(self, key_id):
+        """
+        Looks a key up by ID.
+
+        Returns:
+            PublicKey or PrivateKey: The stored key.
+
+        Raises:
+            KeyError: if no key has that ID.
+
+        """
+        number = self._find(key_id)
+        if number is None:
+            raise KeyError(f"No key {key_id:016x} in the store")
+        return self._decode(self._read_record(number))
+
+    def import_keys(self, keys, batch_size=1 << 12):
+        """
+        Bulk import: appends keys in batches and updates the index once at the end.
+        Keys already in the store are skipped.
+
+        Args:
+             keys (iterable): PublicKey and PrivateKey objects.
+             batch_size (int): Records written per write call.
+
+        Returns:
+            int: Number of keys added.
+
+        Raises:
+            ValueError: if a key does not fit the store's records; keys before it stay imported.
+
+        """
+        added = 0
+        batch, batch_ids = [], set()
+        for key in keys:
+            if key.key_id in batch_ids or self._find(key.key_id) is not None:
+                continue
+            try:
+                self._check_fits(key)
+            except ValueError:  # keep the keys read so far, then report the one that does not fit
+                if batch:
+                    self._append(batch)
+                self.flush()
+                raise
+            batch.append(key)
+            batch_ids.add(key.key_id)
+            if len(batch) == batch_size:
+                self._append(batch)
+                added += len(batch)
+                batch, batch_ids = [], set()
+        if batch:
+            self._append(batch)
+            added += len(batch)
+        self.flush()
+        return added
+
+    def export_keys(self):
+        """
+        Bulk export: yields every stored key, in the order they were added.
+        """
+        self._data.flush()
+        with mmap.mmap(self._data.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for number in range(self._count):
+                offset = self._offset(number)
+                yield self._decode(data[offset:offset + self.record_size])
+
+
+def import_jsonl(store, source):
+    """
+    Imports keys from a file with one JSON key object per line (the key file format of cli.py).
+
+    Returns:
+        int: Number of keys added.
+
+    """
+    return store.import_keys(key_from_dict(json.loads(line)) for line in source if line.strip())
+
+
+def export_jsonl(store, sink):
+    """
+    Writes every stored key to a text file as one JSON key object per line.
+
+    Returns:
+        int: Number of keys written.
+
+    """
+    count = 0
+    for key in store.export_keys():
+        sink.write(json.dumps(key.to_dict()) + "\n")
+        count += 1
+    return count
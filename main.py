@@ -1,6 +1,12 @@
-from RSA import *
+import os
+import sys
 import time
 
+import cli
+
+from RSA import *
+from cipher_container import decode_container, encode_to_container
+
 
 def main():
     choice = input("Tutorial: type t\nGet Keys: type k\nencode: type e\ndecode: type d\n")
@@ -33,16 +39,26 @@ def main():
         e = int(input("Enter public key e: "))
         n = int(input("Enter public key n: "))
         m = input("Enter your message: ")
-        print(f"Here is your encoded message:\n\t{encode(n, e, m)}")  # encode
+        path = input("Save to a cipher text file (leave blank to print it): ")
+        if path:
+            blocks = encode_to_container(n, e, m, path)  # write the binary container
+            print(f"Wrote {blocks} encrypted characters to {path}")
+        else:
+            print(f"Here is your encoded message:\n\t{encode(n, e, m)}")  # encode
     elif choice == "d":
-        c = input("Paste your cipher text message here: ")
-        c = list(map(int, c[1:-1].split(", ")))  # Format message: should inputed as a list
+        c = input("Paste your cipher text message or the path of a cipher text file here: ")
         d = int(input("Enter decryption token d: "))
         n = int(input("Enter Public key n: "))
-        print(f"Here is your decoded message:\n\t {decode(n, d, c)}")  # decode
+        if os.path.isfile(c):
+            m = decode_container(c, n, d)  # blocks are read straight from the mmap'ed file
+        else:
+            m = decode(n, d, map(int, c.strip("[] ").split(",")))  # Format message: should inputed as a list
+        print(f"Here is your decoded message:\n\t {m}")  # decode
     else:
         print("Invalid choice")
 
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1:  # subcommands for scripts and pipelines, see cli.py
+        sys.exit(cli.main(sys.argv[1:]))
     main()
@@ -0,0 +1,518 @@
+# Modular exponentiation engine shared by RSA.py, RSA_block.py and CodeBreakers.py.
+
+from functools import lru_cache
+
+import instrumentation
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency, only fme_vector needs it
+    np = None
+
+
+# =====================================================================================================================|
+# ===============================================BACKENDS==============================================================|
+# =====================================================================================================================|
+
+def _check_operands(n, m):
+    """
+    Validates the exponent and modulus handed to one of the pure Python backends.
+
+    Args:
+         n (int): Power to raise b to.
+         m (int): Quotient for modulo operation.
+
+    Raises:
+        ValueError: if n is negative or m is not positive.
+
+    """
+    if n < 0:
+        raise ValueError("Negative exponents are only supported by the builtin backend")
+    if m < 1:
+        raise ValueError("Modulus must be a positive integer")
+
+
+def fme_rosen(b, n, m):
+    """
+    Reference square-and-multiply loop.
+    Source: Pseudocode from Discrete Mathematics and Its Applications, Rosen.
+
+    Reads the bits of n with shifts instead of building a binary string first.
+
+    Args:
+         b (int): Base 10 integer.
+         n (int): Power to raise b to.
+         m (int): Quotient for modulo operation.
+
+    Returns:
+        int: resulting modulus from b^n mod m.
+
+    """
+    _check_operands(n, m)
+    x = 1 % m
+    power = b % m  # initial power
+    while n > 0:  # walk the bits of n from least to most significant
+        if n & 1:
+            x = (x * power) % m  # if the bit is 1, increment x
+        power = (power * power) % m  # adjust to next power
+        n >>= 1
+    return x
+
+
+def window_width(bits):
+    """
+    Picks a sliding window width for an exponent of the given bit length.
+
+    Args:
+         bits (int): Bit length of the exponent.
+
+    Returns:
+        int: Window width in bits.
+
+    """
+    if bits <= 24:
+        return 1
+    if bits <= 80:
+        return 3
+    if bits <= 240:
+        return 4
+    if bits <= 672:
+        return 5
+    return 6
+
+
+def _odd_powers(b, width, mul):
+    """
+    Precomputes b^1, b^3, ..., b^(2^width - 1) for the sliding window method.
+
+    Args:
+         b (int): Base, already reduced (or in Montgomery form).
+         width (int): Window width in bits.
+         mul (callable): Modular multiplication to use.
+
+    Returns:
+        list: Odd powers of b, where index i holds b^(2i + 1).
+
+    """
+    b2 = mul(b, b)
+    table = [b]
+    for _ in range((1 << (width - 1)) - 1):
+        table.append(mul(table[-1], b2))
+    return table
+
+
+def _sliding_window(x, b, n, width, mul):
+    """
+    Left-to-right sliding window exponentiation over an arbitrary modular multiplication.
+
+    Args:
+         x (int): Representation of 1 for mul.
+         b (int): Base, already reduced (or in Montgomery form).
+         n (int): Power to raise b to.
+         width (int): Window width in bits.
+         mul (callable): Modular multiplication to use.
+
+    Returns:
+        int: b^n in the representation used by mul.
+
+    """
+    table = _odd_powers(b, width, mul)
+    i = n.bit_length() - 1
+    while i >= 0:
+        if not (n >> i) & 1:  # zero bits only need a squaring
+            x = mul(x, x)
+            i -= 1
+            continue
+        j = max(i - width + 1, 0)
+        while not (n >> j) & 1:  # shrink the window so it ends on a 1 bit
+            j += 1
+        for _ in range(i - j + 1):
+            x = mul(x, x)
+        x = mul(x, table[((n >> j) & ((1 << (i - j + 1)) - 1)) >> 1])
+        i = j - 1
+    return x
+
+
+def fme_window(b, n, m, width=None):
+    """
+    Sliding window modular exponentiation.
+
+    Args:
+         b (int): Base 10 integer.
+         n (int): Power to raise b to.
+         m (int): Quotient for modulo operation.
+         width (int): Window width in bits.  Picked from the size of n when omitted.
+
+    Returns:
+        int: resulting modulus from b^n mod m.
+
+    """
+    _check_operands(n, m)
+    if width is None:
+        width = window_width(n.bit_length())
+    return _sliding_window(1 % m, b % m, n, width, lambda x, y: (x * y) % m)
+
+
+class MontgomeryContext:
+    """
+    Precomputed values for Montgomery multiplication modulo an odd m.
+
+    Attributes:
+        m (int): Odd modulus.
+        k (int): Bit length of R = 2^k.
+        m_prime (int): -m^-1 mod R.
+        r2 (int): R^2 mod m, used to move numbers into Montgomery form.
+        one (int): R mod m, the Montgomery form of 1.
+    """
+
+    def __init__(self, m):
+        if m < 3 or m % 2 == 0:
+            raise ValueError("Montgomery multiplication needs an odd modulus greater than 1")
+        self.m = m
+        self.k = m.bit_length()
+        self._mask = (1 << self.k) - 1
+        self.m_prime = (-pow(m, -1, 1 << self.k)) & self._mask
+        self.r2 = (1 << (2 * self.k)) % m
+        self.one = (1 << self.k) % m
+
+    def reduce(self, t):
+        """
+        Montgomery reduction: returns t * R^-1 mod m for 0 <= t < m * R.
+        """
+        u = ((t & self._mask) * self.m_prime) & self._mask
+        t = (t + u * self.m) >> self.k
+        return t - self.m if t >= self.m else t
+
+    def multiply(self, x, y):
+        """
+        Multiplies two numbers that are already in Montgomery form.
+        """
+        return self.reduce(x * y)
+
+    def to_montgomery(self, x):
+        """
+        Converts x into Montgomery form.
+        """
+        return self.reduce((x % self.m) * self.r2)
+
+    def from_montgomery(self, x):
+        """
+        Converts x out of Montgomery form.
+        """
+        return self.reduce(x)
+
+    def pow(self, b, n, width=None):
+        """
+        Computes b^n mod m with sliding window exponentiation over Montgomery products.
+        """
+        if width is None:
+            width = window_width(n.bit_length())
+        x = _sliding_window(self.one, self.to_montgomery(b), n, width, self.multiply)
+        return self.from_montgomery(x)
+
+
+@lru_cache(maxsize=64)
+def montgomery_context(m):
+    """
+    Returns the cached MontgomeryContext for a modulus.
+
+    Args:
+         m (int): Odd modulus.
+
+    Returns:
+        MontgomeryContext: Context shared by every exponentiation modulo m.
+
+    """
+    return MontgomeryContext(m)
+
+
+def fme_montgomery(b, n, m):
+    """
+    Modular exponentiation with Montgomery multiplication.  m must be odd.
+
+    Args:
+         b (int): Base 10 integer.
+         n (int): Power to raise b to.
+         m (int): Quotient for modulo operation.
+
+    Returns:
+        int: resulting modulus from b^n mod m.
+
+    """
+    _check_operands(n, m)
+    if m == 1:
+        return 0
+    return montgomery_context(m).pow(b, n)
+
+
+def fermat_exponent_power(n):
+    """
+    Recognizes exponents of the form 2^k + 1 (3, 5, 17, 257, 65537, ...).
+
+    Args:
+         n (int): Exponent.
+
+    Returns:
+        int: k if n == 2^k + 1 with k >= 1, otherwise None.
+
+    """
+    k = (n - 1).bit_length() - 1
+    if n > 2 and n - 1 == 1 << k:
+        return k
+    return None
+
+
+def fme_fermat(b, n, m):
+    """
+    Modular exponentiation for exponents of the form 2^k + 1: k squarings and one multiplication,
+    with no bit scanning.
+
+    Args:
+         b (int): Base 10 integer.
+         n (int): Power to raise b to, of the form 2^k + 1.
+         m (int): Quotient for modulo operation.
+
+    Returns:
+        int: resulting modulus from b^n mod m.
+
+    Raises:
+        ValueError: if n is not of the form 2^k + 1.
+
+    """
+    _check_operands(n, m)
+    k = fermat_exponent_power(n)
+    if k is None:
+        raise ValueError(f"Exponent {n} is not of the form 2^k + 1")
+    base = b % m
+    x = base
+    for _ in range(k):
+        x = (x * x) % m
+    return (x * base) % m
+
+
+def fme_builtin(b, n, m):
+    """
+    Modular exponentiation with the builtin three-argument pow.
+
+    Args:
+         b (int): Base 10 integer.
+         n (int): Power to raise b to.
+         m (int): Quotient for modulo operation.
+
+    Returns:
+        int: resulting modulus from b^n mod m.
+
+    """
+    return pow(b, n, m)
+
+
+BACKENDS = {
+    "rosen": fme_rosen,
+    "window": fme_window,
+    "montgomery": fme_montgomery,
+    "fermat": fme_fermat,
+    "builtin": fme_builtin,
+}
+
+# Exponents at or below this size gain nothing from precomputed windows.
+SMALL_EXPONENT_BITS = 24
+
+# Moduli at or above this size amortize the cost of building a Montgomery context.
+MONTGOMERY_MIN_BITS = 512
+
+
+# =====================================================================================================================|
+# ===============================================ENGINE================================================================|
+# =====================================================================================================================|
+
+def select_backend(n, m, allow_builtin=True):
+    """
+    Picks a backend from the size of the exponent and the modulus.
+
+    The builtin pow is implemented in C and beats every pure Python backend at every size,
+    so it is chosen whenever it is allowed.  Otherwise exponents of the form 2^k + 1 use the
+    Fermat backend, small exponents use the Rosen loop, large odd moduli use Montgomery
+    multiplication and everything else uses sliding windows.
+
+    Args:
+         n (int): Power to raise b to.
+         m (int): Quotient for modulo operation.
+         allow_builtin (bool): Whether the builtin pow may be picked.
+
+    Returns:
+        string: Name of the backend in BACKENDS.
+
+    """
+    if allow_builtin:
+        return "builtin"
+    if fermat_exponent_power(n) is not None:
+        return "fermat"
+    if n.bit_length() <= SMALL_EXPONENT_BITS:
+        return "rosen"
+    if m % 2 == 1 and m.bit_length() >= MONTGOMERY_MIN_BITS:
+        return "montgomery"
+    return "window"
+
+
+def backend_for(n, m, allow_builtin=True):
+    """
+    Resolves the backend for a fixed key once, so a message can skip the per-block dispatch in modexp.
+
+    Args:
+         n (int): Power every block is raised to.
+         m (int): Quotient for modulo operation.
+         allow_builtin (bool): Whether the builtin pow may be picked.
+
+    Returns:
+        callable: Function taking (b, n, m) and returning b^n mod m.
+
+    """
+    backend = select_backend(n, m, allow_builtin)
+    return pow if backend == "builtin" else BACKENDS[backend]
+
+
+def modexp(b, n, m, backend="auto"):
+    """
+    Computes b^n mod m with the requested backend.
+
+    Args:
+         b (int): Base 10 integer.
+         n (int): Power to raise b to.
+         m (int): Quotient for modulo operation.
+         backend (string): A name from BACKENDS, or "auto" to pick one by operand size.
+
+    Returns:
+        int: resulting modulus from b^n mod m.
+
+    Raises:
+        ValueError: if the backend is unknown.
+
+    """
+    if instrumentation.enabled:
+        instrumentation.count_modexp(n)
+    if backend == "auto":
+        backend = select_backend(n, m)
+    try:
+        return BACKENDS[backend](b, n, m)
+    except KeyError:
+        raise ValueError(f"Unknown modexp backend: {backend}") from None
+
+
+# =====================================================================================================================|
+# ===============================================VECTORIZED ENGINE=====================================================|
+# =====================================================================================================================|
+
+# Moduli below this bound keep every product of two residues below 2^62, inside uint64.
+VECTOR_MAX_MODULUS = 1 << 31
+
+# Shorter lists are faster with one builtin pow per element than with the per-bit NumPy calls.
+VECTOR_MIN_LENGTH = 64
+
+
+def use_vector(n, m, count):
+    """
+    Whether fme_vector should handle count exponentiations to n mod m.  Negative exponents (modular
+    inverses) are left to backend_for.
+    """
+    return np is not None and n >= 0 and 0 < m < VECTOR_MAX_MODULUS and count >= VECTOR_MIN_LENGTH
+
+
+def fme_vector(bases, n, m):
+    """
+    Raises every base to n mod m at once: right-to-left square-and-multiply over the bits of n, where each
+    step is one in-place NumPy operation on the whole uint64 array.  Needs NumPy and m < VECTOR_MAX_MODULUS.
+
+    Args:
+         bases (list): Base 10 integers of any size; like pow, each is reduced mod m first.
+         n (int): Power to raise every base to.
+         m (int): Quotient for modulo operation.
+
+    Returns:
+        list: b^n mod m for every b in bases, as Python ints.
+
+    """
+    modulus = np.uint64(m)
+    power = np.array([b % m for b in bases], dtype=np.uint64)  # b^(2^i) mod m; reduced first so any b fits
+    result = np.full_like(power, 1 % m)
+    while n:
+        if n & 1:
+            np.multiply(result, power, out=result)
+            np.remainder(result, modulus, out=result)
+        n >>= 1
+        if n:
+            np.multiply(power, power, out=power)
+            np.remainder(power, modulus, out=power)
+    return result.tolist()
+
+
+def power_all(bases, n, m):
+    """
+    Raises every base to n mod m, choosing the engine once for the whole list: fme_vector for long lists
+    under a small modulus, else the backend_for function (the builtin pow, see select_backend) per base.
+
+    Args:
+         bases (list): Base 10 integers.
+         n (int): Power to raise every base to.
+         m (int): Quotient for modulo operation.
+
+    Returns:
+        list: b^n mod m for every b in bases.
+
+    """
+    if not isinstance(bases, list):
+        bases = list(bases)
+    if instrumentation.enabled:  # neither path goes through modexp, so count the exponentiations here
+        instrumentation.count_modexp(n, len(bases))
+    if use_vector(n, m, len(bases)):
+        return fme_vector(bases, n, m)
+    power = backend_for(n, m)
+    return [power(b, n, m) for b in bases]
+
+
+def check_backends(trials=200, bits=(8, 64, 256, 1024), seed=0):
+    """
+    Checks every backend against the builtin pow on random operands.
+
+    Args:
+         trials (int): Number of random cases per operand size.
+         bits (tuple): Operand sizes (in bits) to test.
+         seed (int): Seed for the random operands.
+
+    Returns:
+        list: (backend, b, n, m) tuples for every mismatch.  Empty when all backends agree.
+
+    """
+    import random
+
+    rng = random.Random(seed)
+    mismatches = []
+    for size in bits:
+        for _ in range(trials):
+            m = rng.getrandbits(size) | (1 << (size - 1))
+            b = rng.getrandbits(size + 8)
+            n = rng.getrandbits(size) if rng.random() < 0.9 else (1 << rng.randrange(1, size)) + 1
+            expected = pow(b, n, m)
+            for name, backend in BACKENDS.items():
+                if name == "montgomery" and m % 2 == 0:  # Montgomery only handles odd moduli
+                    continue
+                if name == "fermat" and fermat_exponent_power(n) is None:
+                    continue
+                if backend(b, n, m) != expected:
+                    mismatches.append((name, b, n, m))
+    if np is not None:
+        for _ in range(trials):
+            m = rng.randrange(1, VECTOR_MAX_MODULUS)
+            bases = [rng.getrandbits(rng.choice((8, 31, 64, 65, 200))) for _ in range(VECTOR_MIN_LENGTH)]
+            n = rng.getrandbits(rng.randrange(1, 64))
+            if fme_vector(bases, n, m) != [pow(b, n, m) for b in bases]:
+                mismatches.append(("vector", bases, n, m))
+        m = (1 << 31) - 1  # prime: every base below it has an inverse
+        bases = [rng.randrange(1, m) for _ in range(VECTOR_MIN_LENGTH)]
+        if power_all(bases, -1, m) != [pow(b, -1, m) for b in bases]:  # negative exponents skip fme_vector
+            mismatches.append(("power_all", bases, -1, m))
+    return mismatches
+
+
+if __name__ == '__main__':
+    failures = check_backends()
+    print("All backends agree with pow" if not failures else f"Mismatches: {failures[:5]}")
@@ -0,0 +1,174 @@
+# Multi-core encryption and decryption of independent blocks with a reusable process pool.
+
+import os
+from math import ceil
+from multiprocessing import get_context
+
+import RSA
+import RSA_block
+
+
+# Target amount of work per task, in 64-bit word multiplications, so that pickling
+# and scheduling a task stays small next to the modexp work it carries.
+MIN_TASK_COST = 1 << 22
+
+# Tasks handed to each process when there is plenty of work, so faster workers can pick up slack.
+TASKS_PER_PROCESS = 4
+
+_worker_keys = {}  # "e"/"d" -> (n, exponent), set once per worker by _init_worker
+
+
+def _init_worker(keys):
+    """
+    Stores the key in a pool worker so it is not pickled with every task.
+
+    Args:
+         keys (dict): "e" and/or "d" mapped to (n, exponent).
+
+    """
+    _worker_keys.update(keys)
+
+
+def _apply_chunk(task):
+    """
+    Raises every block in a chunk to the preloaded exponent.
+
+    Args:
+         task (tuple): ("e" or "d", list of blocks).
+
+    Returns:
+        list: Processed blocks, in order.
+
+    """
+    which, chunk = task
+    n, exponent = _worker_keys[which]
+    return RSA.decrypt_blocks(n, exponent, chunk)  # also takes e: an int exponent is applied to every block
+
+
+def chunk_size(count, processes, n_bits, exponent_bits):
+    """
+    Picks how many blocks go into one task.
+
+    Tasks are split evenly (TASKS_PER_PROCESS per process) but never made so small that a
+    task carries less than MIN_TASK_COST of modexp work.
+
+    Args:
+         count (int): Number of blocks.
+         processes (int): Number of worker processes.
+         n_bits (int): Bit length of the modulus.
+         exponent_bits (int): Bit length of the exponent.
+
+    Returns:
+        int: Blocks per task.
+
+    """
+    words = max(1, ceil(n_bits / 64))
+    cost = max(1, exponent_bits) * words * words  # schoolbook estimate of one modexp
+    even_split = ceil(count / (processes * TASKS_PER_PROCESS))
+    return max(1, even_split, ceil(MIN_TASK_COST / cost))
+
+
+class ParallelCipher:
+    """
+    Encrypts and decrypts block lists across a pool of worker processes.
+    The pool is started once and reused, with the key preloaded in every worker.
+
+    Arguments:
+        n (int): Public key token n.
+        e (int): Public key token e, needed for encode.
+        d (int or CRTPrivateKey): Private key token d, needed for decode.
+        processes (int): Number of worker processes.  Defaults to the number of CPUs.
+    """
+
+    def __init__(self, n, e=None, d=None, processes=None):
+        self.n = n
+        self.e = e
+        self.d = d
+        self.processes = processes or os.cpu_count() or 1
+        keys = {}
+        if e is not None:
+            keys["e"] = (n, e)
+        if d is not None:
+            keys["d"] = (n, d)
+        self._pool = get_context().Pool(self.processes, initializer=_init_worker, initargs=(keys,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Shuts the worker pool down.
+        """
+        self._pool.close()
+        self._pool.join()
+
+    def _exponent_bits(self, which):
+        exponent = self.e if which == "e" else self.d
+        if exponent is None:
+            raise ValueError(f"ParallelCipher was created without key token {which}")
+        if isinstance(exponent, int):
+            return exponent.bit_length()
+        return exponent.dp.bit_length() // 2  # two half-size exponentiations with CRT
+
+    def map(self, blocks, which):
+        """
+        Raises every block to e or d across the pool.  Output order matches input order.
+
+        Arguments:
+            blocks (list): Blocks (ints) to process.
+            which (string): "e" to encrypt, "d" to decrypt.
+
+        Returns:
+            list: Processed blocks.
+        """
+        blocks = list(blocks)
+        size = chunk_size(len(blocks), self.processes, self.n.bit_length(), self._exponent_bits(which))
+        tasks = [(which, blocks[i:i + size]) for i in range(0, len(blocks), size)]
+        result = []
+        for chunk in self._pool.imap(_apply_chunk, tasks):  # imap keeps the task order
+            result.extend(chunk)
+        return result
+
+    def encode(self, message, scheme="ascii"):
+        """
+        Encrypts a message.
+
+        Arguments:
+            message (string): Plain-text message for encryption.
+            scheme (string): "ascii" (RSA.encode), "block" (RSA_block.encode) or "dense" (RSA_block.encode_dense).
+
+        Returns:
+            list: Encrypted message.
+        """
+        if scheme == "ascii":
+            blocks = RSA.convert_text(message)
+        elif scheme == "block":
+            blocks = [int(block) for block in RSA_block.prep_message(message, self.n)]
+        elif scheme == "dense":
+            blocks = RSA_block.prep_message_dense(message, self.n)
+        else:
+            raise ValueError(f"Unknown scheme: {scheme}")
+        return self.map(blocks, "e")
+
+    def decode(self, cipher_text, scheme="ascii"):
+        """
+        Decrypts a message.
+
+        Arguments:
+            cipher_text (list): Encrypted blocks.
+            scheme (string): The scheme the message was encrypted with.
+
+        Returns:
+            string: Decrypted message.
+        """
+        if scheme not in ("ascii", "block", "dense"):
+            raise ValueError(f"Unknown scheme: {scheme}")
+        blocks = self.map(cipher_text, "d")
+        if scheme == "ascii":
+            return RSA.convert_num(blocks)
+        if scheme == "block":
+            return RSA_block.convert_decrypted_blocks(blocks, self.n)
+        return RSA_block.block_convert_num(RSA_block.unpack_blocks(blocks, self.n, 26))
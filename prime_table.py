@@ -0,0 +1,212 @@
+# Persistent prime table built with a segmented sieve and shared between processes through mmap.
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+from itertools import compress
+from math import isqrt
+
+from primes import sieve
+
+
+# File layout: header, then every prime below limit as a little-endian uint32.
+TABLE_MAGIC = b"PTBL"
+TABLE_HEADER = struct.Struct("<4sIQQ")  # magic, version, limit, count
+TABLE_VERSION = 1
+
+# Numbers sieved per segment by segmented_sieve.
+SEGMENT_SIZE = 1 << 18
+
+# Smallest table load_prime_table builds; larger limits are rounded up to a power of two.
+MIN_TABLE_LIMIT = 1 << 16
+
+# Largest table load_prime_table builds (about 3.9 million primes, 15 MB).  Callers that need
+# primes beyond it get this table and have to continue on their own.
+MAX_TABLE_LIMIT = 1 << 26
+
+_tables = {}  # path -> PrimeTable already opened by this process
+
+
+# =====================================================================================================================|
+# ===============================================SIEVE FUNCTIONS=======================================================|
+# =====================================================================================================================|
+
+def segmented_sieve(limit, segment_size=SEGMENT_SIZE):
+    """
+    Yields every prime below limit, sieving one segment at a time so memory stays
+    proportional to sqrt(limit) + segment_size.
+
+    Args:
+         limit (int): Exclusive upper bound.
+         segment_size (int): Numbers sieved per segment.
+
+    Yields:
+        int: The next prime.
+
+    """
+    base_primes = sieve(isqrt(limit) + 1)
+    yield from (p for p in base_primes if p < limit)
+    low = max(isqrt(limit) + 1, 2)
+    while low < limit:
+        high = min(low + segment_size, limit)
+        segment = bytearray(b"\x01") * (high - low)
+        for p in base_primes:
+            if p * p >= high:
+                break
+            start = max(p * p, (low + p - 1) // p * p)  # first multiple of p in the segment
+            segment[start - low::p] = bytes(len(range(start, high, p)))
+        yield from compress(range(low, high), segment)
+        low = high
+
+
+def build_prime_table(path, limit):
+    """
+    Writes every prime below limit to a table file.  The file is written under a temporary
+    name and moved into place, so readers never see a partial table.
+
+    Args:
+         path (string): Destination file.
+         limit (int): Exclusive upper bound, at most 2^32.
+
+    Raises:
+        ValueError: if limit does not fit in a uint32 table.
+
+    """
+    if limit > 1 << 32:
+        raise ValueError("Prime tables hold uint32 values, so limit must be at most 2^32")
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    count = 0
+    with open(temp_path, "wb") as table_file:
+        table_file.write(TABLE_HEADER.pack(TABLE_MAGIC, TABLE_VERSION, limit, 0))
+        chunk = array("I")
+        for p in segmented_sieve(limit):
+            chunk.append(p)
+            if len(chunk) == SEGMENT_SIZE:
+                count += _write_chunk(table_file, chunk)
+                chunk = array("I")
+        count += _write_chunk(table_file, chunk)
+        table_file.seek(0)
+        table_file.write(TABLE_HEADER.pack(TABLE_MAGIC, TABLE_VERSION, limit, count))
+    os.replace(temp_path, path)
+
+
+def _write_chunk(table_file, chunk):
+    """
+    Writes a chunk of primes as little-endian uint32 values.
+
+    Returns:
+        int: Number of primes written.
+
+    """
+    if sys.byteorder == "big":
+        chunk.byteswap()
+    table_file.write(chunk.tobytes())
+    return len(chunk)
+
+
+# =====================================================================================================================|
+# ===============================================TABLE ACCESS==========================================================|
+# =====================================================================================================================|
+
+class PrimeTable:
+    """
+    Read-only view of a prime table file.  The file is mapped with mmap, so every process
+    that opens the same table shares one copy in the page cache.
+
+    Attributes:
+        limit (int): Every prime below limit is in the table.
+        primes (memoryview): The primes, as uint32 values.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as table_file:
+            self._map = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.limit, count = TABLE_HEADER.unpack_from(self._map)
+        if magic != TABLE_MAGIC or version != TABLE_VERSION:
+            self._map.close()
+            raise ValueError(f"{path} is not a version {TABLE_VERSION} prime table")
+        body = memoryview(self._map)[TABLE_HEADER.size:TABLE_HEADER.size + 4 * count]
+        if sys.byteorder == "big":  # the file is little-endian, so big-endian hosts need a swapped copy
+            swapped = array("I", body.tobytes())
+            swapped.byteswap()
+            body.release()
+            body = memoryview(swapped)
+        else:
+            body = body.cast("I")
+        self.primes = body
+
+    def __len__(self):
+        return len(self.primes)
+
+    def __iter__(self):
+        return iter(self.primes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def count_below(self, bound):
+        """
+        Counts the primes in the table that are at most bound, with a binary search.
+        """
+        return bisect_right(self.primes, bound)
+
+    def close(self):
+        """
+        Unmaps the table.
+        """
+        self.primes.release()
+        self._map.close()
+
+
+def default_table_path(limit):
+    """
+    Location of the shared table for a limit.  The directory can be set with RSA_PRIME_TABLE_DIR.
+
+    Args:
+         limit (int): Exclusive upper bound of the table.
+
+    Returns:
+        string: Path of the table file.
+
+    """
+    directory = os.environ.get("RSA_PRIME_TABLE_DIR",
+                               os.path.join(os.path.expanduser("~"), ".cache", "rsa_cryptosystem"))
+    return os.path.join(directory, f"primes-{limit}.u32")
+
+
+def load_prime_table(limit, path=None):
+    """
+    Opens a table holding every prime below limit, building it on first use.
+    Tables are opened once per process and then reused.
+
+    Args:
+         limit (int): Every prime below limit is needed.  Rounded up to a power of two, and clamped
+            between MIN_TABLE_LIMIT and MAX_TABLE_LIMIT, so check the limit of the returned table.
+         path (string): Table file to use instead of the default location.
+
+    Returns:
+        PrimeTable: The opened table.
+
+    """
+    limit = min(max(MIN_TABLE_LIMIT, 1 << (limit - 1).bit_length()), MAX_TABLE_LIMIT)
+    path = path or default_table_path(limit)
+    table = _tables.get(path)
+    if table is not None and table.limit >= limit:
+        return table
+    if not os.path.exists(path):
+        build_prime_table(path, limit)
+    table = PrimeTable(path)
+    if table.limit < limit:  # an existing file that is too small gets rebuilt
+        table.close()
+        build_prime_table(path, limit)
+        table = PrimeTable(path)
+    _tables[path] = table
+    return table
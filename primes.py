@@ -0,0 +1,234 @@
+# Large prime and key pair generation for RSA encryption.
+
+import random
+from multiprocessing import get_context
+
+from modexp import modexp
+from RSA import find_key_pair
+
+
+# =====================================================================================================================|
+# ===============================================SIEVE FUNCTIONS=======================================================|
+# =====================================================================================================================|
+
+def sieve(limit):
+    """
+    Finds every prime below limit with the Sieve of Eratosthenes.
+
+    Args:
+         limit (int): Exclusive upper bound.
+
+    Returns:
+        list: Primes below limit, in increasing order.
+
+    """
+    if limit < 3:
+        return []
+    is_prime = bytearray(b"\x01") * limit
+    is_prime[0] = is_prime[1] = 0
+    for i in range(2, int(limit ** 0.5) + 1):
+        if is_prime[i]:
+            is_prime[i * i::i] = bytes(len(range(i * i, limit, i)))  # cross off multiples of i
+    return [i for i in range(limit) if is_prime[i]]
+
+
+# Primes tried by is_probable_prime before running Miller-Rabin.
+SMALL_PRIME_LIMIT = 1 << 13
+SMALL_PRIMES = sieve(SMALL_PRIME_LIMIT)
+
+# Primes crossed off the candidate windows in generate_prime.  Sieving a window is cheap,
+# so a larger table pays for itself by sending fewer candidates to Miller-Rabin.
+SIEVE_PRIME_LIMIT = 1 << 16
+SIEVE_PRIMES = sieve(SIEVE_PRIME_LIMIT)
+
+# Number of odd candidates sieved at once by generate_prime.
+SIEVE_WINDOW = 1 << 12
+
+_system_random = random.SystemRandom()
+
+
+# =====================================================================================================================|
+# ===============================================PRIMALITY TESTS=======================================================|
+# =====================================================================================================================|
+
+def miller_rabin_rounds(bits):
+    """
+    Picks a number of Miller-Rabin rounds for a random candidate of the given size,
+    following the error bounds for random candidates in FIPS 186-4, appendix C.3.
+
+    Args:
+         bits (int): Bit length of the candidate.
+
+    Returns:
+        int: Number of rounds.
+
+    """
+    if bits >= 1536:
+        return 3
+    if bits >= 1024:
+        return 4
+    if bits >= 512:
+        return 7
+    if bits >= 256:
+        return 16
+    return 40
+
+
+def miller_rabin(n, rounds, rng=_system_random):
+    """
+    Miller-Rabin probabilistic primality test for an odd n > 3.
+
+    Args:
+         n (int): Odd integer to test.
+         rounds (int): Number of random bases to try.
+         rng (random.Random): Source of random bases.
+
+    Returns:
+        bool: False if n is composite, True if n is probably prime.
+
+    """
+    d = n - 1
+    s = 0
+    while d % 2 == 0:  # write n - 1 as d * 2^s with d odd
+        d //= 2
+        s += 1
+    for _ in range(rounds):
+        a = rng.randrange(2, n - 1)
+        x = modexp(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(s - 1):
+            x = (x * x) % n
+            if x == n - 1:
+                break
+        else:
+            return False  # a is a witness that n is composite
+    return True
+
+
+def is_probable_prime(n, rounds=None, rng=_system_random):
+    """
+    Checks whether n is prime with trial division by SMALL_PRIMES followed by Miller-Rabin.
+
+    Args:
+         n (int): Integer to test.
+         rounds (int): Number of Miller-Rabin rounds.  Picked from the size of n when omitted.
+         rng (random.Random): Source of random bases.
+
+    Returns:
+        bool: True if n is (probably) prime.
+
+    """
+    if n < 2:
+        return False
+    for p in SMALL_PRIMES:
+        if n % p == 0:
+            return n == p
+    if n < SMALL_PRIME_LIMIT * SMALL_PRIME_LIMIT:  # no factor up to sqrt(n)
+        return True
+    if rounds is None:
+        rounds = miller_rabin_rounds(n.bit_length())
+    return miller_rabin(n, rounds, rng)
+
+
+# =====================================================================================================================|
+# ===============================================GENERATORS============================================================|
+# =====================================================================================================================|
+
+def _sieve_window(start):
+    """
+    Marks which of start, start + 2, ..., start + 2 * (SIEVE_WINDOW - 1) have no factor in SIEVE_PRIMES.
+
+    Args:
+         start (int): Odd first candidate, larger than every prime in SIEVE_PRIMES.
+
+    Returns:
+        bytearray: 1 at index i if start + 2i survived the sieve.
+
+    """
+    window = bytearray(b"\x01") * SIEVE_WINDOW
+    for p in SIEVE_PRIMES[1:]:  # candidates are odd, so skip 2
+        i = (-(start % p) * ((p + 1) // 2)) % p  # first i with p | start + 2i
+        window[i::p] = bytes(len(range(i, SIEVE_WINDOW, p)))
+    return window
+
+
+def generate_prime(bits, rounds=None, rng=_system_random, processes=None):
+    """
+    Generates a random prime with exactly bits bits.  Above the small prime table the top two
+    bits are set, so that the product of two such primes has exactly twice as many bits.
+
+    Candidates are taken from windows of consecutive odd numbers, sieved by SIEVE_PRIMES,
+    and only the survivors are tested with Miller-Rabin.
+
+    Args:
+         bits (int): Bit length of the prime, at least 2.
+         rounds (int): Number of Miller-Rabin rounds.  Picked from bits when omitted.
+         rng (random.Random): Source of randomness.  Pass a seeded random.Random for reproducible primes.
+         processes (int): Search in this many worker processes at once and keep the first prime found.
+
+    Returns:
+        int: A probable prime.
+
+    Raises:
+        ValueError: if bits is smaller than 2.
+
+    """
+    if bits < 2:
+        raise ValueError("A prime needs at least 2 bits")
+    if processes and processes > 1:
+        with get_context().Pool(processes) as pool:  # leaving the block terminates the other workers
+            return next(pool.imap_unordered(_generate_prime_worker, [(bits, rounds)] * processes))
+    if bits <= SIEVE_PRIME_LIMIT.bit_length() - 1:  # small enough to pick straight from the table
+        return rng.choice([p for p in SIEVE_PRIMES if p.bit_length() == bits])
+    if rounds is None:
+        rounds = miller_rabin_rounds(bits)
+    while True:
+        start = rng.getrandbits(bits) | (3 << (bits - 2)) | 1
+        for i, survived in enumerate(_sieve_window(start)):
+            candidate = start + 2 * i
+            if candidate.bit_length() != bits:
+                break
+            if survived and miller_rabin(candidate, rounds, rng):
+                return candidate
+
+
+def _generate_prime_worker(args):
+    """
+    Pool entry point for generate_prime.  Each worker draws from the operating system's randomness.
+    """
+    bits, rounds = args
+    return generate_prime(bits, rounds)
+
+
+def generate_key_pair(bits, crt=False, rounds=None, rng=_system_random, processes=None, exponent="random"):
+    """
+    Generates a Private/Public Key Pair whose public key token n has exactly bits bits.
+
+    Args:
+         bits (int): Bit length of n, at least 8.
+         crt (bool): Return a CRTPrivateKey instead of a plain integer d.
+         rounds (int): Number of Miller-Rabin rounds per prime.
+         rng (random.Random): Source of randomness for the primes.
+         processes (int): Number of worker processes used to find each prime.
+         exponent (string): Policy for choosing e, see RSA.find_public_key.  Primes that do not admit
+            an exponent under the policy are discarded.
+
+    Returns:
+        (int, int, int): Public key token n, public key token e, private key token d.
+
+    Raises:
+        ValueError: if bits is smaller than 8.
+
+    """
+    if bits < 8:
+        raise ValueError("Key pairs need at least 8 bits")
+    while True:
+        p = generate_prime(bits // 2, rounds, rng, processes)
+        q = p
+        while q == p or (p * q).bit_length() != bits:  # only small primes can miss the size
+            q = generate_prime(bits - bits // 2, rounds, rng, processes)
+        try:
+            return find_key_pair(p, q, crt, exponent)
+        except ValueError:  # e is not coprime to phi for these primes, draw new ones
+            continue
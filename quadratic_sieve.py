@@ -0,0 +1,415 @@
+# Self-initializing quadratic sieve (SIQS) for 60-100 bit moduli, with the sieve and the GF(2) algebra in NumPy.
+
+import math
+import random
+import time
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency, only factor_qs needs it
+    np = None
+
+from RSA import euclidian_algorithm, extended_euclid, fme
+from primes import is_probable_prime, sieve
+
+
+# (maximum decimal digits of n, factor base size, sieve half-width M), smallest first.
+QS_PARAMETERS = (
+    (14, 60, 8192),
+    (18, 100, 16384),
+    (22, 160, 32768),
+    (26, 260, 32768),
+    (30, 420, 65536),
+    (34, 650, 65536),
+    (40, 1000, 131072),
+)
+
+# Primes below this are not sieved (too many writes for too little information); the threshold allows for them.
+SMALL_PRIME_SKIP = 30
+
+# A relation may keep one leftover prime below LARGE_PRIME_MULTIPLIER * (largest factor base prime).
+LARGE_PRIME_MULTIPLIER = 64
+
+# Relations collected beyond the factor base size, to get several dependencies.
+EXTRA_RELATIONS = 16
+
+# Numbers up to this many bits are cheaper to split by trial division than to sieve.
+TRIAL_DIVISION_BITS = 40
+
+
+# =====================================================================================================================|
+# ===============================================NUMBER THEORY HELPERS=================================================|
+# =====================================================================================================================|
+
+def sqrt_mod_prime(a, p):
+    """
+    Finds a square root of a modulo an odd prime p with the Tonelli-Shanks algorithm.
+
+    Args:
+         a (int): A quadratic residue mod p.
+         p (int): Odd prime.
+
+    Returns:
+        int: t with t^2 = a mod p.
+
+    """
+    a %= p
+    if a == 0:
+        return 0
+    if p % 4 == 3:
+        return fme(a, (p + 1) // 4, p)
+    q, s = p - 1, 0
+    while q % 2 == 0:  # p - 1 = q * 2^s
+        q //= 2
+        s += 1
+    z = 2
+    while fme(z, (p - 1) // 2, p) != p - 1:  # any quadratic non-residue
+        z += 1
+    m, c, t, r = s, fme(z, q, p), fme(a, q, p), fme(a, (q + 1) // 2, p)
+    while t != 1:
+        i, t2 = 0, t
+        while t2 != 1:
+            t2 = t2 * t2 % p
+            i += 1
+        b = fme(c, 1 << (m - i - 1), p)
+        m, c, t, r = i, b * b % p, t * b * b % p, r * b % p
+    return r
+
+
+def qs_parameters(n):
+    """
+    Picks the factor base size and sieve half-width for n.
+
+    Args:
+         n (int): Number to factor.
+
+    Returns:
+        (int, int): Factor base size, sieve half-width M.
+
+    """
+    digits = len(str(n))
+    for max_digits, base_size, half_width in QS_PARAMETERS:
+        if digits <= max_digits:
+            return base_size, half_width
+    return QS_PARAMETERS[-1][1:]
+
+
+def factor_base(n, size):
+    """
+    Collects 2 and the first odd primes p for which n is a quadratic residue mod p.
+
+    Args:
+         n (int): Number to factor.
+         size (int): Number of primes wanted.
+
+    Returns:
+        (list, list): The primes, and a square root of n modulo each one (0 for p = 2).
+
+    """
+    base, roots = [2], [0]
+    limit = max(1000, size * 30)
+    while len(base) < size:
+        base, roots = [2], [0]
+        for p in sieve(limit)[1:]:
+            if fme(n, (p - 1) // 2, p) == 1:  # Euler's criterion
+                base.append(p)
+                roots.append(sqrt_mod_prime(n, p))
+                if len(base) == size:
+                    break
+        limit *= 2
+    return base, roots
+
+
+# =====================================================================================================================|
+# ===============================================LINEAR ALGEBRA OVER GF(2)=============================================|
+# =====================================================================================================================|
+
+def pack_rows(parities):
+    """
+    Packs a 0/1 matrix into rows of uint64 words.
+
+    Args:
+         parities (numpy.ndarray): Matrix of 0s and 1s, one row per relation.
+
+    Returns:
+        numpy.ndarray: uint64 array of shape (rows, ceil(columns / 64)).
+
+    """
+    rows, columns = parities.shape
+    words = (columns + 63) // 64
+    padded = np.zeros((rows, words * 64), dtype=np.uint8)
+    padded[:, :columns] = parities
+    packed = np.packbits(padded, axis=1, bitorder="little")  # 8 bytes per word, little-endian bit order
+    return packed.view("<u8").astype(np.uint64)
+
+
+def gf2_dependencies(parities):
+    """
+    Finds subsets of rows that sum to zero over GF(2).
+
+    The matrix is stored as packed 64-bit words with an identity block alongside that records
+    which original rows were combined.  Elimination works a block of 64 columns at a time:
+    every pivot in the block clears its column from all other rows with one vectorized XOR
+    of whole packed rows.
+
+    Args:
+         parities (numpy.ndarray): Matrix of 0s and 1s, one row per relation.
+
+    Returns:
+        list: Each dependency as an array of row indices.
+
+    """
+    rows, columns = parities.shape
+    left = pack_rows(parities)
+    history = pack_rows(np.eye(rows, dtype=np.uint8))
+    matrix = np.concatenate([left, history], axis=1)
+    left_words = left.shape[1]
+    used = np.zeros(rows, dtype=bool)
+    for block in range(left_words):
+        words = matrix[:, block]
+        for bit in range(64):
+            if block * 64 + bit >= columns:
+                break
+            mask = np.uint64(1 << bit)
+            candidates = np.nonzero(((words & mask) != 0) & ~used)[0]
+            if candidates.size == 0:
+                continue
+            pivot = candidates[0]
+            used[pivot] = True
+            targets = np.nonzero((words & mask) != 0)[0]
+            targets = targets[targets != pivot]
+            matrix[targets] ^= matrix[pivot]  # one XOR clears the column from every other row
+            words = matrix[:, block]
+    zero_rows = np.nonzero(~matrix[:, :left_words].any(axis=1))[0]
+    dependencies = []
+    for row in zero_rows:
+        bits = np.unpackbits(matrix[row, left_words:].astype("<u8").view(np.uint8), bitorder="little")
+        dependencies.append(np.nonzero(bits[:rows])[0])
+    return dependencies
+
+
+# =====================================================================================================================|
+# ===============================================SIEVING===============================================================|
+# =====================================================================================================================|
+
+class _Polynomial:
+    """
+    One SIQS polynomial family: A = q_1 * ... * q_s and the B_l values, with B = sum of +-B_l.
+    """
+
+    def __init__(self, base, roots, target, rng, used):
+        lo = next(i for i, p in enumerate(base) if p > SMALL_PRIME_SKIP)
+        hi = len(base)
+        middle = max(base[(lo + hi) // 2], 3)
+        s = max(1, round(math.log(target) / math.log(middle)))
+        while True:
+            if s == 1:  # nearest unused prime to the target, then random ones
+                nearest = sorted(range(lo, hi), key=lambda i: abs(base[i] - target))
+                chosen = [next((i for i in nearest if (i,) not in used), rng.randrange(lo, hi))]
+            else:
+                chosen = rng.sample(range(lo, hi), s - 1)
+                rest = target // math.prod(base[i] for i in chosen)
+                options = [i for i in range(lo, hi) if i not in chosen]
+                chosen.append(min(options, key=lambda i: abs(base[i] - rest)))
+            key = tuple(sorted(chosen))
+            exhausted = len(used) >= (hi - lo if s == 1 else 10 * len(base))  # allow repeats once A runs out
+            if key not in used or exhausted:
+                used.add(key)
+                break
+        self.indices = key
+        self.a_primes = [base[i] for i in key]
+        self.a = math.prod(self.a_primes)
+        self.b_parts = []
+        for i, q in zip(key, self.a_primes):
+            rest = self.a // q
+            gamma = roots[i] * extended_euclid(rest % q, q) % q
+            if gamma > q // 2:
+                gamma = q - gamma
+            self.b_parts.append(rest * gamma)
+        self.b = sum(self.b_parts)
+
+
+def _sieve_polynomials(n, base, roots, logs, half_width, rng, deadline):
+    """
+    Generates smooth and partial relations from a stream of SIQS polynomials.
+
+    Yields:
+        (int, numpy.ndarray, int): Y = A x + B, exponent vector of Y^2 - n (index 0 is the sign), and the
+        leftover large prime (1 for a fully smooth relation).
+
+    """
+    primes = np.array(base, dtype=np.int64)
+    sqrt_n = np.array(roots, dtype=np.int64)
+    logs = np.array(logs, dtype=np.uint16)
+    index_of = {p: i for i, p in enumerate(base)}
+    size = 2 * half_width
+    target = math.isqrt(2 * n) // half_width
+    threshold = int(math.log2(half_width) + math.log2(n) / 2 - 1.5 * math.log2(base[-1]))
+    large_bound = base[-1] * LARGE_PRIME_MULTIPLIER
+    sieve_array = np.zeros(size, dtype=np.uint16)
+    sieve_from = next(i for i, p in enumerate(base) if p > SMALL_PRIME_SKIP)
+    used = set()
+    while True:
+        if deadline is not None and time.monotonic() > deadline:
+            return
+        poly = _Polynomial(base, roots, target, rng, used)
+        a, b = poly.a, poly.b
+        in_a = np.zeros(len(base), dtype=bool)
+        in_a[list(poly.indices)] = True
+        in_a[0] = True  # 2 is divided out directly
+        ainv = np.array([extended_euclid(a % p, p) if not skip else 0 for p, skip in zip(base, in_a)], dtype=np.int64)
+        steps = [(2 * part % primes) * ainv % primes for part in poly.b_parts]  # 2 * B_l / A mod p
+        r1 = ainv * ((sqrt_n - b % primes) % primes) % primes
+        r2 = ainv * ((-sqrt_n - b % primes) % primes) % primes
+        signs = [1] * len(poly.b_parts)
+        for gray in range(1 << (len(poly.b_parts) - 1)):
+            if gray:  # flip one sign of B (Gray code), which shifts every root by +-2 B_l / A
+                flip = (gray & -gray).bit_length()
+                shift = steps[flip] if signs[flip] == 1 else (primes - steps[flip]) % primes
+                r1 = (r1 + shift) % primes
+                r2 = (r2 + shift) % primes
+                b -= 2 * signs[flip] * poly.b_parts[flip]
+                signs[flip] = -signs[flip]
+            c = (b * b - n) // a
+            sieve_array.fill(0)
+            start1 = (r1 + half_width) % primes
+            start2 = (r2 + half_width) % primes
+            for j in range(sieve_from, len(base)):
+                if in_a[j]:
+                    continue
+                p = int(primes[j])
+                sieve_array[int(start1[j])::p] += logs[j]
+                if start2[j] != start1[j]:
+                    sieve_array[int(start2[j])::p] += logs[j]
+            for position in np.nonzero(sieve_array >= threshold)[0]:
+                x = int(position) - half_width
+                relation = _trial_divide(a * x * x + 2 * b * x + c, x, poly, primes, r1, r2, in_a, index_of,
+                                         large_bound)
+                if relation is not None:
+                    exponents, large_prime = relation
+                    yield a * x + b, exponents, large_prime
+
+
+def _trial_divide(value, x, poly, primes, r1, r2, in_a, index_of, large_bound):
+    """
+    Factors g(x) = A x^2 + 2 B x + C over the factor base, adding the primes of A, so the result
+    is the factorization of (A x + B)^2 - n.
+
+    Returns:
+        (numpy.ndarray, int): Exponent vector and leftover large prime, or None if g(x) is not smooth enough.
+
+    """
+    exponents = np.zeros(len(primes) + 1, dtype=np.int32)
+    if value < 0:
+        exponents[0] = 1
+        value = -value
+    if value == 0:
+        return None
+    for q in poly.a_primes:  # (A x + B)^2 - n = A * g(x)
+        exponents[index_of[q] + 1] += 1
+    hits = np.nonzero(((x % primes == r1) | (x % primes == r2)) & ~in_a)[0]
+    candidates = [0] + list(poly.indices) + hits.tolist()
+    for j in candidates:
+        p = int(primes[j])
+        while value % p == 0:
+            value //= p
+            exponents[j + 1] += 1
+    if value == 1:
+        return exponents, 1
+    if value < large_bound:  # below p_max^2, so the cofactor is prime
+        return exponents, value
+    return None
+
+
+# =====================================================================================================================|
+# ===============================================DRIVER================================================================|
+# =====================================================================================================================|
+
+def factor_qs(n, timeout=None, seed=None):
+    """
+    Factors n with a self-initializing quadratic sieve.
+
+    Polynomials (A x + B)^2 - n share one A = q_1 * ... * q_s for 2^(s-1) choices of B, so the
+    sieve roots move by a precomputed shift per polynomial instead of being recomputed.
+    Each polynomial is sieved over [-M, M) by adding rounded log2(p) into a NumPy array.
+    Positions above the threshold are trial divided. Partial relations with one large prime are
+    paired up, and the exponent parities are solved over GF(2) with gf2_dependencies.
+
+    Args:
+         n (int): Odd composite number, ideally 60-100 bits.
+         timeout (float): Give up after this many seconds.
+         seed (int): Seed for the choice of polynomials.
+
+    Returns:
+        (int, int): The factors of n, or None if n is prime or the time ran out.
+
+    Raises:
+        ImportError: if NumPy is not installed.
+
+    """
+    if np is None:
+        raise ImportError("factor_qs needs NumPy")
+    if n % 2 == 0:
+        return 2, n // 2
+    if is_probable_prime(n):
+        return None
+    root = math.isqrt(n)
+    if root * root == n:
+        return root, root
+    if n.bit_length() <= TRIAL_DIVISION_BITS:
+        return next(((p, n // p) for p in sieve(root + 1) if n % p == 0), None)
+    base_size, half_width = qs_parameters(n)
+    base, roots = factor_base(n, base_size)
+    for p in sieve(base[-1] + 1):  # primes the factor base skipped could still divide n
+        if n % p == 0:
+            return p, n // p
+    logs = [round(math.log2(p)) for p in base]
+    deadline = None if timeout is None else time.monotonic() + timeout
+    rng = random.Random(seed)
+    relations = []  # (Y, exponents, square root of the large prime part)
+    partials = {}  # large prime -> (Y, exponents)
+    wanted = len(base) + 1 + EXTRA_RELATIONS
+    for y, exponents, large_prime in _sieve_polynomials(n, base, roots, logs, half_width, rng, deadline):
+        if large_prime == 1:
+            relations.append((y, exponents, 1))
+        elif large_prime in partials:  # two partials with the same large prime make a full relation
+            y2, exponents2 = partials.pop(large_prime)
+            if euclidian_algorithm(large_prime, n) != 1:
+                return large_prime, n // large_prime
+            relations.append((y * y2 % n, exponents + exponents2, large_prime))
+        else:
+            partials[large_prime] = (y, exponents)
+        if len(relations) < wanted:
+            continue
+        factors = _combine(n, base, relations)
+        if factors is not None:
+            return factors
+        wanted += EXTRA_RELATIONS
+    return None
+
+
+def _combine(n, base, relations):
+    """
+    Turns GF(2) dependencies between relations into congruences of squares X^2 = Y^2 mod n.
+
+    Returns:
+        (int, int): The factors of n, or None if every dependency was trivial.
+
+    """
+    matrix = np.array([exponents % 2 for _, exponents, _ in relations], dtype=np.uint8)
+    for dependency in gf2_dependencies(matrix):
+        x = 1
+        y = 1
+        total = np.zeros(len(base) + 1, dtype=np.int64)
+        for row in dependency:
+            relation_y, exponents, extra = relations[row]
+            x = x * relation_y % n
+            y = y * extra % n
+            total += exponents
+        for p, exponent in zip(base, total[1:] // 2):
+            if exponent:
+                y = y * fme(p, int(exponent), n) % n
+        g = euclidian_algorithm((x - y) % n, n)
+        if 1 < g < n:
+            return g, n // g
+    return None
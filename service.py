@@ -0,0 +1,348 @@
+# Local asyncio service exposing keygen, encrypt and decrypt over a socket.
+# Protocol: one JSON object per line in each direction.  Requests carry an "id" that is echoed back,
+# so a client may pipeline requests on one connection and receive the answers out of order.
+#
+#   {"id": 1, "op": "keygen", "bits": 2048, "exponent": "65537"}
+#   {"id": 2, "op": "encrypt", "key": {"n": ..., "e": ...}, "message": "...", "scheme": "ascii"}
+#   {"id": 3, "op": "decrypt", "key": {"n": ..., "e": ..., "p": ..., "q": ...}, "cipher_text": [...]}
+#   {"id": 4, "op": "stats"}
+#
+# Usage: python service.py [--host 127.0.0.1] [--port 8765] [--unix PATH] [--processes N]
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import RSA
+from cli import message_blocks, message_text
+from cipher_container import SCHEMES
+from modexp import backend_for
+from parallel import chunk_size
+from primes import generate_key_pair
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Maximum number of private key contexts kept in memory.
+KEY_CACHE_SIZE = 64
+
+# How long requests for one key are collected before the batch goes to the pool, in seconds.
+BATCH_WINDOW = 0.001
+
+# A batch holding this many blocks is sent right away instead of waiting for the window to close.
+MAX_BATCH_BLOCKS = 1 << 14
+
+# Longest request line accepted, in bytes.
+MAX_REQUEST_SIZE = 1 << 26
+
+
+def _power_blocks(n, exponent, blocks):
+    """
+    Raises every block to e, d or a CRTPrivateKey.  Runs in a pool process.
+    """
+    if isinstance(exponent, int):
+        power = backend_for(exponent, n)
+        return [power(block, exponent, n) for block in blocks]
+    return [RSA.crt_fme(block, exponent) for block in blocks]
+
+
+class KeyContextCache:
+    """
+    LRU cache of private key contexts: the CRTPrivateKey derived from p, q and e (or the plain d),
+    so hot keys skip the modular inverses on every request.
+
+    Arguments:
+        max_keys (int): Number of contexts kept before the least recently used one is evicted.
+    """
+
+    def __init__(self, max_keys=KEY_CACHE_SIZE):
+        self.max_keys = max_keys
+        self._contexts = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._contexts)
+
+    def get(self, key):
+        """
+        Returns the decryption context for a private key.
+
+        Args:
+             key (dict): Key tokens "n" and "e", plus "p" and "q" or "d".
+
+        Returns:
+            int or CRTPrivateKey: The private token to decrypt with.
+
+        Raises:
+            ValueError: if the key has neither p and q nor d.
+
+        """
+        tokens = (key["n"], key["e"], key.get("d"), key.get("p"), key.get("q"))
+        context = self._contexts.get(tokens)
+        if context is not None:
+            self.hits += 1
+            self._contexts.move_to_end(tokens)
+            return context
+        self.misses += 1
+        if key.get("p") and key.get("q"):
+            context = RSA.find_crt_private_key(key["p"], key["q"], key["e"])
+        elif key.get("d"):
+            context = key["d"]
+        else:
+            raise ValueError("Decrypting needs a private key (d, or p and q)")
+        self._contexts[tokens] = context
+        if len(self._contexts) > self.max_keys:  # evict the least recently used key
+            self._contexts.popitem(last=False)
+            self.evictions += 1
+        return context
+
+
+class CipherService:
+    """
+    Serves keygen, encrypt and decrypt requests.  Requests for the same key that arrive within
+    batch_window are coalesced into one batch, and all modexp work runs in a process pool so
+    the event loop only parses, formats and routes.
+
+    Arguments:
+        processes (int): Pool size.  Defaults to the number of CPUs.
+        cache_size (int): Private key contexts kept, see KeyContextCache.
+        batch_window (float): Seconds to collect requests for one key before dispatching them.
+    """
+
+    def __init__(self, processes=None, cache_size=KEY_CACHE_SIZE, batch_window=BATCH_WINDOW):
+        self.processes = processes or os.cpu_count() or 1
+        self.batch_window = batch_window
+        self.contexts = KeyContextCache(cache_size)
+        self._pool = ProcessPoolExecutor(self.processes)
+        self._pending = {}  # (n, exponent) -> [timer handle, [(blocks, future), ...], block count]
+        self._tasks = set()  # batches still being distributed, kept referenced until done
+        self.requests = self.batches = self.batched_requests = 0
+
+    def close(self):
+        """
+        Shuts the process pool down.
+        """
+        self._pool.shutdown()
+
+    # ----- batching -----
+
+    async def power(self, n, exponent, blocks):
+        """
+        Raises blocks to exponent, sharing a pool job with other requests for the same key.
+
+        Returns:
+            list: The processed blocks, in order.
+
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch_key = (n, exponent)
+        batch = self._pending.get(batch_key)
+        if batch is None:
+            handle = loop.call_later(self.batch_window, self._flush, batch_key)
+            batch = self._pending[batch_key] = [handle, [], 0]
+        batch[1].append((blocks, future))
+        batch[2] += len(blocks)
+        if batch[2] >= MAX_BATCH_BLOCKS:
+            batch[0].cancel()
+            self._flush(batch_key)
+        return await future
+
+    def _flush(self, batch_key):
+        """
+        Sends one coalesced batch to the pool, split into chunks the pool processes can share.
+        """
+        _, requests, count = self._pending.pop(batch_key)
+        n, exponent = batch_key
+        blocks = [block for request_blocks, _ in requests for block in request_blocks]
+        exponent_bits = exponent.bit_length() if isinstance(exponent, int) else exponent.dp.bit_length() // 2
+        size = chunk_size(count, self.processes, n.bit_length(), exponent_bits)
+        loop = asyncio.get_running_loop()
+        jobs = [loop.run_in_executor(self._pool, _power_blocks, n, exponent, blocks[i:i + size])
+                for i in range(0, count, size)]
+        self.batches += 1
+        self.batched_requests += len(requests)
+        task = asyncio.ensure_future(self._distribute(jobs, requests))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    @staticmethod
+    async def _distribute(jobs, requests):
+        """
+        Waits for a batch and hands every request its slice of the result.
+        """
+        try:
+            results = [block for chunk in await asyncio.gather(*jobs) for block in chunk]
+        except Exception as error:  # pool failures go to every waiting request
+            for _, future in requests:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        start = 0
+        for request_blocks, future in requests:
+            if not future.done():  # the client may have gone away
+                future.set_result(results[start:start + len(request_blocks)])
+            start += len(request_blocks)
+
+    # ----- operations -----
+
+    async def keygen(self, request):
+        loop = asyncio.get_running_loop()
+        n, e, key = await loop.run_in_executor(self._pool, _generate_key, int(request.get("bits", 2048)),
+                                               request.get("exponent", "65537"))
+        return {"n": n, "e": e, "d": key.d, "p": key.p, "q": key.q}
+
+    async def encrypt(self, request):
+        n, e = int(request["key"]["n"]), int(request["key"]["e"])
+        scheme = _scheme(request)
+        return await self.power(n, e, message_blocks(request["message"], n, scheme))
+
+    async def decrypt(self, request):
+        key = {name: int(value) for name, value in request["key"].items()}
+        scheme = _scheme(request)
+        cipher_text = [int(block) for block in request["cipher_text"]]
+        if not all(0 <= block < key["n"] for block in cipher_text):
+            raise ValueError("Cipher text blocks must be in [0, n)")
+        blocks = await self.power(key["n"], self.contexts.get(key), cipher_text)
+        text = message_text(blocks, key["n"], scheme)
+        return text.decode("latin-1") if isinstance(text, bytes) else text
+
+    async def stats(self, request):
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "mean_batch_size": self.batched_requests / self.batches if self.batches else 0.0,
+            "key_cache": {"size": len(self.contexts), "hits": self.contexts.hits, "misses": self.contexts.misses,
+                          "evictions": self.contexts.evictions},
+            "processes": self.processes,
+        }
+
+    async def handle(self, request):
+        """
+        Runs one request.
+
+        Returns:
+            dict: {"id", "ok": true, "result"} or {"id", "ok": false, "error"}.  Every request gets
+                exactly one of the two, whatever the operation (or a pool worker) raised.
+
+        """
+        self.requests += 1
+        try:
+            if request.get("op") not in OPERATIONS:
+                raise ValueError(f"Unknown op: {request.get('op')}")
+            result = await getattr(self, request["op"])(request)
+            return {"id": request.get("id"), "ok": True, "result": result}
+        except Exception as error:
+            if not isinstance(error, (ValueError, KeyError, TypeError)):
+                logger.warning("Request %r failed: %r", request.get("id"), error)
+            return {"id": request.get("id"), "ok": False, "error": f"{type(error).__name__}: {error}"}
+
+    # ----- connections -----
+
+    async def serve_connection(self, reader, writer):
+        """
+        Reads requests from one connection and writes each response as soon as it is ready.
+        """
+        tasks = set()
+
+        async def respond(request):
+            response = await self.handle(request)
+            writer.write(json.dumps(response).encode("ascii") + b"\n")
+            await writer.drain()
+
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    writer.write(b'{"id": null, "ok": false, "error": "Invalid JSON"}\n')
+                    continue
+                task = asyncio.ensure_future(respond(request))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError) as error:
+            logger.debug("Connection closed: %s", error)
+        finally:
+            writer.close()
+
+
+OPERATIONS = ("keygen", "encrypt", "decrypt", "stats")
+
+
+def _generate_key(bits, exponent):
+    """
+    Generates a key pair in a pool process.
+    """
+    return generate_key_pair(bits, crt=True, exponent=exponent)
+
+
+def _scheme(request):
+    scheme = request.get("scheme", "ascii")
+    if scheme not in SCHEMES:
+        raise ValueError(f"Unknown scheme: {scheme}")
+    return scheme
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None, **options):
+    """
+    Runs the service until cancelled.
+
+    Args:
+         host (string): Address to listen on.
+         port (int): TCP port.
+         unix_path (string): Listen on this Unix socket instead of TCP.
+         options: Passed to CipherService.
+
+    """
+    service = CipherService(**options)
+    try:
+        if unix_path:
+            server = await asyncio.start_unix_server(service.serve_connection, unix_path, limit=MAX_REQUEST_SIZE)
+        else:
+            server = await asyncio.start_server(service.serve_connection, host, port, limit=MAX_REQUEST_SIZE)
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):  # stop cleanly so the pool workers exit too
+            try:
+                loop.add_signal_handler(signal_number, server.close)
+            except (NotImplementedError, RuntimeError):  # not available on this platform
+                pass
+        logger.info("Listening on %s", unix_path or f"{host}:{port}")
+        async with server:
+            try:
+                await server.serve_forever()
+            except asyncio.CancelledError:  # server.close() ends serve_forever this way
+                logger.info("Shutting down")
+    finally:
+        service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="RSA CryptoSystem socket service.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", help="listen on a Unix socket at this path instead of TCP")
+    parser.add_argument("--processes", type=int, help="modexp worker processes (default: number of CPUs)")
+    parser.add_argument("--cache-size", type=int, default=KEY_CACHE_SIZE, help="private key contexts to cache")
+    parser.add_argument("--batch-window", type=float, default=BATCH_WINDOW,
+                        help="seconds to collect requests for one key into a batch")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, processes=args.processes, cache_size=args.cache_size,
+                          batch_window=args.batch_window))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+# RSA signatures: full-domain hash signing with the private exponent (split with the CRT when p and q are known),
+# and batch verification of many signatures under one public key by randomized small-exponent screening.
+#
+# A signature s and n - s are equally easy to compute from each other, so only the smaller of the two is a
+# valid signature, and it verifies when s^e = +-H(message) mod n.  Without this rule a batch could not tell a
+# signature from its negation: two negated signatures cancel out in a batch with probability 1/2.
+
+import secrets
+from hashlib import shake_256
+
+from RSA import crt_fme, fme
+from cipher_container import modulus_bytes
+
+
+# Bits of the random exponent each signature is raised to in a batch.  A batch holding a bad signature
+# passes with probability about 2^-BATCH_EXPONENT_BITS.
+BATCH_EXPONENT_BITS = 64
+
+# Batches (and bisection halves) this small are checked one signature at a time.
+MIN_BATCH = 2
+
+
+def hash_message(n, message):
+    """
+    Full-domain hash of a message: SHAKE-256 stretched 8 bytes past the width of n, reduced mod n.
+
+    Args:
+         n (int): Public key token n.
+         message (string or bytes): The message; strings are hashed as UTF-8.
+
+    Returns:
+        int: The hash, in [0, n).
+
+    """
+    if isinstance(message, str):
+        message = message.encode("utf-8")
+    return int.from_bytes(shake_256(message).digest(modulus_bytes(n) + 8), "big") % n
+
+
+def sign(private_key, message):
+    """
+    Signs a message.
+
+    Args:
+         private_key (PrivateKey, CRTPrivateKey or (int, int)): The signing key.  Keys holding p and q
+            sign with two half-size exponentiations; a plain (n, d) pair uses fme.
+         message (string or bytes): The message.
+
+    Returns:
+        int: The signature, at most n // 2.
+
+    """
+    if hasattr(private_key, "p"):
+        n = private_key.n
+        signature = crt_fme(hash_message(n, message), private_key)
+    else:
+        n, d = private_key
+        signature = fme(hash_message(n, message), d, n)
+    return min(signature, n - signature)
+
+
+def _matches(n, e, digest, signature):
+    return fme(signature, e, n) in (digest, n - digest)
+
+
+def verify(public_key, message, signature):
+    """
+    Checks one signature.
+
+    Args:
+         public_key (PublicKey or (int, int)): Public key tokens n and e.
+         message (string or bytes): The message.
+         signature (int): The signature to check.
+
+    Returns:
+        bool: Whether signature is the signature of message.
+
+    """
+    n, e = public_key
+    if not 0 < signature <= n // 2:
+        return False
+    return _matches(n, e, hash_message(n, message), signature)
+
+
+def multi_power(bases, exponents, n):
+    """
+    Computes prod b_i^x_i mod n with Pippenger's bucket method: per window of exponent bits every base is
+    multiplied into the bucket of its digit once, and the squarings are shared by the whole product, so a
+    base costs about bits / width multiplications instead of a full exponentiation.
+
+    Args:
+         bases (list): Base 10 integers.
+         exponents (list): Non-negative exponents, one per base.
+         n (int): Quotient for modulo operation.
+
+    Returns:
+        int: resulting modulus from the product of b_i^x_i mod n.
+
+    """
+    bits = max(exponents, default=0).bit_length()
+    width = max(1, min(8, len(bases).bit_length() - 3))
+    mask = (1 << width) - 1
+    result = 1
+    for shift in reversed(range(0, bits, width)):
+        for _ in range(width):
+            result = result * result % n
+        buckets = [1] * (mask + 1)
+        for base, exponent in zip(bases, exponents):
+            digit = exponent >> shift & mask
+            if digit:
+                buckets[digit] = buckets[digit] * base % n
+        running = window = 1
+        for digit in range(mask, 0, -1):  # window = prod bucket[digit]^digit, by running products
+            running = running * buckets[digit] % n
+            window = window * running % n
+        result = result * window % n
+    return result
+
+
+def _screen(n, e, digests, signatures, indices):
+    """
+    Small-exponent screening: with fresh random r_i, checks (prod s_i^r_i)^e = +-prod H_i^r_i mod n,
+    so the whole batch costs one exponentiation by e plus two multi-exponentiations with short exponents.
+    """
+    exponents = [secrets.randbits(BATCH_EXPONENT_BITS) | 1 << (BATCH_EXPONENT_BITS - 1) for _ in indices]
+    signature_product = multi_power([signatures[i] for i in indices], exponents, n)
+    digest_product = multi_power([digests[i] for i in indices], exponents, n)
+    return fme(signature_product, e, n) in (digest_product, n - digest_product)
+
+
+def _bisect(n, e, digests, signatures, indices, results, failed=False):
+    """
+    Screens indices and splits a failing batch in half until the bad signatures are isolated.
+    When the first half passes, the second one is known to fail and is split without screening it.
+
+    Returns:
+        bool: Whether every signature in indices is valid.
+
+    """
+    if len(indices) <= MIN_BATCH:
+        for i in indices:
+            results[i] = _matches(n, e, digests[i], signatures[i])
+        return all(results[i] for i in indices)
+    if not failed and _screen(n, e, digests, signatures, indices):
+        return True
+    middle = len(indices) // 2
+    first_valid = _bisect(n, e, digests, signatures, indices[:middle], results)
+    _bisect(n, e, digests, signatures, indices[middle:], results, failed=first_valid)
+    return False
+
+
+def verify_batch(public_key, messages, signatures):
+    """
+    Checks many signatures under one public key.  When e is longer than BATCH_EXPONENT_BITS, the batch
+    is screened at once and bisected only if it fails; for short exponents (e.g. e = 65537) a check per
+    signature is already cheaper than screening and is used instead.
+
+    Args:
+         public_key (PublicKey or (int, int)): Public key tokens n and e.
+         messages (list): Messages, strings or bytes.
+         signatures (list): Signatures, one per message.
+
+    Returns:
+        list: One bool per message, True where the signature is valid.
+
+    Raises:
+        ValueError: if the lists differ in length.
+
+    """
+    n, e = public_key
+    if len(messages) != len(signatures):
+        raise ValueError(f"{len(messages)} messages but {len(signatures)} signatures")
+    results = [0 < signature <= n // 2 for signature in signatures]
+    indices = [i for i, in_range in enumerate(results) if in_range]
+    digests = [hash_message(n, message) if in_range else 0 for message, in_range in zip(messages, results)]
+    if e.bit_length() <= BATCH_EXPONENT_BITS:
+        for i in indices:
+            results[i] = _matches(n, e, digests[i], signatures[i])
+    else:
+        _bisect(n, e, digests, signatures, indices, results)
+    return results
@@ -0,0 +1,112 @@
+# File helpers for the streaming encode/decode functions in RSA.py and RSA_block.py.
+
+from itertools import islice
+
+
+# Number of characters (or cipher text blocks) handled per step when streaming.
+STREAM_CHUNK_SIZE = 1 << 16
+
+
+def is_binary(file_obj):
+    """
+    Checks whether a file-like object reads or writes bytes rather than text.
+
+    Args:
+         file_obj (file): Any binary or text file-like object.
+
+    Returns:
+        bool: True for binary files.
+
+    """
+    if "b" in getattr(file_obj, "mode", ""):
+        return True
+    return not hasattr(file_obj, "encoding")  # text wrappers always carry an encoding
+
+
+def read_text(source, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Reads a file-like object in chunks of characters.
+    Binary input is decoded as latin-1 so that every byte becomes exactly one character.
+
+    Args:
+         source (file): Binary or text file-like object opened for reading.
+         chunk_size (int): Number of characters to read at a time.
+
+    Yields:
+        string: The next chunk of the file.
+
+    """
+    binary = is_binary(source)
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk.decode("latin-1") if binary else chunk
+
+
+def write_text(chunks, sink):
+    """
+    Writes decoded text chunks to a file-like object.
+    Binary sinks get latin-1 bytes, mirroring read_text.
+
+    Args:
+         chunks (iterable): Strings to write.
+         sink (file): Binary or text file-like object opened for writing.
+
+    """
+    binary = is_binary(sink)
+    for chunk in chunks:
+        sink.write(chunk.encode("latin-1") if binary else chunk)
+
+
+def read_blocks(source):
+    """
+    Reads cipher text blocks written by write_blocks, one integer per line.
+
+    Args:
+         source (iterable): A binary or text file-like object, or any iterable of ints or lines.
+
+    Yields:
+        int: The next cipher text block.
+
+    """
+    for line in source:
+        if isinstance(line, int):
+            yield line
+        elif line.strip():  # skip blank lines
+            yield int(line)
+
+
+def write_blocks(blocks, sink):
+    """
+    Writes cipher text blocks to a file-like object, one integer per line.
+
+    Args:
+         blocks (iterable): Cipher text blocks (ints).
+         sink (file): Binary or text file-like object opened for writing.
+
+    """
+    binary = is_binary(sink)
+    for block in blocks:
+        line = f"{block}\n"
+        sink.write(line.encode("ascii") if binary else line)
+
+
+def batched(iterable, size):
+    """
+    Groups an iterable into lists of at most size elements.
+
+    Args:
+         iterable (iterable): Elements to group.
+         size (int): Maximum group size.
+
+    Yields:
+        list: The next group.
+
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch